@@ -1,7 +1,39 @@
+import asyncio
+import hmac
+import os
+import shlex
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+
 from shiny import App, reactive, render, ui, req
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+
+from background_loading import BackgroundLoader
+from breakeven import optimal_deductible_intervals, optimal_level_at
+from cost_model import (
+    DEDUCTIBLE_ADULT_LVL_TO_AMOUNT,
+    DEDUCTIBLE_CHILD_LVL_TO_AMOUNT,
+    annual_costs_health_insurance,
+    deductible_amount_for_person,
+    deductible_amounts_for_persons,
+)
+from data_loading import Datasets, load_datasets
+from household import HouseholdMember, HouseholdOptimizer, age_class_for_birth_year
+from instrumentation import PROFILE_DIR, prometheus_text, stage_timer, start_session_profile, timed
+from municipality_search import MunicipalitySearchIndex, load_municipality_choices, update_municipality_selectize
+from offers import OfferFinder
+from precompute import AGE_CLASS_DEDUCTIBLES, PrecomputedResults, load_precomputed, optimal_deductibles_for_profile
+from premium_history import PLAN_KEYS, PremiumHistory, load_premium_history
+from premium_index import DEDUCTIBLE_LEVEL_KEYS, PremiumIndex
+from result_cache import LRUCache
+from shared_datasets import load_shared_datasets
+from simulation import DEFAULT_SAMPLES, ZeroInflatedLognormal, simulate_out_of_pocket
 
 # Mapping the codes from the dataset to their actual names.
 # I only found a pdf file with this information, so I manually created this dictionary.
@@ -47,59 +79,96 @@ BAG_VERSICHERER = {
     1318: "Wädenswil",
 }
 
-MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE = 700
-DECIMAL_AFTER_DEDUCTIBLE = 0.10 # We need to pay 10% of costs after deductible
-
-DEDUCTIBLE_CHILD_LVL_TO_AMOUNT = {"FRAST1": 0, "FRAST2": 100, "FRAST3": 200, "FRAST4": 300, "FRAST5": 400, "FRAST6": 500, "FRAST7": 600}
-DEDUCTIBLE_ADULT_LVL_TO_AMOUNT = {"FRAST1": 300, "FRAST2": 500, "FRAST3": 1000, "FRAST4": 1500, "FRAST5": 2000, "FRAST6": 2500}
-
-def calculate_annual_cost_health_insurance(treatment_costs_during_year, premium_per_month, deductible_amount):
-        amount_after_deductible = max(0, treatment_costs_during_year - deductible_amount)
-        costs_to_cover_after_deductible = min(amount_after_deductible * DECIMAL_AFTER_DEDUCTIBLE, MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE)
-        total_treatment_costs_to_cover = min(treatment_costs_during_year, deductible_amount) + costs_to_cover_after_deductible
-        total_cost = total_treatment_costs_to_cover + 12 * premium_per_month
-        return total_cost
-    
-
-def calculate_annual_cost_insurance(treatment_costs_during_year, premium_per_month, deductible_amount, percentage_covered, max_amount_insurance_pays):
-    # Generally, you will need to pay the following amount (per year) by yourself:
-    # 1. premium
-    # 2. the difference between the treatment costs and the amount that the insurance pays,
-    #    where the amount that the insurance pays is MIN(percentage_covered * amount_after_deductible, max_amount_insurance_pays)
-    premium_per_year = 12 * premium_per_month
-    amount_after_deductible = max(treatment_costs_during_year - deductible_amount, 0)
-    insurance_pays = min(percentage_covered * amount_after_deductible, max_amount_insurance_pays)
-    total_costs_you_pay = premium_per_year + (treatment_costs_during_year - insurance_pays)
-    return total_costs_you_pay
-
-
-# Load data once when app starts (outside server function)
-try:
-    premiums_df = pd.read_csv("https://opendata.bagnet.ch/?r=/download&path=L1ByYWVtaWVuL1Byw6RtaWVuX0NILmNzdg%3D%3D")
-    premiums_df['Versicherung'] = premiums_df['Versicherer'].map(BAG_VERSICHERER)
-
-
-    premium_regions_df = pd.read_excel("https://www.priminfo.admin.ch/downloads/praemienregionen.xlsx", sheet_name='A_COM', skiprows=4,engine="openpyxl")
-
-    insurance_model_restrictions_df = pd.read_csv("https://opendata.bagnet.ch/?r=/download&path=L1ByYWVtaWVuL0Vpbnp1Z3NnZWJpZXRlLmNzdg%3D%3D", sep=";")
-
-    # We only need the rows where there is a restriction
-    insurance_model_restrictions_df = insurance_model_restrictions_df[insurance_model_restrictions_df["Eingeschränkt"] == "Y"]
-    # Convert the "Gemeinden-BFS" column from comma-separated strings to lists of integers
-    insurance_model_restrictions_df["Gemeinden-BFS"] = insurance_model_restrictions_df["Gemeinden-BFS"].apply(lambda x: [int(i) for i in x.split(",")] if pd.notna(x) else x)
-    # The original excel file has column names on two lines: First Line = German name, Second Line = French translation
-    premium_regions_df.columns = [col.splitlines()[0] for col in premium_regions_df.columns]
-    print("Loaded data successfully.")
-
-except Exception as e:
-    print(f"Error loading data: {e}")
-
-
-# Calculate count of each PLZ and append as a new column
-premium_regions_df['plz_count'] = premium_regions_df.groupby('PLZ')['PLZ'].transform('count')
-
-municipality_choices = {'': ''} | {f"{row['BFS-Nr.']}|{row['Kanton']}|{row['Region']}|{row['PLZ']}|{row['Ort']}|{row['Gemeinde']}": f"{row['PLZ']} {row['Ort']}" + (f" (Gemeinde {row['Gemeinde']})" if row['plz_count'] > 1 else "")
-                for _, row in premium_regions_df.iterrows()}
+class AppData(NamedTuple):
+    datasets: Datasets
+    premiums_df: pd.DataFrame
+    # Indexes for the lookups on the request path, so they don't need to scan the whole premiums table.
+    offer_finder: OfferFinder
+    deductible_levels_index: PremiumIndex
+    household_optimizer: HouseholdOptimizer
+    # Results of `python precompute.py` for this snapshot (None if it was not run).
+    precomputed_results: PrecomputedResults | None
+    # Premiums of the earlier years, see premium_history.py (None if no year was ingested).
+    premium_history: PremiumHistory | None
+    # Choices of the location input (built once per snapshot) and the search index answering the typeahead requests.
+    municipality_search_index: MunicipalitySearchIndex
+    municipality_choices: dict
+
+
+def load_app_data():
+    # The data comes from a local snapshot, see data_loading.py for how it is downloaded and refreshed.
+    # With HEALTH_INSURANCE_SHARED_DATA=1, all worker processes share one memory-mapped copy of it (see shared_datasets.py).
+    # The duration of every step is recorded as a stage of the metrics (see instrumentation.py).
+    with stage_timer("load_datasets"):
+        if os.environ.get("HEALTH_INSURANCE_SHARED_DATA") == "1":
+            datasets = load_shared_datasets(refresh=os.environ.get("HEALTH_INSURANCE_REFRESH_DATA") == "1")
+        else:
+            datasets = load_datasets(refresh=os.environ.get("HEALTH_INSURANCE_REFRESH_DATA") == "1")
+
+    premiums_df = datasets.premiums
+    premiums_df['Versicherung'] = premiums_df['Versicherer'].map(BAG_VERSICHERER).astype('category')
+    with stage_timer("load_municipality_choices"):
+        municipality_search_index = MunicipalitySearchIndex(load_municipality_choices(datasets.version, datasets.premium_regions))
+    with stage_timer("build_indexes"):
+        offer_finder = OfferFinder(premiums_df, datasets.insurance_model_restrictions)
+        deductible_levels_index = PremiumIndex(premiums_df, DEDUCTIBLE_LEVEL_KEYS)
+        household_optimizer = HouseholdOptimizer(offer_finder)
+    with stage_timer("load_precomputed"):
+        precomputed_results = load_precomputed(datasets.version)
+    with stage_timer("load_premium_history"):
+        premium_history = load_premium_history()
+    app_data = AppData(
+        datasets=datasets,
+        premiums_df=premiums_df,
+        offer_finder=offer_finder,
+        deductible_levels_index=deductible_levels_index,
+        household_optimizer=household_optimizer,
+        precomputed_results=precomputed_results,
+        premium_history=premium_history,
+        municipality_search_index=municipality_search_index,
+        municipality_choices={'': ''} | municipality_search_index.choices,
+    )
+    # Also import matplotlib here instead of on the first plot.
+    with stage_timer("import_plot_rendering"):
+        import plot_rendering  # noqa: F401
+    print(f"Loaded data successfully (snapshot {datasets.version}).")
+    return app_data
+
+
+# The data is loaded in a background thread when the server starts, so the server accepts connections right away.
+# The pages wait for it, and /readyz reports when it is loaded.
+# With HEALTH_INSURANCE_EAGER_LOAD=1 it is loaded while importing the app instead. This is needed for gunicorn --preload,
+# which imports the app once and forks the workers from it: otherwise every worker would load the data itself when it
+# starts, and the workers would not share the loaded data and indexes. gunicorn --preload on the command line is detected,
+# HEALTH_INSURANCE_EAGER_LOAD=0 turns eager loading off.
+def preloaded_by_gunicorn(argv=None, environ=None):
+    """Whether the app is imported by the master process of gunicorn --preload (before the workers are forked)."""
+    environ = os.environ if environ is None else environ
+    if "gunicorn" not in sys.modules:
+        return False
+    return "--preload" in (sys.argv if argv is None else argv)[1:] + shlex.split(environ.get("GUNICORN_CMD_ARGS", ""))
+
+
+app_data = BackgroundLoader(load_app_data)
+if os.environ.get("HEALTH_INSURANCE_EAGER_LOAD", "1" if preloaded_by_gunicorn() else "0") == "1":
+    app_data.load_now()
+
+# The offers of a profile are shared by all sessions, so popular profiles are only calculated once per process.
+offers_cache = LRUCache(max_bytes=int(os.environ.get("HEALTH_INSURANCE_CACHE_MB", "64")) * 1024 * 1024)
+
+# Rendered deductible comparison plots (PNG bytes), shared by all sessions.
+plot_cache = LRUCache(max_bytes=int(os.environ.get("HEALTH_INSURANCE_PLOT_CACHE_MB", "32")) * 1024 * 1024)
+
+# Simulated years per simulation of the treatment costs (see simulation.py), fewer are faster but less exact.
+SIMULATION_SAMPLES = int(os.environ.get("HEALTH_INSURANCE_SIMULATION_SAMPLES", DEFAULT_SAMPLES))
+
+# Household mode: the members shown when the page is opened for the first time, and the values of an added member.
+MAX_HOUSEHOLD_SIZE = 8
+DEFAULT_HOUSEHOLD = [
+    {"birth_year": 1985, "accident_insurance": "OHN-UNF", "expected_treatment_costs": 1000},
+    {"birth_year": 1987, "accident_insurance": "OHN-UNF", "expected_treatment_costs": 1000},
+]
+NEW_HOUSEHOLD_MEMBER = {"birth_year": 2015, "accident_insurance": "MIT-UNF", "expected_treatment_costs": 500}
 
 app_ui = ui.page_fixed(
         ui.panel_title(ui.h2("Swiss Health Insurance Premium Calculator for 2026", class_="pt-4 pb-3")), # Add some padding to top and bottom of title
@@ -107,6 +176,12 @@ app_ui = ui.page_fixed(
         )
         
 def server(input, output, session):
+    # In case the server did not start the loading (the app is not run by an ASGI server with lifespan events)
+    app_data.start()
+    data_loaded = reactive.Value(app_data.wait(0))
+    if PROFILE_DIR:
+        start_session_profile(session)
+
     page_state = reactive.Value('input_insurance_calculation')
     selectize_updated = reactive.Value(False)
 
@@ -118,11 +193,18 @@ def server(input, output, session):
         "deductible": None,
         "accident_insurance": None
     })
+    household_calculation_attempted = reactive.Value(False)
+    household_details = reactive.Value(DEFAULT_HOUSEHOLD)
 
     # TODO: Decrease size of the UI elements to reduce vertical scrolling ...
     @output
     @render.ui
+    @timed("dynamic_page")
     def dynamic_page():
+        if not data_loaded():
+            return ui.card(ui.p("Loading the insurance premium data, this takes a few seconds ..."))
+        if not app_data.is_ready():
+            return ui.card(ui.p("The insurance premium data could not be loaded. Please try again later."))
         if page_state() == 'input_insurance_calculation':
             previous_inputs = personal_details.get()
             selectize_updated.set(False)
@@ -138,8 +220,24 @@ def server(input, output, session):
                     selected=previous_inputs.get('accident_insurance')
                 ),
                 ui.input_action_button("calculate_offers", "Calculate Insurance Offers"),
+                ui.input_action_button("household_mode", "Compare for a Household"),
                 ui.output_ui("input_errors_display")
             )
+        elif page_state() == 'household':
+            selectize_updated.set(False)
+            # Not rerendered when the household is stored by the calculate button
+            with reactive.isolate():
+                number_of_members = len(household_details.get())
+            return ui.card(
+                ui.p("Enter the members of your household to find the cheapest health insurance for all of you in 2026."),
+                ui.output_ui("municipality_select"),
+                ui.input_numeric("household_size", "Number of household members", value=number_of_members, min=1, max=MAX_HOUSEHOLD_SIZE, step=1),
+                ui.output_ui("household_member_inputs"),
+                ui.input_action_button("calculate_household", "Calculate Household Costs"),
+                ui.input_action_button("single_person_mode", "Back to a Single Person"),
+                ui.output_ui("household_errors_display"),
+                ui.output_data_frame("household_table")
+            )
         elif page_state() == 'results':
             personal_details_locked = personal_details.get()
             return ui.card(
@@ -151,8 +249,20 @@ def server(input, output, session):
                 ui.input_action_button("modify_details", "Modify"),
                 ui.card_header("Insurance Cost Comparison"),
                 ui.output_data_frame("insurance_table"),
-                ui.output_plot("deductibles_comparison_plot"),
-                ui.output_data_frame("calculate_annual_cost_table")
+                ui.output_image("deductibles_comparison_plot", height="500px"),
+                ui.output_data_frame("calculate_annual_cost_table"),
+                ui.h5("Expected Costs for Uncertain Treatment Costs", class_="pt-3"),
+                ui.p(f"Simulated for {SIMULATION_SAMPLES:,} possible years: in some years you have no treatment costs, in the others they vary around a typical amount."),
+                ui.layout_columns(
+                    ui.input_numeric("simulation_zero_share", "Years without treatment costs (%)", value=15, min=0, max=100, step=5),
+                    ui.input_numeric("simulation_median", "Typical treatment costs in the other years (CHF)", value=800, min=1, step=100),
+                    ui.input_select("simulation_spread", "How much the treatment costs vary", choices={"0.8": "Little", "1.2": "Moderately", "1.6": "A lot"}, selected="1.2"),
+                ),
+                ui.input_checkbox("simulation_all_plans", "Compare all plans and deductibles in the region", value=False),
+                ui.output_data_frame("simulation_table"),
+                ui.h5("Cheapest Deductible and Insurance for Typical Treatment Costs", class_="pt-3"),
+                ui.output_data_frame("optimal_deductible_table"),
+                ui.output_ui("premium_history_display")
             )
         
         elif page_state() == 'general_insurance_calculation':
@@ -214,17 +324,12 @@ def server(input, output, session):
         calculation_attempted.set(False)
 
     @reactive.calc
-    def is_child():
-        return personal_details.get()['birth_year'] >= 2008
+    def age_category():
+        return age_class_for_birth_year(personal_details.get()['birth_year'])
 
     @reactive.calc
-    def age_category():
-        if is_child():
-            return 'AKL-KIN'
-        elif input.birth_year() >= 2001:
-            return 'AKL-JUG'
-        else:
-            return 'AKL-ERW'
+    def is_child():
+        return age_category() == 'AKL-KIN'
         
     @reactive.calc
     def deductible_display():
@@ -235,13 +340,19 @@ def server(input, output, session):
         deductible_lvl = personal_details.get()['deductible']
         return DEDUCTIBLE_CHILD_LVL_TO_AMOUNT[deductible_lvl] if is_child() else DEDUCTIBLE_ADULT_LVL_TO_AMOUNT[deductible_lvl]
     
-    def deductible_amount_for_person(deductible_level, age_class):
-        return DEDUCTIBLE_CHILD_LVL_TO_AMOUNT[deductible_level] if age_class == 'AKL-KIN' else DEDUCTIBLE_ADULT_LVL_TO_AMOUNT[deductible_level]
+    # Show the page as soon as the data is loaded.
+    @reactive.effect
+    def _wait_for_data():
+        if not data_loaded():
+            if app_data.wait(0):
+                data_loaded.set(True)
+            else:
+                reactive.invalidate_later(0.25)
 
     @reactive.calc
     def location_display():
         loc_code = personal_details.get()['location']
-        return municipality_choices[loc_code]
+        return app_data.get().municipality_choices[loc_code]
     
     @reactive.calc
     def accident_display():
@@ -260,16 +371,16 @@ def server(input, output, session):
 
     # Update location selection choices after the UI is rendered. This way is much faster.
     @reactive.effect
+    @timed("update_selectize_choices")
     def _update_selectize_choices():
         # Update selectize choices after the UI is rendered
         previous_inputs = personal_details.get()
         previous_location = previous_inputs.get('location') if previous_inputs else None
-        # Only update when we're on the input page and the location selection box exists.
-        if page_state() == 'input_insurance_calculation' and ('location' in session.input) and not selectize_updated():
-            ui.update_selectize(
+        # Only update when we're on an input page and the location selection box exists.
+        if page_state() in ('input_insurance_calculation', 'household') and ('location' in session.input) and not selectize_updated():
+            update_municipality_selectize(
                 "location",
-                choices=municipality_choices,
-                server=True,
+                app_data.get().municipality_search_index,
                 session=session,
                 selected=previous_location # Restore the previous selection
             )
@@ -295,7 +406,7 @@ def server(input, output, session):
                 ),
                 class_="form-group shiny-input-container"
                 ) 
-        deductible_options = DEDUCTIBLE_ADULT_LVL_TO_AMOUNT if birth_year < 2008 else DEDUCTIBLE_CHILD_LVL_TO_AMOUNT
+        deductible_options = AGE_CLASS_DEDUCTIBLES[age_class_for_birth_year(birth_year)]
         
         previous_inputs = personal_details.get()
         previous_deductible = previous_inputs.get('deductible') if previous_inputs else None
@@ -309,80 +420,82 @@ def server(input, output, session):
 
     # Filter all insurance offers based on the inputs
     @reactive.event(input.calculate_offers)
+    @timed("calculate_data")
     def calculate_data():
         req(len(get_input_errors()) == 0) # Only run the calculation once there are no input errors.
-        df = pd.DataFrame()
+        data = app_data.get()
         bfs_nr, canton, region, *_, = input.location().split('|')
 
-        df = premiums_df[(premiums_df['Kanton'] == canton) & 
-                           (premiums_df['Region'] == f"PR-REG CH{region}") & 
-                           (premiums_df['Altersklasse'] == age_category()) &
-                           (premiums_df['Franchisestufe'] == input.deductible()) &
-                           (premiums_df['Unfalleinschluss'] == input.accident_insurance())].sort_values(by='Prämie')
-        
-        join_keys = ['Kanton', 'Region', 'Versicherer', 'Tarif', 'Tariftyp']
-        merged = pd.merge(df, insurance_model_restrictions_df[join_keys + ['Gemeinden-BFS']], on=join_keys, how='left')
-        
-        # Filter out rows where there is a restriction for the selected municipality (BFS-Nr.)
-        filtered = merged[(merged['Gemeinden-BFS'].isna()) | (merged['Gemeinden-BFS'].apply(lambda x: bfs_nr in x if isinstance(x, list) else False))]  
-        
-        return filtered.drop(columns=['Gemeinden-BFS'])
+        # Offers available in the selected municipality (BFS-Nr.), sorted by premium.
+        profile = (int(bfs_nr), canton, region, age_category(), input.deductible(), input.accident_insurance())
+        df = offers_cache.get_or_compute(profile, lambda: data.offer_finder.offers(*profile))
+
+        return df
 
 
     @render.data_frame
+    @timed("insurance_table")
     def insurance_table():
         return render.DataGrid(
-            calculate_data()[['Versicherung', 'Tarifbezeichnung', 'Prämie']], 
+            # Premiums are stored as float32, round them so they are shown with 2 decimals
+            calculate_data()[['Versicherung', 'Tarifbezeichnung', 'Prämie']].astype({'Prämie': float}).round({'Prämie': 2}),
             selection_mode="row"
         )
     
+    # All deductible levels of the selected insurance plan, together with the cheapest deductible level
+    # for every range of treatment costs (computed exactly, see breakeven.py).
+    @reactive.calc
+    @timed("selected_plan_deductible_levels")
+    def selected_plan_deductible_levels():
+        selected = input.insurance_table_selected_rows()
+        row = calculate_data().iloc[selected[0]]
+
+        deductible_levels_to_compare = app_data.get().deductible_levels_index.lookup(
+            (row['Versicherer'], row['Tarif'], row['Unfalleinschluss'], row['Kanton'], row['Region'], row['Altersklasse'])
+        )
+        premium_amounts = deductible_levels_to_compare['Prämie'].to_numpy(dtype=float)
+        deductible_amounts = np.array([deductible_amount_for_person(level, row['Altersklasse']) for level in deductible_levels_to_compare['Franchisestufe']])
+        return row, premium_amounts, deductible_amounts, optimal_deductible_intervals(premium_amounts, deductible_amounts)
+
     # Create a plot comparing different deductible levels for the selected insurance plan.
     # This allows you to visually see what deductible level is best for what treatment costs.
-    @render.plot
+    # The rendered image is cached per plan, region, age class, accident insurance and image size.
+    @render.image(delete_file=True)
+    @timed("deductibles_comparison_plot")
     def deductibles_comparison_plot():
         selected = input.insurance_table_selected_rows()
 
         if not selected:
             return None
         
-        df = calculate_data()
-        row = df.iloc[selected[0]]
+        row, premium_amounts, deductible_amounts, optimal_intervals = selected_plan_deductible_levels()
+        if not optimal_intervals:
+            return None
         insurance_provider, insurance_plan = row['Versicherung'], row['Tarifbezeichnung']
+        crossover_points = [interval.start for interval in optimal_intervals[1:]]
 
-        deductible_levels_to_compare = premiums_df[
-            (premiums_df['Versicherung'] == insurance_provider) &
-            (premiums_df['Tarifbezeichnung'] == insurance_plan) &
-            (premiums_df['Unfalleinschluss'] == row['Unfalleinschluss']) &
-            (premiums_df['Kanton'] == row['Kanton']) &
-            (premiums_df['Region'] == row['Region']) &
-            (premiums_df['Altersklasse'] == row['Altersklasse'])
-        ]
-
-        # Create treatment costs range (0 to 10,000 CHF)
-        treatment_costs = np.linspace(0, 10000, 1000)
-
-        fig, ax = plt.subplots(figsize=(8, 5))
-
-
-        for _, deductible_row in deductible_levels_to_compare.iterrows():    
-            premium_amount = deductible_row['Prämie']
-            deductible_amount = deductible_amount_for_person(deductible_row['Franchisestufe'], row['Altersklasse'])
-            annual_costs = np.array([
-                calculate_annual_cost_health_insurance(treatment_costs_during_year=x, premium_per_month=premium_amount, deductible_amount=deductible_amount)
-                for x in treatment_costs
-            ])
+        width = session.clientdata.output_width("deductibles_comparison_plot") or 800
+        height = session.clientdata.output_height("deductibles_comparison_plot") or 500
+        pixelratio = session.clientdata.pixelratio() or 1
+        plot_key = (row['Versicherer'], row['Tarif'], row['Kanton'], row['Region'], row['Altersklasse'], row['Unfalleinschluss'],
+                    int(width), int(height), pixelratio)
 
-            ax.plot(treatment_costs, annual_costs, label=f'{deductible_amount} CHF Deductible')
+        @timed("render_plot_png")
+        def render_plot():
+            from plot_rendering import deductibles_comparison_figure, render_png
 
-        ax.set_xlabel('Treatment Costs (CHF)')
-        ax.set_ylabel('Total Costs for You (CHF)')
-        ax.set_title(f'Annual Total Costs for You: {insurance_provider} - {insurance_plan}')
-        ax.legend()
-        ax.grid(True)
+            fig = deductibles_comparison_figure(f'Annual Total Costs for You: {insurance_provider} - {insurance_plan}',
+                                                premium_amounts, deductible_amounts, crossover_points, width, height, pixelratio)
+            return render_png(fig)
 
-        return fig
+        png = plot_cache.get_or_compute(plot_key, render_plot)
+        # render.image sends the image from a file, the temporary copy is deleted after sending.
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as png_file:
+            png_file.write(png)
+        return {"src": png_file.name, "width": "100%", "height": "100%"}
 
     @render.data_frame
+    @timed("calculate_annual_cost_table")
     def calculate_annual_cost_table():
         treatment_costs = [0, 300, 500, 1000, 1500, 2000, 3000, 5000, 10000]
 
@@ -391,26 +504,317 @@ def server(input, output, session):
         if not selected:
             return None
         
-        df = calculate_data()
-        row = df.iloc[selected[0]]
-        insurance_provider, insurance_plan = row['Versicherung'], row['Tarifbezeichnung']
-
-        deductible_levels_to_compare = premiums_df[
-            (premiums_df['Versicherung'] == insurance_provider) &
-            (premiums_df['Tarifbezeichnung'] == insurance_plan) &
-            (premiums_df['Unfalleinschluss'] == row['Unfalleinschluss']) &
-            (premiums_df['Kanton'] == row['Kanton']) &
-            (premiums_df['Region'] == row['Region']) &
-            (premiums_df['Altersklasse'] == row['Altersklasse'])
-        ]
+        _, premium_amounts, deductible_amounts, optimal_intervals = selected_plan_deductible_levels()
+        # No deductible levels found for the plan
+        if not optimal_intervals:
+            return None
 
         result_df = pd.DataFrame({"Treatment Costs during the year": [f"{treatment_cost} CHF" for treatment_cost in treatment_costs]})
-        for _, deductible_row in deductible_levels_to_compare.iterrows():    
-            premium_amount = deductible_row['Prämie']
-            deductible_amount = deductible_amount_for_person(deductible_row['Franchisestufe'], row['Altersklasse'])
-            result_df[f"{deductible_amount} CHF Deductible"] = [f"{calculate_annual_cost_health_insurance(treatment_costs_during_year=treatment_cost, premium_per_month=premium_amount, deductible_amount=deductible_amount):.2f} CHF" for treatment_cost in treatment_costs]
+        annual_costs = annual_costs_health_insurance(
+            treatment_costs_during_year=np.array(treatment_costs)[np.newaxis, :],
+            premium_per_month=premium_amounts[:, np.newaxis],
+            deductible_amount=deductible_amounts[:, np.newaxis],
+        )
+        for deductible_amount, annual_costs_for_deductible in zip(deductible_amounts, annual_costs):
+            result_df[f"{deductible_amount} CHF Deductible"] = [f"{annual_cost:.2f} CHF" for annual_cost in annual_costs_for_deductible]
+        result_df["Cheapest Deductible"] = [f"{deductible_amounts[level]} CHF" for level in optimal_level_at(optimal_intervals, treatment_costs)]
 
         return result_df
 
-    
-app = App(app_ui, server)
+    # The costs you pay yourself for uncertain treatment costs, simulated for all deductible amounts of the age class (see simulation.py).
+    # They don't depend on the plan, so one simulation serves the selected plan and all plans of the region.
+    @timed("simulated_out_of_pocket")
+    def simulate(distribution, deductible_amounts):
+        return offers_cache.get_or_compute(('simulation', distribution, deductible_amounts),
+                                           lambda: simulate_out_of_pocket(distribution, deductible_amounts, SIMULATION_SAMPLES))
+
+    # The simulation runs on a worker thread, so the event loop keeps serving the other sessions in the meantime.
+    @reactive.extended_task
+    async def simulation_task(distribution, deductible_amounts):
+        return await asyncio.get_running_loop().run_in_executor(None, simulate, distribution, deductible_amounts)
+
+    @reactive.effect
+    def _():
+        zero_share, median = input.simulation_zero_share(), input.simulation_median()
+        req(isinstance(zero_share, (int, float)) and 0 <= zero_share <= 100 and isinstance(median, (int, float)) and median > 0)
+        distribution = ZeroInflatedLognormal(zero_share / 100, float(median), float(input.simulation_spread()))
+        deductible_amounts = tuple(AGE_CLASS_DEDUCTIBLES[age_category()].values())
+        # Only the simulation of the latest inputs is still needed
+        simulation_task.cancel()
+        simulation_task.invoke(distribution, deductible_amounts)
+
+    @reactive.calc
+    def simulated_out_of_pocket():
+        return simulation_task.result()
+
+    @render.data_frame
+    @timed("simulation_table")
+    def simulation_table():
+        statistics = simulated_out_of_pocket()
+        if input.simulation_all_plans():
+            # All plans and deductible levels available in the municipality
+            data = app_data.get()
+            details = personal_details.get()
+            bfs_nr, canton, region, *_, = details['location'].split('|')
+            offsets = data.offer_finder.profile_offsets(int(bfs_nr), canton, region, age_category(), details['accident_insurance'])
+            offers = data.premiums_df.take(offsets)
+            deductible_amounts = deductible_amounts_for_persons(offers['Franchisestufe'], offers['Altersklasse'])
+            simulated = statistics.annual_costs(offers['Prämie'].to_numpy(dtype=float), deductible_amounts)
+            result_df = pd.DataFrame({
+                "Insurance": offers['Versicherung'].to_numpy(),
+                "Plan": offers['Tarifbezeichnung'].to_numpy(),
+                "Deductible": [f"{deductible_amount:.0f} CHF" for deductible_amount in deductible_amounts],
+            })
+            order = np.argsort(simulated['Expected costs'].to_numpy(), kind='stable')
+            result_df, simulated = result_df.iloc[order].reset_index(drop=True), simulated.iloc[order].reset_index(drop=True)
+        else:
+            selected = input.insurance_table_selected_rows()
+            if not selected:
+                return None
+            _, premium_amounts, deductible_amounts, optimal_intervals = selected_plan_deductible_levels()
+            if not optimal_intervals:
+                return None
+            simulated = statistics.annual_costs(premium_amounts, deductible_amounts)
+            result_df = pd.DataFrame({"Deductible": [f"{deductible_amount} CHF" for deductible_amount in deductible_amounts]})
+
+        result_df["Expected Costs for You"] = [f"{costs:.2f} CHF" for costs in simulated['Expected costs']]
+        result_df["Standard Deviation"] = [f"{costs:.2f} CHF" for costs in simulated['Standard deviation']]
+        for percentile in [50, 90, 99]:
+            result_df[f"{percentile}% of the Years up to"] = [f"{costs:.2f} CHF" for costs in simulated[f'P{percentile}']]
+        return result_df
+
+    # The cheapest combination of deductible level and insurance for some typical treatment costs.
+    # Served from the precomputed results if `python precompute.py` was run, otherwise computed for this profile.
+    @render.data_frame
+    @timed("optimal_deductible_table")
+    def optimal_deductible_table():
+        data = app_data.get()
+        details = personal_details.get()
+        bfs_nr, canton, region, *_, = details['location'].split('|')
+        if data.precomputed_results is not None:
+            optimal = data.precomputed_results.optimal_deductibles(bfs_nr, age_category(), details['accident_insurance'])
+        else:
+            optimal = optimal_deductibles_for_profile(data.offer_finder, int(bfs_nr), canton, region, age_category(), details['accident_insurance'])
+        optimal = optimal[optimal['offset'] >= 0]
+        offers = data.premiums_df.take(optimal['offset'].to_numpy())
+
+        return pd.DataFrame({
+            "Treatment Costs during the year": [f"{treatment_cost} CHF" for treatment_cost in optimal['Treatment costs']],
+            "Deductible": [f"{deductible_amount_for_person(level, age_category())} CHF" for level in optimal['Franchisestufe']],
+            "Insurance": offers['Versicherung'].to_numpy(),
+            "Plan": offers['Tarifbezeichnung'].to_numpy(),
+            "Total Costs for You": [f"{annual_cost:.2f} CHF" for annual_cost in optimal['Annual costs']],
+        })
+
+    # Premiums of the earlier years, only shown if `python premium_history.py` ingested some (see premium_history.py).
+    @render.ui
+    def premium_history_display():
+        history = app_data.get().premium_history
+        if history is None:
+            return None
+        return ui.div(
+            ui.h5("Premiums of the Selected Plan over the Years", class_="pt-3"),
+            ui.output_data_frame("premium_history_table"),
+            ui.h5("Cheapest Plans in Your Premium Region over the Years", class_="pt-3"),
+            ui.output_data_frame("cheapest_per_year_table"),
+        )
+
+    @render.data_frame
+    @timed("premium_history_table")
+    def premium_history_table():
+        history = app_data.get().premium_history
+        selected = input.insurance_table_selected_rows()
+        if history is None or not selected:
+            return None
+        row = calculate_data().iloc[selected[0]]
+        trend = history.premium_trend(tuple(row[key] for key in PLAN_KEYS))
+        return pd.DataFrame({
+            "Year": trend['Geschäftsjahr'],
+            "Premium per Month": [f"{premium:.2f} CHF" for premium in trend['Prämie']],
+            "Change": ["" if np.isnan(change) else f"{change:+.2f} CHF" for change in trend['Change']],
+        })
+
+    @render.data_frame
+    @timed("cheapest_per_year_table")
+    def cheapest_per_year_table():
+        history = app_data.get().premium_history
+        if history is None:
+            return None
+        details = personal_details.get()
+        _, canton, region, *_, = details['location'].split('|')
+        cheapest = history.cheapest_per_year(
+            canton, region, age_category(), details['deductible'], details['accident_insurance'], top_n=3)
+        return pd.DataFrame({
+            "Year": cheapest['Geschäftsjahr'],
+            "Rank": cheapest['Rang'],
+            "Insurance": cheapest['Versicherer'].map(BAG_VERSICHERER),
+            "Plan": cheapest['Tarifbezeichnung'],
+            "Premium per Month": [f"{premium:.2f} CHF" for premium in cheapest['Prämie']],
+        })
+
+    # Household mode: several members in the same municipality, all of them evaluated at once (see household.py).
+    @reactive.calc
+    def household_size():
+        size = input.household_size()
+        req(isinstance(size, int) and 1 <= size <= MAX_HOUSEHOLD_SIZE)
+        return size
+
+    def household_member_details():
+        # The entered values of every member, or the stored ones for members without inputs yet.
+        stored = household_details.get()
+        details = []
+        for i in range(household_size()):
+            member = stored[i] if i < len(stored) else NEW_HOUSEHOLD_MEMBER
+            details.append({field: input[f"member_{i}_{field}"]() if f"member_{i}_{field}" in session.input else value
+                            for field, value in member.items()})
+        return details
+
+    @render.ui
+    def household_member_inputs():
+        # Only rerendered when the number of members changes, the entered values are kept.
+        size = household_size()
+        with reactive.isolate():
+            details = household_member_details()
+        return ui.div(*[
+            ui.layout_columns(
+                ui.input_numeric(f"member_{i}_birth_year", f"Member {i + 1}: Year of birth", value=details[i]['birth_year'], min=1900, max=2025, step=1),
+                ui.input_radio_buttons(f"member_{i}_accident_insurance", "Include accident insurance?", choices={"MIT-UNF": "Yes", "OHN-UNF": "No"},
+                                       selected=details[i]['accident_insurance'], inline=True),
+                ui.input_numeric(f"member_{i}_expected_treatment_costs", "Expected treatment costs (CHF)", value=details[i]['expected_treatment_costs'], min=0, step=100),
+            )
+            for i in range(size)
+        ])
+
+    @reactive.calc
+    def get_household_errors():
+        errors = []
+        if not input.location():
+            errors.append("Please select a municipality.")
+        for i, member in enumerate(household_member_details()):
+            birth_year, expected_treatment_costs = member['birth_year'], member['expected_treatment_costs']
+            if not (isinstance(birth_year, int) and 1900 <= birth_year <= 2025):
+                errors.append(f"Please enter a valid birth year between 1900 and 2025 for member {i + 1}.")
+            if not (isinstance(expected_treatment_costs, (int, float)) and expected_treatment_costs >= 0):
+                errors.append(f"Please enter the expected treatment costs of member {i + 1}.")
+        return errors
+
+    def store_household_inputs():
+        # Keep the entered values when switching between the single person and the household page.
+        personal_details.set(personal_details.get() | {"location": input.location()})
+        if 'household_size' in session.input and input.household_size():
+            household_details.set(household_member_details())
+
+    @reactive.Effect
+    @reactive.event(input.household_mode)
+    def _():
+        personal_details.set(personal_details.get() | {"location": input.location()})
+        calculation_attempted.set(False)
+        page_state.set("household")
+
+    @reactive.Effect
+    @reactive.event(input.single_person_mode)
+    def _():
+        store_household_inputs()
+        household_calculation_attempted.set(False)
+        page_state.set("input_insurance_calculation")
+
+    @reactive.Effect
+    @reactive.event(input.calculate_household)
+    def _():
+        household_calculation_attempted.set(True)
+        if len(get_household_errors()) == 0:
+            store_household_inputs()
+
+    @render.ui
+    def household_errors_display():
+        errors = get_household_errors()
+        if household_calculation_attempted() and len(errors) > 0:
+            return ui.div(
+                ui.tags.div(
+                    ui.tags.strong("Please fix the following errors:"),
+                    ui.tags.ul([ui.tags.li(error) for error in errors]),
+                    class_="alert alert-danger",
+                    role="alert"
+                )
+            )
+        else:
+            return ui.div()
+
+    # The cheapest configurations of the household, shared by all sessions through the offers cache.
+    @reactive.event(input.calculate_household)
+    @timed("household_configurations")
+    def household_configurations():
+        req(len(get_household_errors()) == 0)
+        data = app_data.get()
+        bfs_nr, canton, region, *_, = input.location().split('|')
+        details = household_member_details()
+        members = tuple(HouseholdMember(age_class_for_birth_year(member['birth_year']), member['accident_insurance'], float(member['expected_treatment_costs']))
+                        for member in details)
+        key = ('household', int(bfs_nr), canton, region, members)
+        configurations = offers_cache.get_or_compute(key, lambda: data.household_optimizer.cheapest_configurations(int(bfs_nr), canton, region, members))
+        return details, members, configurations
+
+    @render.data_frame
+    @timed("household_table")
+    def household_table():
+        details, members, configurations = household_configurations()
+        if configurations.empty:
+            return pd.DataFrame({"Household Costs": ["There are no offers for all members of the household in this municipality."]})
+        offers = app_data.get().premiums_df.take(configurations['offset'].to_numpy())
+        member_offers = [
+            f"{insurer}, {plan}, {deductible_amount_for_person(level, members[member].age_class)} CHF deductible: {annual_cost:.2f} CHF"
+            for insurer, plan, level, member, annual_cost in zip(offers['Versicherung'], offers['Tarifbezeichnung'], offers['Franchisestufe'],
+                                                                 configurations['Member'], configurations['Annual costs'])
+        ]
+        first_rows = configurations.drop_duplicates('Configuration')
+        result_df = pd.DataFrame({
+            "Option": ["Cheapest plan for every member" if configuration == 0 else f"Everyone with {insurer}"
+                       for configuration, insurer in zip(first_rows['Configuration'], offers['Versicherung'].to_numpy()[first_rows.index])],
+            "Total Costs for the Household": [f"{household_costs:.2f} CHF" for household_costs in first_rows['Household costs']],
+        })
+        for i, member in enumerate(details):
+            result_df[f"Member {i + 1} ({member['birth_year']})"] = member_offers[i::len(details)]
+        return result_df
+
+
+
+# Health check: the process is up and answers requests (also while the data is loading).
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+
+# Readiness check: 200 once the data is loaded, 503 before (or if loading failed).
+async def readyz(request):
+    status = app_data.status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+
+# Metrics in the Prometheus text format: latency histograms of the stages, cache statistics and the data loading.
+# Disabled unless HEALTH_INSURANCE_METRICS_TOKEN is set, and then only answered for requests with the header
+# "Authorization: Bearer <token>". The client address is not checked, behind a reverse proxy every request comes from it.
+async def metrics(request):
+    token = os.environ.get("HEALTH_INSURANCE_METRICS_TOKEN")
+    if not token:
+        return PlainTextResponse("Not Found\n", status_code=404)
+    if not hmac.compare_digest(request.headers.get("authorization", "").encode(), f"Bearer {token}".encode()):
+        return PlainTextResponse("Unauthorized\n", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    text = prometheus_text(caches={"offers": offers_cache, "plots": plot_cache}, loader=app_data)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@asynccontextmanager
+async def lifespan(_):
+    # Start loading the data when the server starts, it is ready shortly after the server accepts connections.
+    app_data.start()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/healthz", healthz),
+        Route("/readyz", readyz),
+        Route("/metrics", metrics),
+        Mount("/", app=App(app_ui, server)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,66 @@
+import threading
+import time
+import traceback
+
+
+class BackgroundLoader:
+    """Runs a loading function once in a background thread and keeps its result.
+
+    The app starts loading its data when the server starts, so the server accepts connections (and answers
+    its health checks) right away instead of only after the data is loaded.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = threading.Event()
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.monotonic()
+                self._thread = threading.Thread(target=self._run, name="background-loader", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            self.value = self._load()
+        except Exception as e:
+            self.error = e
+            traceback.print_exc()
+        finally:
+            self.finished_at = time.monotonic()
+            self._done.set()
+
+    def load_now(self):
+        """Start loading if it did not start yet, wait for it and return the value."""
+        self.start()
+        self._done.wait()
+        return self.get()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def is_ready(self):
+        return self._done.is_set() and self.error is None
+
+    def get(self):
+        if not self.is_ready():
+            raise RuntimeError("The data is not loaded yet." if self.error is None else f"Loading the data failed: {self.error}")
+        return self.value
+
+    def status(self):
+        """'not started', 'loading', 'ready' or 'failed', with the seconds the loading took so far."""
+        if self.started_at is None:
+            return {"status": "not started"}
+        if not self._done.is_set():
+            return {"status": "loading", "seconds": round(time.monotonic() - self.started_at, 3)}
+        status = {"status": "ready" if self.error is None else "failed", "seconds": round(self.finished_at - self.started_at, 3)}
+        if self.error is not None:
+            status["error"] = str(self.error)
+        return status
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+
+from cost_model import DEDUCTIBLE_ADULT_LVL_TO_AMOUNT, annual_costs_health_insurance, calculate_annual_cost_health_insurance, cost_tensor
+
+# Compares the scalar cost function (called once per point, as the plot did before) with the vectorized one
+# for the deductible comparison plot: 6 deductible levels x 1000 treatment cost points.
+# Run from the shiny_app directory: python -m benchmarks.bench_cost_model
+REPEATS = 50
+
+
+def _best_of(function):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    treatment_costs = np.linspace(0, 10000, 1000)
+    deductibles = np.array(list(DEDUCTIBLE_ADULT_LVL_TO_AMOUNT.values()))
+    premiums = 420.0 - deductibles * 0.06
+
+    def scalar():
+        return np.array([[calculate_annual_cost_health_insurance(x, premium, deductible) for x in treatment_costs]
+                         for premium, deductible in zip(premiums, deductibles)])
+
+    def vectorized():
+        return annual_costs_health_insurance(treatment_costs[np.newaxis, :], premiums[:, np.newaxis], deductibles[:, np.newaxis])
+
+    assert np.allclose(scalar(), vectorized())
+    scalar_ms, vectorized_ms = _best_of(scalar), _best_of(vectorized)
+    print(f"plot curve, {len(deductibles)} deductibles x {len(treatment_costs)} points:")
+    print(f"scalar       {scalar_ms:8.3f} ms")
+    print(f"vectorized   {vectorized_ms:8.3f} ms")
+    print(f"speedup      {scalar_ms / vectorized_ms:.0f}x")
+
+    # All plans of a region in one call
+    plan_premiums = premiums[np.newaxis, :] * np.random.default_rng(0).uniform(0.8, 1.2, (150, 1))
+    tensor_ms = _best_of(lambda: cost_tensor(treatment_costs, plan_premiums, deductibles))
+    print(f"cost tensor  {tensor_ms:8.3f} ms for {plan_premiums.shape[0]} plans x {len(deductibles)} deductibles x {len(treatment_costs)} points")
+
+
+if __name__ == "__main__":
+    main()
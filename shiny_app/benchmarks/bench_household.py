@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import synthetic_tables
+from cost_model import annual_costs_health_insurance, deductible_amount_for_person
+from household import HouseholdMember, HouseholdOptimizer
+from offers import OfferFinder
+from precompute import AGE_CLASS_DEDUCTIBLES
+from premium_index import OFFER_KEYS, filter_with_masks
+
+# Compares the household evaluation in one batched pass (HouseholdOptimizer) with running the single person
+# flow for every member and deductible level: with the boolean mask filters, and with the OfferFinder index.
+# Run from the shiny_app directory: python -m benchmarks.bench_household
+N_HOUSEHOLDS = 200
+HOUSEHOLD = [
+    HouseholdMember('AKL-ERW', 'OHN-UNF', 800),
+    HouseholdMember('AKL-ERW', 'OHN-UNF', 3000),
+    HouseholdMember('AKL-JUG', 'MIT-UNF', 500),
+    HouseholdMember('AKL-KIN', 'MIT-UNF', 200),
+    HouseholdMember('AKL-KIN', 'MIT-UNF', 1500),
+]
+
+
+def _household_costs_per_member(offers_for_level, members):
+    # The cheapest annual costs of every member at every insurer, one filter per member and deductible level.
+    costs = []
+    for member in members:
+        member_costs = []
+        for deductible_level in AGE_CLASS_DEDUCTIBLES[member.age_class]:
+            offers = offers_for_level(member, deductible_level)
+            annual_costs = annual_costs_health_insurance(member.expected_treatment_costs, offers['Prämie'].to_numpy(dtype=float),
+                                                         deductible_amount_for_person(deductible_level, member.age_class))
+            member_costs.append(pd.Series(annual_costs, index=offers['Versicherer'].to_numpy()))
+        costs.append(pd.concat(member_costs).groupby(level=0).min())
+    # Only insurers with offers for every member
+    return sorted(pd.concat(costs, axis=1).dropna().sum(axis=1))
+
+
+def _latencies(function, municipalities):
+    latencies = []
+    for municipality in municipalities:
+        start = time.perf_counter()
+        function(*municipality)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+def _report(name, latencies_ms):
+    print(f"{name:<14} mean {latencies_ms.mean():8.3f} ms   p50 {np.percentile(latencies_ms, 50):8.3f} ms   p99 {np.percentile(latencies_ms, 99):8.3f} ms")
+
+
+def main():
+    tables = synthetic_tables()
+    premiums_df = tables["premiums"]
+    offer_finder = OfferFinder(premiums_df, tables["insurance_model_restrictions"])
+    start = time.perf_counter()
+    optimizer = HouseholdOptimizer(offer_finder)
+    print(f"{len(premiums_df)} rows, household optimizer built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rng = np.random.default_rng(1)
+    municipalities = tables["premium_regions"][['BFS-Nr.', 'Kanton', 'Region']].drop_duplicates('BFS-Nr.').to_numpy()
+    municipalities = [tuple(municipality) for municipality in municipalities[rng.integers(0, len(municipalities), N_HOUSEHOLDS)]]
+
+    def with_masks(bfs_nr, canton, region):
+        def offers_for_level(member, deductible_level):
+            offers = filter_with_masks(premiums_df, OFFER_KEYS, (canton, f"PR-REG CH{region}", member.age_class, deductible_level, member.accident_insurance))
+            return offers[offer_finder.restrictions.is_available(offer_finder.restrictions.plan_ids(offers), bfs_nr)]
+        return _household_costs_per_member(offers_for_level, HOUSEHOLD)
+
+    def with_offer_finder(bfs_nr, canton, region):
+        def offers_for_level(member, deductible_level):
+            return offer_finder.offers(bfs_nr, canton, region, member.age_class, deductible_level, member.accident_insurance)
+        return _household_costs_per_member(offers_for_level, HOUSEHOLD)
+
+    def batched(bfs_nr, canton, region):
+        return optimizer.cheapest_configurations(bfs_nr, canton, region, HOUSEHOLD, top_n=len(optimizer.premiums_df))
+
+    for municipality in municipalities[:5]:
+        configurations = batched(*municipality)
+        household_costs = configurations[configurations['Configuration'] > 0].drop_duplicates('Configuration')['Household costs']
+        assert np.allclose(household_costs, with_masks(*municipality))
+
+    print(f"{N_HOUSEHOLDS} households of {len(HOUSEHOLD)} members:")
+    masks = _latencies(with_masks, municipalities)
+    _report("masks", masks)
+    offers = _latencies(with_offer_finder, municipalities)
+    _report("offer finder", offers)
+    batch = _latencies(batched, municipalities)
+    _report("batched", batch)
+    print(f"speedup        {masks.mean() / batch.mean():.0f}x over masks, {offers.mean() / batch.mean():.0f}x over the offer finder")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import re
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_data import synthetic_premium_regions
+from municipality_search import MunicipalitySearchIndex, build_municipality_choices
+
+# Compares building the municipality choices with iterrows (as app.py did before) with the column operations,
+# and filtering all choices for every keystroke (as ui.update_selectize(server=True) does) with the search index.
+# Run from the shiny_app directory: python -m benchmarks.bench_municipality_search
+QUERIES = ["8", "80", "800", "ort", "ort 1", "ort 12", "gemeinde 3", "gemeinde 34", "ort 12-", "12-1"]
+MAX_OPTIONS = 1000
+REPEATS = 100
+
+
+def _choices_with_iterrows(premium_regions_df):
+    premium_regions_df = premium_regions_df.copy()
+    premium_regions_df['plz_count'] = premium_regions_df.groupby('PLZ')['PLZ'].transform('count')
+    return {f"{row['BFS-Nr.']}|{row['Kanton']}|{row['Region']}|{row['PLZ']}|{row['Ort']}|{row['Gemeinde']}": f"{row['PLZ']} {row['Ort']}" + (f" (Gemeinde {row['Gemeinde']})" if row['plz_count'] > 1 else "")
+            for _, row in premium_regions_df.iterrows()}
+
+
+def _filter_choices(choices, query):
+    # What shiny does for every request of a server-side selectize input
+    keywords = set(re.split(r"\s+", query.lower()))
+    filtered = []
+    for value, label in choices.items():
+        if len(filtered) > MAX_OPTIONS:
+            break
+        if all(keyword in label.lower() for keyword in keywords):
+            filtered.append(value)
+    return filtered
+
+
+def _best_of_ms(function):
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def _latencies_us(function):
+    latencies = []
+    for _ in range(REPEATS):
+        for query in QUERIES:
+            start = time.perf_counter()
+            function(query)
+            latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1e6
+
+
+def main():
+    premium_regions_df = synthetic_premium_regions()
+    print(f"{len(premium_regions_df)} municipality choices")
+    print(f"choices with iterrows       {_best_of_ms(lambda: _choices_with_iterrows(premium_regions_df)):8.1f} ms")
+    print(f"choices with column ops     {_best_of_ms(lambda: build_municipality_choices(premium_regions_df)):8.1f} ms")
+
+    choices_df = build_municipality_choices(premium_regions_df)
+    start = time.perf_counter()
+    index = MunicipalitySearchIndex(choices_df)
+    print(f"search index built in       {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    choices = dict(zip(choices_df['value'], choices_df['label']))
+    for name, function in [("filter all choices", lambda query: _filter_choices(choices, query)),
+                           ("search index", lambda query: index.search(query, MAX_OPTIONS))]:
+        latencies = _latencies_us(function)
+        print(f"{name:<20} p50 {np.percentile(latencies, 50):8.0f} us   p99 {np.percentile(latencies, 99):8.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import time
+
+import numpy as np
+
+from cost_model import DEDUCTIBLE_ADULT_LVL_TO_AMOUNT
+from plot_rendering import deductibles_comparison_figure, render_png
+from result_cache import LRUCache
+
+# Renders the deductible comparison plot for many plan selections, as a long-running server does, and reports
+# the rendering time and whether the memory grows with the number of selections.
+# Only DISTINCT_PLANS different plans are selected, the repeated selections are served from the PNG cache.
+# Run from the shiny_app directory: python -m benchmarks.bench_plot_rendering [selections]
+SELECTIONS = 10_000
+DISTINCT_PLANS = 200
+
+
+def _rss_mib():
+    # Current (not peak) resident set size, Linux only
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def main(selections=SELECTIONS):
+    deductibles = np.array(list(DEDUCTIBLE_ADULT_LVL_TO_AMOUNT.values()))
+    rng = np.random.default_rng(0)
+    plan_premiums = (420.0 - deductibles * 0.06)[np.newaxis, :] * rng.uniform(0.8, 1.2, (DISTINCT_PLANS, 1))
+    cache = LRUCache(max_bytes=32 * 1024 * 1024)
+
+    def render(plan):
+        return render_png(deductibles_comparison_figure(f"Plan {plan}", plan_premiums[plan], deductibles, [2000.0]))
+
+    render(0)  # font cache, imports
+    rss_before = _rss_mib()
+    start = time.perf_counter()
+    for i, plan in enumerate(rng.integers(0, DISTINCT_PLANS, selections)):
+        cache.get_or_compute(int(plan), lambda: render(plan))
+        if i == selections // 10:
+            rss_after_tenth = _rss_mib()
+    elapsed = time.perf_counter() - start
+
+    stats = cache.stats()
+    print(f"{selections} selections of {DISTINCT_PLANS} plans in {elapsed:.1f} s, "
+          f"{stats['misses']} rendered, hit rate {stats['hit_rate']:.0%}, cache {stats['bytes'] / 1024 / 1024:.1f} MiB")
+    print(f"RSS before {rss_before:.0f} MiB, after {selections // 10} selections {rss_after_tenth:.0f} MiB, "
+          f"at the end {_rss_mib():.0f} MiB")
+
+
+if __name__ == "__main__":
+    import sys
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SELECTIONS)
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_data import synthetic_premiums
+from premium_index import OFFER_KEYS, PremiumIndex, filter_with_masks
+
+# Compares the boolean mask filtering that calculate_data used before with the precomputed PremiumIndex.
+# Run from the shiny_app directory: python -m benchmarks.bench_premium_index
+N_LOOKUPS = 1000
+
+
+def _latencies(function, keys):
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        function(key)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+def _report(name, latencies_ms):
+    print(f"{name:<12} mean {latencies_ms.mean():8.3f} ms   p50 {np.percentile(latencies_ms, 50):8.3f} ms   p99 {np.percentile(latencies_ms, 99):8.3f} ms")
+
+
+def main():
+    premiums_df = synthetic_premiums()
+    rng = np.random.default_rng(1)
+    all_keys = premiums_df[OFFER_KEYS].drop_duplicates().to_numpy()
+    keys = [tuple(key) for key in all_keys[rng.integers(0, len(all_keys), N_LOOKUPS)]]
+
+    start = time.perf_counter()
+    index = PremiumIndex(premiums_df, OFFER_KEYS, sort_by='Prämie')
+    print(f"{len(premiums_df)} rows, {len(index)} keys, index built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for key in keys[:20]:
+        assert index.lookup(key).index.equals(filter_with_masks(premiums_df, OFFER_KEYS, key, sort_by='Prämie').index)
+
+    masks = _latencies(lambda key: filter_with_masks(premiums_df, OFFER_KEYS, key, sort_by='Prämie'), keys)
+    indexed = _latencies(index.lookup, keys)
+    print(f"{N_LOOKUPS} lookups:")
+    _report("masks", masks)
+    _report("index", indexed)
+    print(f"speedup      {masks.mean() / indexed.mean():.0f}x")
+
+
+if __name__ == "__main__":
+    main()
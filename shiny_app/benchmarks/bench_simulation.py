@@ -0,0 +1,64 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic_data import synthetic_tables
+from cost_model import annual_costs_health_insurance, deductible_amounts_for_persons
+from household import HouseholdMember, HouseholdOptimizer
+from offers import OfferFinder
+from simulation import CHUNK_SIZE, DEFAULT_SAMPLES, ZeroInflatedLognormal, chunk_seeds, simulate_annual_costs
+
+# Simulates the annual costs of all plans and deductible levels of a region for a million treatment cost samples:
+# every plan evaluated on every sample (in chunks, so it fits in memory), and the samples evaluated once per
+# deductible amount (simulation.py), on one thread, on a thread pool and on a process pool.
+# Run from the shiny_app directory: python -m benchmarks.bench_simulation
+DISTRIBUTION = ZeroInflatedLognormal(zero_share=0.15, median=800, sigma=1.2)
+
+
+def _per_plan(premiums, deductible_amounts, n_samples):
+    # Sum and sum of squares of the annual costs of every plan, chunk by chunk
+    total, total_squares = np.zeros(len(premiums)), np.zeros(len(premiums))
+    for size, seed in chunk_seeds(n_samples):
+        treatment_costs = DISTRIBUTION.sample(np.random.default_rng(seed), size)
+        costs = annual_costs_health_insurance(treatment_costs[np.newaxis, :], premiums[:, np.newaxis], deductible_amounts[:, np.newaxis])
+        total += costs.sum(axis=1)
+        total_squares += (costs ** 2).sum(axis=1)
+    mean = total / n_samples
+    return mean, total_squares / n_samples - mean ** 2
+
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    tables = synthetic_tables()
+    premiums_df = tables["premiums"]
+    optimizer = HouseholdOptimizer(OfferFinder(premiums_df, tables["insurance_model_restrictions"]))
+    bfs_nr, canton, region = tables["premium_regions"][['BFS-Nr.', 'Kanton', 'Region']].iloc[0]
+    _, offsets, _ = optimizer.member_offers(bfs_nr, canton, region, [HouseholdMember('AKL-ERW', 'OHN-UNF', 0.0)])
+    offers = premiums_df.take(offsets)
+    premiums = offers['Prämie'].to_numpy(dtype=float)
+    deductible_amounts = deductible_amounts_for_persons(offers['Franchisestufe'], offers['Altersklasse'])
+    print(f"{len(offers)} plans and deductible levels, {DEFAULT_SAMPLES} samples in chunks of {CHUNK_SIZE}, {os.cpu_count()} CPUs:")
+
+    per_plan, per_plan_seconds = _timed(lambda: _per_plan(premiums, deductible_amounts, DEFAULT_SAMPLES))
+    print(f"per plan             {per_plan_seconds:8.2f} s")
+    serial, serial_seconds = _timed(lambda: simulate_annual_costs(DISTRIBUTION, premiums, deductible_amounts, max_workers=1))
+    assert np.allclose(serial['Expected costs'], per_plan[0]) and np.allclose(serial['Variance'], per_plan[1], rtol=1e-3)
+    print(f"per deductible       {serial_seconds:8.2f} s")
+    threads, threads_seconds = _timed(lambda: simulate_annual_costs(DISTRIBUTION, premiums, deductible_amounts))
+    print(f"  on a thread pool   {threads_seconds:8.2f} s")
+    with ProcessPoolExecutor() as executor:
+        processes, processes_seconds = _timed(lambda: simulate_annual_costs(DISTRIBUTION, premiums, deductible_amounts, executor=executor))
+    print(f"  on a process pool  {processes_seconds:8.2f} s")
+    assert threads.equals(serial) and processes.equals(serial)
+    print(f"speedup              {per_plan_seconds / min(serial_seconds, threads_seconds, processes_seconds):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Measures how long it takes until a freshly started server answers, with the data loaded in the background
+# (default) and while importing the app (HEALTH_INSURANCE_EAGER_LOAD=1, as before):
+#   first byte  the first response to GET / (the page itself, the data may still be loading)
+#   ready       /readyz answers 200, the data is loaded
+# It also shows the modules that take the longest to import, from `python -X importtime -c "import app"`.
+# Run from the shiny_app directory: python -m benchmarks.bench_startup
+PORT = 8766
+SLOWEST_IMPORTS = 10
+
+
+def _get(path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{PORT}{path}", timeout=60) as response:
+        response.read(1)
+        return response.status
+
+
+def _poll(path, deadline):
+    while time.monotonic() < deadline:
+        try:
+            if _get(path) == 200:
+                return
+        except (OSError, urllib.error.HTTPError):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"No answer from {path} in time.")
+
+
+def measure(eager):
+    env = dict(os.environ, HEALTH_INSURANCE_EAGER_LOAD="1" if eager else "0")
+    start = time.monotonic()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(PORT), "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + 300
+        _poll("/", deadline)
+        first_byte = time.monotonic() - start
+        _poll("/readyz", deadline)
+        return first_byte, time.monotonic() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports():
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], env=dict(os.environ, HEALTH_INSURANCE_EAGER_LOAD="0"),
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            imports.append((int(cumulative) / 1e6, name.rstrip()))
+    return sorted(imports, reverse=True)[:SLOWEST_IMPORTS]
+
+
+def main():
+    for eager in (True, False):
+        first_byte, ready = measure(eager)
+        print(f"{'data loaded on import ' if eager else 'data loaded in background'}  first byte after {first_byte:5.2f} s   ready after {ready:5.2f} s")
+    print("slowest imports of `import app` (cumulative):")
+    for seconds, name in slowest_imports():
+        print(f"  {seconds:6.3f} s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+# Starts the app with N worker processes and reports the startup time and the memory of all processes:
+#   parquet  uvicorn --workers N, every worker reads the Parquet snapshot
+#   shared   uvicorn --workers N, every worker attaches to the shared column arrays (HEALTH_INSURANCE_SHARED_DATA=1)
+#   preload  gunicorn --preload (if installed), the app is imported once and the workers are forked from it, so they
+#            also share the imported libraries and the indexes
+# RSS counts the shared pages in every process, PSS splits them between the processes
+# that map them, so the PSS total is the memory the server really needs. Linux only.
+# Run from the shiny_app directory: python -m benchmarks.bench_workers [--workers 1 2 4]
+PORT = 8765
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        for child in (task / "children").read_text().split():
+            pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _memory_kib(pid):
+    # Rss and Pss in KiB from the summary of the memory mappings of the process
+    memory = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        key, value, *_ = line.split()
+        memory[key.rstrip(":")] = int(value)
+    return memory["Rss"], memory["Pss"]
+
+
+def _start_server(workers, mode):
+    env = dict(os.environ, HEALTH_INSURANCE_SHARED_DATA="0" if mode == "parquet" else "1", PYTHONUNBUFFERED="1",
+               HEALTH_INSURANCE_EAGER_LOAD="1" if mode == "preload" else "0")
+    if mode == "preload":
+        command = ["gunicorn", "app:app", "--preload", "--worker-class", "uvicorn.workers.UvicornWorker", "--bind", f"127.0.0.1:{PORT}",
+                   "--workers", str(workers), "--log-level", "warning"]
+    else:
+        command = ["uvicorn", "app:app", "--port", str(PORT), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen([sys.executable, "-m"] + command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def _wait_until_loaded(server, workers, loading_processes, timeout=300):
+    # Every worker prints one line when it has loaded the data (with --preload, only the main process loads it)
+    loaded = 0
+    deadline = time.monotonic() + timeout
+    while loaded < loading_processes and time.monotonic() < deadline:
+        line = server.stdout.readline()
+        if not line:
+            raise RuntimeError(f"The server stopped before all workers loaded the data:\n{server.stdout.read()}")
+        loaded += line.count("Loaded data successfully")
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{PORT}/", timeout=30).read()
+            # The main process and the workers (uvicorn runs a single worker in the main process)
+            if len(_process_tree(server.pid)) >= (workers + 1 if workers > 1 else 1):
+                return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("The server did not start in time.")
+
+
+def measure(workers, mode):
+    start = time.perf_counter()
+    server = _start_server(workers, mode)
+    try:
+        _wait_until_loaded(server, workers, loading_processes=1 if mode == "preload" else workers)
+        startup = time.perf_counter() - start
+        memory = [_memory_kib(pid) for pid in _process_tree(server.pid)]
+        return startup, sum(rss for rss, _ in memory) / 1024, sum(pss for _, pss in memory) / 1024
+    finally:
+        server.terminate()
+        server.wait()
+
+
+MODES = {
+    "parquet": "uvicorn, Parquet per worker",
+    "shared": "uvicorn, shared column arrays",
+    "preload": "gunicorn --preload, shared",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    modes = list(MODES)
+    if importlib.util.find_spec("gunicorn") is None:
+        print("gunicorn is not installed, skipping the --preload mode.")
+        modes.remove("preload")
+    for workers in args.workers:
+        for mode in modes:
+            startup, rss, pss = measure(workers, mode)
+            print(f"{workers} workers, {MODES[mode]:<30}  ready after {startup:5.1f} s   total RSS {rss:6.0f} MiB   total PSS {pss:6.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
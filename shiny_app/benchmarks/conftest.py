@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+# The `bench` fixture of the microbenchmarks (benchmarks/microbenchmarks.py), in the style of pytest-benchmark:
+# bench(function, *args) calls the function repeatedly and records its timings under the name of the test.
+# Run from the shiny_app directory: python -m pytest benchmarks/microbenchmarks.py
+#   BENCHMARK_SAVE=<file.json>      store the results, e.g. as the baseline of a later run
+#   BENCHMARK_BASELINE=<file.json>  fail benchmarks whose median is slower than the baseline by more than
+#                                   BENCHMARK_TOLERANCE (default 0.5, i.e. 50 %)
+MIN_ROUNDS = 5
+MAX_ROUNDS = 10_000
+MIN_TIME = 0.2
+
+_results = {}
+
+
+def _statistics(timings):
+    timings_ms = np.array(timings) * 1000
+    return {
+        "rounds": len(timings_ms),
+        "min_ms": float(timings_ms.min()),
+        "median_ms": float(np.median(timings_ms)),
+        "mean_ms": float(timings_ms.mean()),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+    }
+
+
+@pytest.fixture
+def bench(request):
+    baseline_file = os.environ.get("BENCHMARK_BASELINE")
+    baseline = json.loads(open(baseline_file).read()) if baseline_file else {}
+    tolerance = float(os.environ.get("BENCHMARK_TOLERANCE", "0.5"))
+
+    def run(function, *args, **kwargs):
+        # One call to warm up (and for the result), then at least MIN_ROUNDS calls and MIN_TIME seconds
+        result = function(*args, **kwargs)
+        timings = []
+        deadline = time.perf_counter() + MIN_TIME
+        while len(timings) < MIN_ROUNDS or (time.perf_counter() < deadline and len(timings) < MAX_ROUNDS):
+            start = time.perf_counter()
+            function(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+        statistics = _results[request.node.name] = _statistics(timings)
+
+        if request.node.name in baseline:
+            limit = baseline[request.node.name]["median_ms"] * (1 + tolerance)
+            if statistics["median_ms"] > limit:
+                pytest.fail(f"{request.node.name}: median {statistics['median_ms']:.3f} ms is slower than the baseline "
+                            f"{baseline[request.node.name]['median_ms']:.3f} ms (+{tolerance:.0%})")
+        return result
+
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(f"{'name':<40} {'rounds':>7} {'min':>11} {'median':>11} {'mean':>11} {'p99':>11}")
+    for name, statistics in sorted(_results.items()):
+        terminalreporter.write_line(f"{name:<40} {statistics['rounds']:>7} {statistics['min_ms']:>8.3f} ms {statistics['median_ms']:>8.3f} ms "
+                                    f"{statistics['mean_ms']:>8.3f} ms {statistics['p99_ms']:>8.3f} ms")
+
+
+def pytest_sessionfinish(session):
+    if _results and os.environ.get("BENCHMARK_SAVE"):
+        with open(os.environ["BENCHMARK_SAVE"], "w") as f:
+            json.dump(_results, f, indent=2, sort_keys=True)
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+import websockets
+
+from benchmarks.synthetic_data import write_synthetic_snapshot
+from cost_model import DEDUCTIBLE_ADULT_LVL_TO_AMOUNT, DEDUCTIBLE_CHILD_LVL_TO_AMOUNT
+
+# Load test of the running app: many concurrent simulated sessions, each going through the calculator like a user
+# (open the page, search a municipality, calculate the offers, select a plan to draw its plot) over the websocket
+# protocol of Shiny. Reports the p50/p99 latency of every step and the throughput.
+#   python -m benchmarks.load_test --start-server                 start the app on a synthetic snapshot and test it
+#   python -m benchmarks.load_test --url http://127.0.0.1:8000    test a server that is already running
+# With --max-p99-ms, the exit code is 1 if the p99 latency of a step is higher (to gate changes in CI).
+# The sessions of a multi-worker server need sticky routing (see README), as with real browsers.
+STEPS = ["open_page", "show_inputs", "search_municipality", "calculate_offers", "show_results", "select_plan"]
+TIMEOUT = 60
+
+
+async def _receive_until(ws, done):
+    # Reads the messages of the server until done(message) is true for one of them.
+    async def receive():
+        while True:
+            message = json.loads(await ws.recv())
+            if message.get("errors"):
+                raise RuntimeError(f"Output errors: {message['errors']}")
+            if done(message):
+                return message
+
+    return await asyncio.wait_for(receive(), TIMEOUT)
+
+
+async def _wait_for_outputs(ws, outputs):
+    # Waits until the server sent new values of all the outputs
+    missing = set(outputs)
+
+    def done(message):
+        missing.difference_update(message.get("values", {}))
+        return not missing
+
+    await _receive_until(ws, done)
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        return json.loads(response.read())
+
+
+async def run_session(base_url, rng, latencies):
+    """One simulated user. Records the seconds of every step in `latencies`."""
+    async def step(name, coroutine):
+        start = time.perf_counter()
+        result = await coroutine
+        latencies[name].append(time.perf_counter() - start)
+        return result
+
+    websocket_url = base_url.replace("http://", "ws://", 1).rstrip("/") + "/websocket/"
+    async with websockets.connect(websocket_url, max_size=None) as ws:
+        await ws.send(json.dumps({"method": "init", "data": {".clientdata_output_dynamic_page_hidden": False, ".clientdata_url_search": ""}}))
+        await step("open_page", _wait_for_outputs(ws, ["dynamic_page"]))
+
+        # The location input gets the URL of its search from the server once it is shown
+        await ws.send(json.dumps({"method": "update", "data": {
+            "birth_year": None, "accident_insurance": "OHN-UNF", "location": "", "calculate_offers:shiny.action": 0,
+            "household_mode:shiny.action": 0,
+            ".clientdata_output_municipality_select_hidden": False, ".clientdata_output_deductible_select_hidden": False,
+            ".clientdata_output_input_errors_display_hidden": False,
+        }}))
+        message = await step("show_inputs", _receive_until(ws, lambda message: any(
+            input_message["id"] == "location" and "url" in input_message["message"] for input_message in message.get("inputMessages", []))))
+        search_url = next(input_message["message"]["url"] for input_message in message["inputMessages"] if input_message["id"] == "location")
+
+        query = urllib.parse.quote(str(rng.choice(["1", "2", "3", "ort 1", "gemeinde 2", "8"])))
+        options = await step("search_municipality", asyncio.to_thread(_get, f"{base_url.rstrip('/')}/{search_url}&query={query}&maxop=50"))
+        location = options[rng.integers(len(options))]["value"]
+
+        birth_year = int(rng.integers(1940, 2025))
+        deductibles = DEDUCTIBLE_CHILD_LVL_TO_AMOUNT if birth_year >= 2008 else DEDUCTIBLE_ADULT_LVL_TO_AMOUNT
+        await ws.send(json.dumps({"method": "update", "data": {
+            "birth_year": birth_year, "location": location, "deductible": str(rng.choice(list(deductibles))),
+            "accident_insurance": str(rng.choice(["MIT-UNF", "OHN-UNF"])), "calculate_offers:shiny.action": 1,
+        }}))
+        await step("calculate_offers", _wait_for_outputs(ws, ["dynamic_page"]))
+
+        await ws.send(json.dumps({"method": "update", "data": {
+            ".clientdata_output_insurance_table_hidden": False, ".clientdata_output_deductibles_comparison_plot_hidden": False,
+            ".clientdata_output_calculate_annual_cost_table_hidden": False, ".clientdata_output_optimal_deductible_table_hidden": False,
+            ".clientdata_output_simulation_table_hidden": False, ".clientdata_output_deductibles_comparison_plot_width": 800,
+            ".clientdata_output_deductibles_comparison_plot_height": 500, ".clientdata_pixelratio": 1,
+            "simulation_zero_share": 15, "simulation_median": 800, "simulation_spread": "1.2", "simulation_all_plans": False,
+        }}))
+        await step("show_results", _wait_for_outputs(ws, ["insurance_table", "optimal_deductible_table"]))
+
+        await ws.send(json.dumps({"method": "update", "data": {"insurance_table_selected_rows": [int(rng.integers(0, 5))]}}))
+        await step("select_plan", _wait_for_outputs(ws, ["deductibles_comparison_plot", "calculate_annual_cost_table"]))
+
+
+async def run_load_test(base_url, sessions, concurrency, seed=0):
+    latencies = {name: [] for name in STEPS}
+    failures = []
+    semaphore = asyncio.Semaphore(concurrency)
+    rngs = [np.random.default_rng(seed_sequence) for seed_sequence in np.random.SeedSequence(seed).spawn(sessions)]
+
+    async def limited(rng):
+        async with semaphore:
+            try:
+                await run_session(base_url, rng, latencies)
+            except Exception as e:
+                failures.append(e)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(rng) for rng in rngs))
+    return latencies, failures, time.perf_counter() - start
+
+
+def _start_server(port, data_dir, workers):
+    env = dict(os.environ, HEALTH_INSURANCE_DATA_DIR=str(data_dir), PYTHONUNBUFFERED="1")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        try:
+            # Ready once the data is loaded
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=5).read()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("The server stopped while starting.")
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("The server did not start in time.")
+
+
+def report(latencies, failures, seconds, sessions):
+    print(f"{'step':<22} {'count':>6} {'p50':>11} {'p99':>11} {'max':>11}")
+    for name in STEPS:
+        if latencies[name]:
+            latencies_ms = np.array(latencies[name]) * 1000
+            print(f"{name:<22} {len(latencies_ms):>6} {np.percentile(latencies_ms, 50):>8.1f} ms {np.percentile(latencies_ms, 99):>8.1f} ms "
+                  f"{latencies_ms.max():>8.1f} ms")
+    completed = sessions - len(failures)
+    print(f"{completed} of {sessions} sessions completed in {seconds:.1f} s: {completed / seconds:.1f} sessions/s, "
+          f"{sum(len(values) for values in latencies.values()) / seconds:.1f} steps/s")
+    for failure in failures[:5]:
+        print(f"failed: {failure!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the app with concurrent simulated sessions.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="base URL of the app")
+    parser.add_argument("--start-server", action="store_true", help="start the app on a synthetic snapshot (on the port of --url)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the started server")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions running at the same time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="fail if the p99 latency of a step is higher")
+    args = parser.parse_args()
+
+    server, data_dir = None, None
+    try:
+        if args.start_server:
+            data_dir = tempfile.mkdtemp(prefix="health_insurance_load_test_")
+            write_synthetic_snapshot(data_dir)
+            server = _start_server(int(args.url.rsplit(":", 1)[1].strip("/")), data_dir, args.workers)
+        latencies, failures, seconds = asyncio.run(run_load_test(args.url, args.sessions, args.concurrency, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report(latencies, failures, seconds, args.sessions)
+    slow_steps = [name for name in STEPS if latencies[name] and args.max_p99_ms is not None
+                  and np.percentile(latencies[name], 99) * 1000 > args.max_p99_ms]
+    if failures or slow_steps:
+        print(f"Failed: {len(failures)} failed sessions, p99 above {args.max_p99_ms} ms: {', '.join(slow_steps) or '-'}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
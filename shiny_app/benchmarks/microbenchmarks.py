@@ -0,0 +1,158 @@
+from itertools import cycle
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import write_synthetic_snapshot
+from breakeven import optimal_deductible_intervals, optimal_level_at
+from cost_model import (
+    DEDUCTIBLE_ADULT_LVL_TO_AMOUNT,
+    annual_costs_health_insurance,
+    calculate_annual_cost_health_insurance,
+    deductible_amounts_for_persons,
+)
+from data_loading import read_snapshot
+from household import HouseholdMember, HouseholdOptimizer
+from municipality_search import MunicipalitySearchIndex, build_municipality_choices
+from offers import OfferFinder
+from plot_rendering import deductibles_comparison_figure, render_png
+from precompute import optimal_deductibles_for_profile
+from premium_index import DEDUCTIBLE_LEVEL_KEYS, OFFER_KEYS, PremiumIndex
+from simulation import ZeroInflatedLognormal, simulate_annual_costs
+
+# Microbenchmarks of the request path of the app, on a synthetic snapshot with the size of the real data
+# (benchmarks/synthetic_data.py), loaded like the app loads it. The `bench` fixture is defined in benchmarks/conftest.py.
+# Run from the shiny_app directory: python -m pytest benchmarks/microbenchmarks.py
+N_PROFILES = 200
+
+
+class Synthetic(NamedTuple):
+    premiums_df: pd.DataFrame
+    offer_finder: OfferFinder
+    # Profiles of calculate_data: (BFS-Nr., Kanton, Region, Altersklasse, Franchisestufe, Unfalleinschluss)
+    profiles: list
+    deductible_levels_index: PremiumIndex
+    household_optimizer: HouseholdOptimizer
+    municipality_search_index: MunicipalitySearchIndex
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("synthetic_data")
+    write_synthetic_snapshot(data_dir)
+    datasets = read_snapshot(data_dir=data_dir)
+    premiums_df = datasets.premiums
+    premiums_df['Versicherung'] = premiums_df['Versicherer'].astype(str).astype('category')
+    offer_finder = OfferFinder(premiums_df, datasets.insurance_model_restrictions)
+
+    rng = np.random.default_rng(0)
+    municipalities = datasets.premium_regions[['BFS-Nr.', 'Kanton', 'Region']].drop_duplicates('BFS-Nr.').to_numpy()
+    profile_keys = premiums_df[['Altersklasse', 'Franchisestufe', 'Unfalleinschluss']].drop_duplicates().to_numpy()
+    profiles = [(int(bfs_nr), canton, region, *profile_keys[rng.integers(len(profile_keys))])
+                for bfs_nr, canton, region in municipalities[rng.integers(0, len(municipalities), N_PROFILES)]]
+    return Synthetic(
+        premiums_df=premiums_df,
+        offer_finder=offer_finder,
+        profiles=profiles,
+        deductible_levels_index=PremiumIndex(premiums_df, DEDUCTIBLE_LEVEL_KEYS),
+        household_optimizer=HouseholdOptimizer(offer_finder),
+        municipality_search_index=MunicipalitySearchIndex(build_municipality_choices(datasets.premium_regions)),
+    )
+
+
+def _selected_plan(synthetic):
+    # The deductible levels of the cheapest plan of the first profile, like after a click into the insurance table
+    row = synthetic.offer_finder.offers(*synthetic.profiles[0]).iloc[0]
+    levels = synthetic.deductible_levels_index.lookup(
+        (row['Versicherer'], row['Tarif'], row['Unfalleinschluss'], row['Kanton'], row['Region'], row['Altersklasse']))
+    premium_amounts = levels['Prämie'].to_numpy(dtype=float)
+    deductible_amounts = deductible_amounts_for_persons(levels['Franchisestufe'], levels['Altersklasse'])
+    return premium_amounts, deductible_amounts
+
+
+def test_annual_costs_scalar(bench):
+    assert bench(calculate_annual_cost_health_insurance, 1500, 350.0, 1000) == pytest.approx(5250.0)
+
+
+def test_annual_costs_plot_curve(bench):
+    treatment_costs = np.linspace(0, 10000, 1000)
+    deductibles = np.array(list(DEDUCTIBLE_ADULT_LVL_TO_AMOUNT.values()), dtype=float)
+    costs = bench(annual_costs_health_insurance, treatment_costs[np.newaxis, :], (420.0 - deductibles * 0.06)[:, np.newaxis], deductibles[:, np.newaxis])
+    assert costs.shape == (6, 1000)
+
+
+def test_calculate_data(bench, synthetic):
+    profiles = cycle(synthetic.profiles)
+    offers = bench(lambda: synthetic.offer_finder.offers(*next(profiles)))
+    assert offers['Prämie'].is_monotonic_increasing
+
+
+def test_offer_index_lookup(bench, synthetic):
+    keys = cycle([(canton, f"PR-REG CH{region}", *profile) for _, canton, region, *profile in synthetic.profiles])
+    assert len(bench(lambda: synthetic.offer_finder.offers_index.offsets(next(keys)))) > 0
+    assert synthetic.offer_finder.offers_index.keys == OFFER_KEYS
+
+
+def test_restriction_filter(bench, synthetic):
+    offer_finder = synthetic.offer_finder
+    bfs_nr, canton, region, *_ = synthetic.profiles[0]
+    # All offers of the region (every age class and deductible level)
+    offsets = np.flatnonzero((synthetic.premiums_df['Kanton'] == canton).to_numpy() & (synthetic.premiums_df['Region'] == f"PR-REG CH{region}").to_numpy())
+    available = bench(offer_finder.restrictions.is_available, offer_finder.restricted_plan_ids[offsets], bfs_nr)
+    assert 0 < available.sum() <= len(offsets)
+
+
+def test_insurance_table(bench, synthetic):
+    offers = synthetic.offer_finder.offers(*synthetic.profiles[0])
+    table = bench(lambda: offers[['Versicherung', 'Tarifbezeichnung', 'Prämie']].astype({'Prämie': float}).round({'Prämie': 2}))
+    assert len(table) == len(offers)
+
+
+def test_annual_cost_table(bench, synthetic):
+    premium_amounts, deductible_amounts = _selected_plan(synthetic)
+    treatment_costs = [0, 300, 500, 1000, 1500, 2000, 3000, 5000, 10000]
+
+    def annual_cost_table():
+        # Like calculate_annual_cost_table in app.py
+        intervals = optimal_deductible_intervals(premium_amounts, deductible_amounts)
+        annual_costs = annual_costs_health_insurance(np.array(treatment_costs)[np.newaxis, :], premium_amounts[:, np.newaxis], deductible_amounts[:, np.newaxis])
+        result_df = pd.DataFrame({"Treatment Costs during the year": [f"{treatment_cost} CHF" for treatment_cost in treatment_costs]})
+        for deductible_amount, annual_costs_for_deductible in zip(deductible_amounts, annual_costs):
+            result_df[f"{deductible_amount} CHF Deductible"] = [f"{annual_cost:.2f} CHF" for annual_cost in annual_costs_for_deductible]
+        result_df["Cheapest Deductible"] = [f"{deductible_amounts[level]} CHF" for level in optimal_level_at(intervals, treatment_costs)]
+        return result_df
+
+    assert len(bench(annual_cost_table)) == len(treatment_costs)
+
+
+def test_deductibles_comparison_plot(bench, synthetic):
+    premium_amounts, deductible_amounts = _selected_plan(synthetic)
+    crossover_points = [interval.start for interval in optimal_deductible_intervals(premium_amounts, deductible_amounts)[1:]]
+    png = bench(lambda: render_png(deductibles_comparison_figure("Benchmark", premium_amounts, deductible_amounts, crossover_points)))
+    assert png.startswith(b"\x89PNG")
+
+
+def test_optimal_deductibles_for_profile(bench, synthetic):
+    bfs_nr, canton, region, age_class, _, accident_insurance = synthetic.profiles[0]
+    optimal = bench(optimal_deductibles_for_profile, synthetic.offer_finder, bfs_nr, canton, region, age_class, accident_insurance)
+    assert (optimal['offset'] >= 0).all()
+
+
+def test_household_configurations(bench, synthetic):
+    bfs_nr, canton, region, *_ = synthetic.profiles[0]
+    members = [HouseholdMember('AKL-ERW', 'OHN-UNF', 800), HouseholdMember('AKL-ERW', 'OHN-UNF', 3000), HouseholdMember('AKL-KIN', 'MIT-UNF', 200)]
+    configurations = bench(synthetic.household_optimizer.cheapest_configurations, bfs_nr, canton, region, members)
+    assert not configurations.empty
+
+
+def test_simulation(bench):
+    premiums, deductibles = np.array([400.0, 350.0, 300.0]), np.array([300.0, 1000.0, 2500.0])
+    simulated = bench(simulate_annual_costs, ZeroInflatedLognormal(0.15, 800, 1.2), premiums, deductibles, n_samples=100_000)
+    assert len(simulated) == 3
+
+
+def test_municipality_search(bench, synthetic):
+    queries = cycle(["ort 1", "gemeinde 12", "8", "ort 2-0"])
+    assert bench(lambda: synthetic.municipality_search_index.selectize_options(next(queries)))
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from data_loading import write_snapshot
+
+# Synthetic premiums, premium regions and restrictions tables with roughly the size and structure of the
+# real BAG/priminfo data (in the format of a data snapshot), so benchmarks can run offline and are reproducible.
+
+# Canton -> number of premium regions
+CANTON_REGIONS = {
+    "ZH": 3, "BE": 3, "LU": 3, "UR": 1, "SZ": 1, "OW": 1, "NW": 1, "GL": 1, "ZG": 1, "FR": 2, "SO": 1, "BS": 1, "BL": 2,
+    "SH": 2, "AR": 1, "AI": 1, "SG": 3, "GR": 3, "AG": 2, "TG": 1, "TI": 2, "VD": 2, "VS": 2, "NE": 1, "GE": 1, "JU": 1,
+}
+DEDUCTIBLES = {
+    "AKL-KIN": {"FRAST1": 0, "FRAST2": 100, "FRAST3": 200, "FRAST4": 300, "FRAST5": 400, "FRAST6": 500, "FRAST7": 600},
+    "AKL-JUG": {"FRAST1": 300, "FRAST2": 500, "FRAST3": 1000, "FRAST4": 1500, "FRAST5": 2000, "FRAST6": 2500},
+    "AKL-ERW": {"FRAST1": 300, "FRAST2": 500, "FRAST3": 1000, "FRAST4": 1500, "FRAST5": 2000, "FRAST6": 2500},
+}
+AGE_FACTORS = {"AKL-KIN": 0.25, "AKL-JUG": 0.75, "AKL-ERW": 1.0}
+TARIFFS = [("BASE", "TAR-BASE", "Standard"), ("HAM1", "TAR-HAM", "Hausarzt"), ("HMO1", "TAR-HMO", "HMO"), ("DIV1", "TAR-DIV", "Telmed")]
+INSURERS = [8, 32, 134, 194, 246, 290, 312, 343, 360, 376, 455, 509, 780, 820, 829, 881, 901, 923, 941, 966,
+            1040, 1113, 1318, 1322, 1384, 1386, 1401, 1479, 1507, 1509, 1535, 1542, 1555, 1560, 1562, 1568, 1570]
+MUNICIPALITIES_PER_REGION = 45
+PLZ_PER_MUNICIPALITY = 1.5
+
+
+def synthetic_premium_regions(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    bfs_nr = 1
+    for canton, n_regions in CANTON_REGIONS.items():
+        for region in range(1, n_regions + 1):
+            for _ in range(MUNICIPALITIES_PER_REGION):
+                n_plz = max(1, rng.poisson(PLZ_PER_MUNICIPALITY))
+                for i in range(n_plz):
+                    plz = int(rng.integers(1000, 9700))
+                    rows.append({"Kanton": canton, "Region": region, "Gemeinde": f"Gemeinde {bfs_nr}", "BFS-Nr.": bfs_nr,
+                                 "PLZ": plz, "Ort": f"Ort {bfs_nr}-{i}"})
+                bfs_nr += 1
+    return pd.DataFrame(rows)
+
+
+def synthetic_premiums(seed=0):
+    rng = np.random.default_rng(seed)
+    regions = [(canton, region) for canton, n_regions in CANTON_REGIONS.items() for region in range(1, n_regions + 1)]
+    age_deductibles = [(age_class, level, amount) for age_class, levels in DEDUCTIBLES.items() for level, amount in levels.items()]
+    n = len(INSURERS) * len(TARIFFS) * len(regions) * len(age_deductibles) * 2
+
+    insurer_idx, tariff_idx, region_idx, age_idx, accident_idx = np.unravel_index(
+        np.arange(n), (len(INSURERS), len(TARIFFS), len(regions), len(age_deductibles), 2))
+
+    insurer_level = rng.uniform(320, 520, len(INSURERS))
+    tariff_discount = np.array([1.0, 0.9, 0.85, 0.88])
+    region_level = rng.uniform(0.8, 1.15, len(regions))
+    age_factor = np.array([AGE_FACTORS[age_class] for age_class, _, _ in age_deductibles])
+    deductible_amount = np.array([amount for _, _, amount in age_deductibles])
+    deductible_discount = np.where(age_factor < 0.5, 0.06, 0.075) * deductible_amount
+
+    premium = insurer_level[insurer_idx] * tariff_discount[tariff_idx] * region_level[region_idx] * age_factor[age_idx]
+    premium = premium - deductible_discount[age_idx] * rng.uniform(0.7, 1.0, n) / 12 * 10
+    premium = premium * np.where(accident_idx == 0, 1.07, 1.0)
+
+    return pd.DataFrame({
+        "Versicherer": np.array(INSURERS)[insurer_idx],
+        "Kanton": np.array([canton for canton, _ in regions])[region_idx],
+        "Region": np.array([f"PR-REG CH{region}" for _, region in regions])[region_idx],
+        "Geschäftsjahr": 2026,
+        "Erhebungsjahr": 2025,
+        "Altersklasse": np.array([age_class for age_class, _, _ in age_deductibles])[age_idx],
+        "Unfalleinschluss": np.array(["MIT-UNF", "OHN-UNF"])[accident_idx],
+        "Tarif": np.array([tarif for tarif, _, _ in TARIFFS])[tariff_idx],
+        "Tariftyp": np.array([tariftyp for _, tariftyp, _ in TARIFFS])[tariff_idx],
+        "Franchisestufe": np.array([level for _, level, _ in age_deductibles])[age_idx],
+        "Franchise": np.array([f"FRA-{amount}" for _, _, amount in age_deductibles])[age_idx],
+        "Prämie": np.round(np.maximum(premium, 20.0), 2),
+        "Tarifbezeichnung": np.array([name for _, _, name in TARIFFS])[tariff_idx],
+    })
+
+
+def synthetic_insurance_model_restrictions(premium_regions_df, seed=0, restricted_share=0.3):
+    # A share of the non-standard tariffs is only available in a random subset of the municipalities of a region.
+    rng = np.random.default_rng(seed)
+    municipalities = premium_regions_df.groupby(["Kanton", "Region"])["BFS-Nr."].unique()
+    rows = []
+    for (canton, region), bfs_nrs in municipalities.items():
+        for insurer in INSURERS:
+            for tarif, tariftyp, _ in TARIFFS[1:]:
+                if rng.random() < restricted_share:
+                    allowed = rng.choice(bfs_nrs, size=max(1, len(bfs_nrs) // 3), replace=False)
+                    rows.append({"Versicherer": insurer, "Kanton": canton, "Region": f"PR-REG CH{region}", "Tarif": tarif,
+                                 "Tariftyp": tariftyp, "Eingeschränkt": "Y", "Gemeinden-BFS": ",".join(str(b) for b in sorted(allowed))})
+    return pd.DataFrame(rows)
+
+
+def synthetic_tables(seed=0):
+    premium_regions_df = synthetic_premium_regions(seed)
+    return {
+        "premiums": synthetic_premiums(seed),
+        "premium_regions": premium_regions_df,
+        "insurance_model_restrictions": synthetic_insurance_model_restrictions(premium_regions_df, seed),
+    }
+
+
+def write_synthetic_snapshot(data_dir, seed=0):
+    """Write the synthetic tables as the current data snapshot in data_dir, e.g. to run the app on them."""
+    return write_snapshot(synthetic_tables(seed), {"synthetic": {"seed": seed}}, data_dir=data_dir)
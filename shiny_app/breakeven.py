@@ -0,0 +1,158 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from cost_model import (
+    DECIMAL_AFTER_DEDUCTIBLE,
+    MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE,
+    annual_costs_health_insurance,
+    deductible_amounts_for_persons,
+)
+
+# The annual costs of one deductible level are piecewise linear in the treatment costs x:
+#   x <= deductible:                      12 * premium + x                            (slope 1)
+#   deductible < x <= deductible + 7000:  12 * premium + deductible + 10% of the rest  (slope 0.1)
+#   x > deductible + 7000:                12 * premium + deductible + 700              (slope 0)
+# So instead of sampling the treatment costs, we can compute the lower envelope of all deductible levels exactly:
+# between two consecutive kinks every cost function is a line, and the cheapest level can only change
+# where two of these lines intersect.
+COST_SHARE_CAP_REACHED_AFTER = MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE / DECIMAL_AFTER_DEDUCTIBLE
+
+# One group of deductible levels that can be compared with each other.
+PLAN_GROUP_KEYS = ['Kanton', 'Region', 'Versicherer', 'Tarif', 'Tariftyp', 'Altersklasse', 'Unfalleinschluss']
+
+
+class OptimalDeductibleInterval(NamedTuple):
+    start: float  # treatment costs (CHF) from which on this deductible level is the cheapest
+    end: float  # np.inf for the last interval
+    level: int  # index into the premiums/deductibles the intervals were calculated for
+
+
+# Number of plan groups that are solved together in crossover_table. Limits the size of the intermediate arrays.
+BULK_CHUNK_SIZE = 2048
+
+
+def _slopes(x, deductible_amounts):
+    # Slope of every cost function right after x.
+    return np.where(x < deductible_amounts, 1.0, np.where(x < deductible_amounts + COST_SHARE_CAP_REACHED_AFTER, DECIMAL_AFTER_DEDUCTIBLE, 0.0))
+
+
+def _lower_envelope(premiums_per_month, deductible_amounts):
+    # Solves many groups at once. Both arguments have the shape (groups, levels); levels that don't exist in a
+    # group must have an infinite premium. Returns the sorted candidate points (NaN padded) and, for the
+    # interval that starts at every point, the index of the cheapest level if it differs from the previous interval
+    # (-1 otherwise).
+    n_groups, n_levels = premiums_per_month.shape
+    kinks = np.sort(np.concatenate([np.zeros((n_groups, 1)), deductible_amounts, deductible_amounts + COST_SHARE_CAP_REACHED_AFTER], axis=1), axis=1)
+    kink_ends = np.concatenate([kinks[:, 1:], np.full((n_groups, 1), np.inf)], axis=1)
+    first, second = np.triu_indices(n_levels, 1)
+
+    candidates = [kinks]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(kinks.shape[1]):
+            start, end = kinks[:, k:k + 1], kink_ends[:, k:k + 1]
+            slopes = _slopes(start, deductible_amounts)
+            intercepts = annual_costs_health_insurance(start, premiums_per_month, deductible_amounts) - slopes * start
+            # Intersections of every pair of lines within this interval
+            intersections = (intercepts[:, second] - intercepts[:, first]) / (slopes[:, first] - slopes[:, second])
+            candidates.append(np.where((intersections > start) & (intersections < end), intersections, np.nan))
+    points = np.sort(np.concatenate(candidates, axis=1), axis=1)
+    # Most pairs don't intersect, drop the columns that are NaN in every group.
+    points = points[:, :np.max(np.sum(~np.isnan(points), axis=1))]
+
+    # The cheapest level is constant between two consecutive candidate points, so one evaluation per interval is enough.
+    next_points = np.concatenate([points[:, 1:], np.full((n_groups, 1), np.nan)], axis=1)
+    ends = np.where(np.isnan(next_points), np.inf, next_points)
+    probes = np.where(np.isinf(ends), points + 1.0, (points + ends) / 2)
+    with np.errstate(invalid='ignore'):
+        costs = annual_costs_health_insurance(probes[:, np.newaxis, :], premiums_per_month[:, :, np.newaxis], deductible_amounts[:, :, np.newaxis])
+        cheapest = np.argmin(np.where(np.isnan(costs), np.inf, costs), axis=1)
+        valid = ~np.isnan(points) & (ends > points)
+
+    # Only keep the points where the cheapest level changes.
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(points.shape[1]), 0), axis=1)
+    filled_levels = np.where(valid[np.arange(n_groups)[:, np.newaxis], last_valid], np.take_along_axis(cheapest, last_valid, axis=1), -1)
+    previous_levels = np.concatenate([np.full((n_groups, 1), -1), filled_levels[:, :-1]], axis=1)
+    levels = np.where(valid & (cheapest != previous_levels), cheapest, -1)
+    return points, levels
+
+
+def _intervals(points, levels):
+    changes = levels >= 0
+    starts, levels = points[changes].tolist(), levels[changes].tolist()
+    return [OptimalDeductibleInterval(start, end, level) for start, end, level in zip(starts, starts[1:] + [np.inf], levels)]
+
+
+def optimal_deductible_intervals(premiums_per_month, deductible_amounts):
+    """The cheapest deductible level for every range of treatment costs.
+
+    Returns a list of OptimalDeductibleInterval that covers [0, inf). If several levels cost exactly the same
+    over a whole interval, the one that comes first in the given arrays is chosen. Empty if there are no levels.
+    """
+    if len(premiums_per_month) == 0:
+        return []
+    points, levels = _lower_envelope(np.asarray(premiums_per_month, dtype=float)[np.newaxis, :],
+                                     np.asarray(deductible_amounts, dtype=float)[np.newaxis, :])
+    return _intervals(points[0], levels[0])
+
+
+def optimal_level_at(intervals, treatment_costs):
+    """The cheapest level for each of the given treatment costs."""
+    starts = np.array([interval.start for interval in intervals])
+    levels = np.array([interval.level for interval in intervals])
+    return levels[np.searchsorted(starts, np.asarray(treatment_costs, dtype=float), side='right') - 1]
+
+
+def crossover_table(premiums_df):
+    """Solve every plan/region/age class/accident group of the premiums table.
+
+    For every group, the result contains the sequence of optimal deductibles with increasing treatment costs,
+    the treatment costs up to which the highest deductible is the cheapest and the treatment costs from which
+    on the lowest deductible is the cheapest (NaN if it never is).
+    """
+    grouped = premiums_df.groupby(PLAN_GROUP_KEYS, sort=False, observed=True, dropna=False)
+    group_ids = grouped.ngroup().to_numpy()
+    level_ids = grouped.cumcount().to_numpy()
+    n_groups, n_levels = group_ids.max() + 1, level_ids.max() + 1
+
+    # One row per group, one column per deductible level of the group
+    premiums = np.full((n_groups, n_levels), np.inf)
+    deductibles = np.zeros((n_groups, n_levels))
+    premiums[group_ids, level_ids] = premiums_df['Prämie'].to_numpy(dtype=float)
+    deductibles[group_ids, level_ids] = deductible_amounts_for_persons(premiums_df['Franchisestufe'], premiums_df['Altersklasse'])
+    exists = np.isfinite(premiums)
+    lowest_level = np.argmin(np.where(exists, deductibles, np.inf), axis=1)
+    highest_level = np.argmax(np.where(exists, deductibles, -np.inf), axis=1)
+
+    optimal_deductibles, highest_until, lowest_from = [], [], []
+    for chunk_start in range(0, n_groups, BULK_CHUNK_SIZE):
+        chunk = slice(chunk_start, chunk_start + BULK_CHUNK_SIZE)
+        points, levels = _lower_envelope(premiums[chunk], deductibles[chunk])
+        for group_deductibles, group_points, group_levels, lowest, highest in zip(
+                deductibles[chunk], points, levels, lowest_level[chunk], highest_level[chunk]):
+            intervals = _intervals(group_points, group_levels)
+            optimal_deductibles.append(" > ".join(f"{group_deductibles[interval.level]:.0f}" for interval in intervals))
+            highest_until.append(intervals[0].end if intervals[0].level == highest else 0.0)
+            lowest_from.append(next((interval.start for interval in intervals if interval.level == lowest), np.nan))
+
+    result = premiums_df[PLAN_GROUP_KEYS].drop_duplicates().reset_index(drop=True)
+    result['Optimal deductibles'] = optimal_deductibles
+    result['Highest deductible optimal until'] = highest_until
+    result['Lowest deductible optimal from'] = lowest_from
+    return result
+
+
+if __name__ == "__main__":
+    # Check the rule of thumb from the README for the whole country: with treatment costs above ~2000 CHF,
+    # the lowest deductible is the cheapest, below that the highest deductible.
+    from data_loading import load_datasets
+
+    table = crossover_table(load_datasets().premiums)
+    adults = table[table['Altersklasse'] == 'AKL-ERW']
+    critical_points = adults['Lowest deductible optimal from']
+    print(f"{len(adults)} adult plan groups")
+    print(f"Lowest deductible never optimal: {critical_points.isna().sum()}")
+    print("Treatment costs from which on the lowest deductible is optimal (CHF):")
+    print(critical_points.describe(percentiles=[0.05, 0.25, 0.5, 0.75, 0.95]).round(0).to_string())
+    print("Most common sequences of optimal deductibles:")
+    print(adults['Optimal deductibles'].value_counts().head(10).to_string())
@@ -0,0 +1,129 @@
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The tests run offline: before the test modules are imported (data_loading reads the data directory on import),
+# we point the data directory to a temporary directory, unless it is set already, and remove it after the run.
+# The snapshot in it is built from small fixture files with the same format as the upstream files, but only by the
+# `snapshot_dir` fixture, so tests that don't need data don't import pandas or write files.
+_temporary_data_dir = None
+
+
+def pytest_configure(config):
+    global _temporary_data_dir
+    if "HEALTH_INSURANCE_DATA_DIR" not in os.environ:
+        _temporary_data_dir = tempfile.mkdtemp(prefix="health_insurance_test_data_")
+        os.environ["HEALTH_INSURANCE_DATA_DIR"] = _temporary_data_dir
+
+
+def pytest_unconfigure(config):
+    if _temporary_data_dir is not None:
+        shutil.rmtree(_temporary_data_dir, ignore_errors=True)
+        del os.environ["HEALTH_INSURANCE_DATA_DIR"]
+
+FIXTURE_INSURERS = {8: 250.0, 1509: 240.0, 1384: 260.0}
+FIXTURE_TARIFFS = [("BASE", "TAR-BASE", "Standard"), ("HMO1", "TAR-HMO", "HMO Zürich")]
+FIXTURE_AGE_CLASSES = {
+    "AKL-KIN": {"FRAST1": 0, "FRAST2": 100, "FRAST3": 200, "FRAST4": 300, "FRAST5": 400, "FRAST6": 500, "FRAST7": 600},
+    "AKL-JUG": {"FRAST1": 300, "FRAST2": 500, "FRAST3": 1000, "FRAST4": 1500, "FRAST5": 2000, "FRAST6": 2500},
+    "AKL-ERW": {"FRAST1": 300, "FRAST2": 500, "FRAST3": 1000, "FRAST4": 1500, "FRAST5": 2000, "FRAST6": 2500},
+}
+FIXTURE_AGE_FACTORS = {"AKL-KIN": 0.25, "AKL-JUG": 0.8, "AKL-ERW": 1.0}
+
+
+def fixture_premiums_csv():
+    import pandas as pd
+
+    rows = []
+    for insurer, base_premium in FIXTURE_INSURERS.items():
+        for tarif, tariftyp, tarifbezeichnung in FIXTURE_TARIFFS:
+            for region in (1, 2):
+                for age_class, deductibles in FIXTURE_AGE_CLASSES.items():
+                    for deductible_level, deductible in deductibles.items():
+                        for accident in ("MIT-UNF", "OHN-UNF"):
+                            premium = base_premium * FIXTURE_AGE_FACTORS[age_class] - 0.05 * deductible / 12 * 10
+                            premium *= 0.9 if tariftyp == "TAR-HMO" else 1.0
+                            premium *= 1.0 if region == 1 else 0.93
+                            premium += 15.0 if accident == "MIT-UNF" else 0.0
+                            rows.append({
+                                "Versicherer": insurer, "Kanton": "ZH", "Region": f"PR-REG CH{region}",
+                                "Geschäftsjahr": 2026, "Erhebungsjahr": 2025, "Altersklasse": age_class,
+                                "Unfalleinschluss": accident, "Tarif": tarif, "Tariftyp": tariftyp,
+                                "Franchisestufe": deductible_level, "Franchise": f"FRA-{deductible}",
+                                "Prämie": round(premium, 2), "Tarifbezeichnung": tarifbezeichnung,
+                            })
+    return pd.DataFrame(rows).to_csv(index=False).encode()
+
+
+def fixture_premium_regions_xlsx():
+    import pandas as pd
+
+    df = pd.DataFrame({
+        "Kanton\nCanton": ["ZH", "ZH", "ZH", "ZH"],
+        "Region\nRégion": [1, 1, 2, 2],
+        "Gemeinde\nCommune": ["Zürich", "Zürich", "Wädenswil", "Richterswil"],
+        "BFS-Nr.\nNo OFS": [261, 261, 293, 138],
+        "PLZ\nNPA": [8001, 8002, 8820, 8805],
+        "Ort\nLocalité": ["Zürich", "Zürich", "Wädenswil", "Richterswil"],
+    })
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        pd.DataFrame([["Prämienregionen"]]).to_excel(writer, sheet_name="A_COM", index=False, header=False)
+        df.to_excel(writer, sheet_name="A_COM", startrow=4, index=False)
+    return buffer.getvalue()
+
+
+def fixture_insurance_model_restrictions_csv():
+    import pandas as pd
+
+    rows = []
+    for insurer in FIXTURE_INSURERS:
+        for region in (1, 2):
+            rows.append({"Versicherer": insurer, "Kanton": "ZH", "Region": f"PR-REG CH{region}", "Tarif": "BASE",
+                         "Tariftyp": "TAR-BASE", "Eingeschränkt": "N", "Gemeinden-BFS": None})
+            rows.append({"Versicherer": insurer, "Kanton": "ZH", "Region": f"PR-REG CH{region}", "Tarif": "HMO1",
+                         "Tariftyp": "TAR-HMO", "Eingeschränkt": "Y", "Gemeinden-BFS": "261" if region == 1 else "293,138"})
+    # Wädenswil (293) is missing for SWICA, so its HMO is not available there.
+    rows[-1]["Gemeinden-BFS"] = "138"
+    return pd.DataFrame(rows).to_csv(index=False, sep=";").encode()
+
+
+def fixture_sources():
+    return {
+        "premiums": fixture_premiums_csv(),
+        "premium_regions": fixture_premium_regions_xlsx(),
+        "insurance_model_restrictions": fixture_insurance_model_restrictions_csv(),
+    }
+
+
+def write_fixture_snapshot(data_dir):
+    import data_loading
+
+    sources = fixture_sources()
+    tables = {name: reader(sources[name]) for name, (_, reader) in data_loading.SOURCES.items()}
+    return data_loading.write_snapshot(tables, data_dir=data_dir)
+
+
+
+@pytest.fixture(scope="session")
+def snapshot_dir():
+    """The data directory of the app (HEALTH_INSURANCE_DATA_DIR) with the fixture snapshot as the current version."""
+    import data_loading
+
+    if data_loading.current_version() is None:
+        write_fixture_snapshot(data_loading.DATA_DIR)
+    return Path(data_loading.DATA_DIR)
+
+
+@pytest.fixture(scope="session")
+def fixture_datasets(tmp_path_factory):
+    """The fixture snapshot in a data directory of its own, read like the app reads it: (datasets, data_dir)."""
+    from data_loading import read_snapshot
+
+    data_dir = tmp_path_factory.mktemp("data")
+    write_fixture_snapshot(data_dir)
+    return read_snapshot(data_dir=data_dir), data_dir
@@ -0,0 +1,71 @@
+import numpy as np
+
+# The cost model only depends on numpy, so it can be imported (and tested) without loading the app or its data.
+
+MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE = 700
+DECIMAL_AFTER_DEDUCTIBLE = 0.10 # We need to pay 10% of costs after deductible
+
+DEDUCTIBLE_CHILD_LVL_TO_AMOUNT = {"FRAST1": 0, "FRAST2": 100, "FRAST3": 200, "FRAST4": 300, "FRAST5": 400, "FRAST6": 500, "FRAST7": 600}
+DEDUCTIBLE_ADULT_LVL_TO_AMOUNT = {"FRAST1": 300, "FRAST2": 500, "FRAST3": 1000, "FRAST4": 1500, "FRAST5": 2000, "FRAST6": 2500}
+
+
+def deductible_amount_for_person(deductible_level, age_class):
+    return DEDUCTIBLE_CHILD_LVL_TO_AMOUNT[deductible_level] if age_class == 'AKL-KIN' else DEDUCTIBLE_ADULT_LVL_TO_AMOUNT[deductible_level]
+
+
+def _amounts(deductible_levels, lvl_to_amount):
+    if hasattr(deductible_levels, 'map'):
+        # pandas Series (for a categorical column, only every distinct level is looked up)
+        return np.asarray(deductible_levels.map(lvl_to_amount), dtype=float)
+    return np.array([lvl_to_amount.get(level, np.nan) for level in deductible_levels], dtype=float)
+
+
+def deductible_amounts_for_persons(deductible_levels, age_classes):
+    # Vectorized version of deductible_amount_for_person for pandas Series (or sequences) of deductible levels and age classes.
+    is_child = np.asarray(age_classes) == 'AKL-KIN'
+    return np.where(is_child, _amounts(deductible_levels, DEDUCTIBLE_CHILD_LVL_TO_AMOUNT), _amounts(deductible_levels, DEDUCTIBLE_ADULT_LVL_TO_AMOUNT))
+
+
+# The vectorized functions accept scalars or numpy arrays for every argument. The arguments are broadcast
+# against each other, so e.g. a column of premiums and a row of treatment costs give a 2D cost table in one call.
+def annual_costs_health_insurance(treatment_costs_during_year, premium_per_month, deductible_amount):
+    treatment_costs_during_year = np.asarray(treatment_costs_during_year, dtype=float)
+    amount_after_deductible = np.maximum(0, treatment_costs_during_year - deductible_amount)
+    costs_to_cover_after_deductible = np.minimum(amount_after_deductible * DECIMAL_AFTER_DEDUCTIBLE, MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE)
+    total_treatment_costs_to_cover = np.minimum(treatment_costs_during_year, deductible_amount) + costs_to_cover_after_deductible
+    return total_treatment_costs_to_cover + 12 * np.asarray(premium_per_month, dtype=float)
+
+
+def annual_costs_insurance(treatment_costs_during_year, premium_per_month, deductible_amount, percentage_covered, max_amount_insurance_pays):
+    treatment_costs_during_year = np.asarray(treatment_costs_during_year, dtype=float)
+    premium_per_year = 12 * np.asarray(premium_per_month, dtype=float)
+    amount_after_deductible = np.maximum(treatment_costs_during_year - deductible_amount, 0)
+    insurance_pays = np.minimum(percentage_covered * amount_after_deductible, max_amount_insurance_pays)
+    return premium_per_year + (treatment_costs_during_year - insurance_pays)
+
+
+def cost_tensor(treatment_costs, premiums_per_month, deductible_amounts):
+    """Annual costs with shape (plans, deductibles, treatment cost points).
+
+    `premiums_per_month` has shape (plans, deductibles), `deductible_amounts` has shape (deductibles,)
+    or (plans, deductibles) and `treatment_costs` has shape (points,).
+    """
+    premiums_per_month = np.atleast_2d(np.asarray(premiums_per_month, dtype=float))
+    deductible_amounts = np.broadcast_to(np.asarray(deductible_amounts, dtype=float), premiums_per_month.shape)
+    return annual_costs_health_insurance(
+        treatment_costs_during_year=np.asarray(treatment_costs, dtype=float)[np.newaxis, np.newaxis, :],
+        premium_per_month=premiums_per_month[:, :, np.newaxis],
+        deductible_amount=deductible_amounts[:, :, np.newaxis],
+    )
+
+
+def calculate_annual_cost_health_insurance(treatment_costs_during_year, premium_per_month, deductible_amount):
+    return float(annual_costs_health_insurance(treatment_costs_during_year, premium_per_month, deductible_amount))
+
+
+def calculate_annual_cost_insurance(treatment_costs_during_year, premium_per_month, deductible_amount, percentage_covered, max_amount_insurance_pays):
+    # Generally, you will need to pay the following amount (per year) by yourself:
+    # 1. premium
+    # 2. the difference between the treatment costs and the amount that the insurance pays,
+    #    where the amount that the insurance pays is MIN(percentage_covered * amount_after_deductible, max_amount_insurance_pays)
+    return float(annual_costs_insurance(treatment_costs_during_year, premium_per_month, deductible_amount, percentage_covered, max_amount_insurance_pays))
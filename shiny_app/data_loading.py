@@ -0,0 +1,234 @@
+import io
+import json
+import os
+import shutil
+import sys
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
+
+# Downloading the three datasets and parsing the xlsx file takes tens of seconds, so we keep a local
+# snapshot of the already cleaned tables in Parquet format. Workers only read the snapshot on startup,
+# the upstream files are only checked again when a refresh is requested explicitly
+# (HEALTH_INSURANCE_REFRESH_DATA=1 or `python data_loading.py --refresh`).
+#
+# Layout of the data directory:
+#   snapshots/<version>/<dataset>.parquet  one file per dataset
+#   snapshots/<version>/manifest.json      ETag / Last-Modified of the upstream files used for this version
+#   CURRENT                                name of the last snapshot that was written completely
+DATA_DIR = Path(os.environ.get("HEALTH_INSURANCE_DATA_DIR", Path(__file__).parent / "data"))
+SNAPSHOTS_TO_KEEP = 3
+
+
+# In-memory schema of the premiums table. The few distinct values of the text columns are stored as categoricals
+# (small integer codes plus one copy of every value), so the table is several times smaller in every worker process
+# and grouping or comparing these columns works on integers. Premiums are in CHF with 2 decimals, float32 is exact enough.
+PREMIUMS_SCHEMA = {
+    'Versicherer': 'int16',
+    'Kanton': 'category',
+    'Region': 'category',
+    'Geschäftsjahr': 'int16',
+    'Erhebungsjahr': 'int16',
+    'Altersklasse': 'category',
+    'Unfalleinschluss': 'category',
+    'Tarif': 'category',
+    'Tariftyp': 'category',
+    'Franchisestufe': 'category',
+    'Franchise': 'category',
+    'Prämie': 'float32',
+    'Tarifbezeichnung': 'category',
+}
+
+
+def apply_schema(df, schema):
+    """Convert the columns of `df` that are in the schema to its dtypes (columns missing in `df` are skipped)."""
+    return df.astype({column: dtype for column, dtype in schema.items() if column in df.columns})
+
+
+def memory_report(df, schema):
+    """Bytes per column of `df` with its current dtypes and with the schema applied."""
+    before = df.memory_usage(deep=True, index=False)
+    after = apply_schema(df, schema).memory_usage(deep=True, index=False)
+    report = pd.DataFrame({'before': before, 'after': after})
+    report.loc['total'] = report.sum()
+    report['ratio'] = (report['before'] / report['after']).round(1)
+    return report
+
+
+def _read_premiums(content):
+    return apply_schema(pd.read_csv(io.BytesIO(content)), PREMIUMS_SCHEMA)
+
+
+def _read_premium_regions(content):
+    premium_regions_df = pd.read_excel(io.BytesIO(content), sheet_name='A_COM', skiprows=4, engine="openpyxl")
+    # The original excel file has column names on two lines: First Line = German name, Second Line = French translation
+    premium_regions_df.columns = [col.splitlines()[0] for col in premium_regions_df.columns]
+    return premium_regions_df
+
+
+def _read_insurance_model_restrictions(content):
+    insurance_model_restrictions_df = pd.read_csv(io.BytesIO(content), sep=";")
+    # We only need the rows where there is a restriction
+    return insurance_model_restrictions_df[insurance_model_restrictions_df["Eingeschränkt"] == "Y"].reset_index(drop=True)
+
+
+# Upstream source and parser for every dataset that is part of a snapshot.
+SOURCES = {
+    "premiums": ("https://opendata.bagnet.ch/?r=/download&path=L1ByYWVtaWVuL1Byw6RtaWVuX0NILmNzdg%3D%3D", _read_premiums),
+    "premium_regions": ("https://www.priminfo.admin.ch/downloads/praemienregionen.xlsx", _read_premium_regions),
+    "insurance_model_restrictions": ("https://opendata.bagnet.ch/?r=/download&path=L1ByYWVtaWVuL0Vpbnp1Z3NnZWJpZXRlLmNzdg%3D%3D", _read_insurance_model_restrictions),
+}
+
+
+class Datasets(NamedTuple):
+    premiums: pd.DataFrame
+    premium_regions: pd.DataFrame
+    insurance_model_restrictions: pd.DataFrame
+    version: str
+
+
+class DataUnavailableError(RuntimeError):
+    pass
+
+
+def _fetch(url, etag=None, last_modified=None):
+    # Conditional GET: returns (None, etag, last_modified) if the upstream file did not change.
+    request = urllib.request.Request(url)
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if last_modified:
+        request.add_header("If-Modified-Since", last_modified)
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.read(), response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, etag, last_modified
+        raise
+
+
+def _snapshots_dir(data_dir):
+    return Path(data_dir) / "snapshots"
+
+
+def current_version(data_dir=None):
+    current_file = Path(data_dir or DATA_DIR) / "CURRENT"
+    if not current_file.exists():
+        return None
+    version = current_file.read_text().strip()
+    return version if (_snapshots_dir(data_dir or DATA_DIR) / version / "manifest.json").exists() else None
+
+
+def snapshot_path(version, data_dir=None):
+    # Directory of a snapshot. Files derived from a snapshot (e.g. precomputed results) are stored next to
+    # its datasets, so they are replaced together with the snapshot.
+    return _snapshots_dir(data_dir or DATA_DIR) / version
+
+
+def _read_manifest(data_dir, version):
+    return json.loads((_snapshots_dir(data_dir) / version / "manifest.json").read_text())
+
+
+def write_snapshot(tables, sources_info=None, data_dir=None):
+    """Write a complete snapshot of the given tables and make it the current version."""
+    data_dir = Path(data_dir or DATA_DIR)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    snapshot_dir = _snapshots_dir(data_dir) / version
+    tmp_dir = snapshot_dir.with_name(version + ".tmp")
+    tmp_dir.mkdir(parents=True)
+
+    for name, df in tables.items():
+        df.to_parquet(tmp_dir / f"{name}.parquet", index=False)
+    manifest = {"version": version, "created_at": datetime.now(timezone.utc).isoformat(), "sources": sources_info or {}}
+    (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    # Only switch CURRENT after the snapshot is complete, so a failed refresh never replaces the last good one.
+    tmp_dir.rename(snapshot_dir)
+    (data_dir / "CURRENT.tmp").write_text(version)
+    os.replace(data_dir / "CURRENT.tmp", data_dir / "CURRENT")
+    _prune_snapshots(data_dir, keep=version)
+    return version
+
+
+def _prune_snapshots(data_dir, keep):
+    versions = sorted(p.name for p in _snapshots_dir(data_dir).iterdir() if p.is_dir())
+    for version in versions[:-SNAPSHOTS_TO_KEEP]:
+        if version != keep:
+            shutil.rmtree(_snapshots_dir(data_dir) / version, ignore_errors=True)
+
+
+def refresh_snapshot(data_dir=None):
+    """Revalidate the upstream files and write a new snapshot if any of them changed.
+
+    Returns the version of the current snapshot afterwards.
+    """
+    data_dir = Path(data_dir or DATA_DIR)
+    previous_version = current_version(data_dir)
+    previous_sources = _read_manifest(data_dir, previous_version)["sources"] if previous_version else {}
+
+    tables = {}
+    sources_info = {}
+    changed = previous_version is None
+    for name, (url, reader) in SOURCES.items():
+        previous = previous_sources.get(name, {})
+        content, etag, last_modified = _fetch(url, previous.get("etag"), previous.get("last_modified"))
+        if content is None:
+            # Not modified upstream, reuse the table of the previous snapshot.
+            tables[name] = pd.read_parquet(_snapshots_dir(data_dir) / previous_version / f"{name}.parquet")
+        else:
+            tables[name] = reader(content)
+            changed = True
+        sources_info[name] = {"url": url, "etag": etag, "last_modified": last_modified}
+
+    if not changed:
+        print(f"Data snapshot {previous_version} is up to date.")
+        return previous_version
+    return write_snapshot(tables, sources_info, data_dir)
+
+
+def read_snapshot(version=None, data_dir=None):
+    data_dir = Path(data_dir or DATA_DIR)
+    version = version or current_version(data_dir)
+    if version is None:
+        raise DataUnavailableError(f"No data snapshot found in {data_dir}.")
+    snapshot_dir = _snapshots_dir(data_dir) / version
+    tables = {name: pd.read_parquet(snapshot_dir / f"{name}.parquet", memory_map=True) for name in SOURCES}
+    return Datasets(
+        # Snapshots written before the schema existed are converted on load
+        premiums=apply_schema(tables["premiums"], PREMIUMS_SCHEMA),
+        premium_regions=tables["premium_regions"],
+        insurance_model_restrictions=tables["insurance_model_restrictions"],
+        version=version,
+    )
+
+
+def load_datasets(refresh=False, data_dir=None):
+    """Load the datasets from the local snapshot.
+
+    The upstream files are only downloaded if `refresh` is set or if there is no snapshot yet.
+    If the download fails, the last good snapshot is used.
+    """
+    data_dir = Path(data_dir or DATA_DIR)
+    if refresh or current_version(data_dir) is None:
+        try:
+            refresh_snapshot(data_dir)
+        except Exception as e:
+            if current_version(data_dir) is None:
+                raise DataUnavailableError(f"Could not download the data and there is no local snapshot: {e}") from e
+            print(f"Error refreshing data, using the last good snapshot instead: {e}")
+    return read_snapshot(data_dir=data_dir)
+
+
+if __name__ == "__main__":
+    if "--refresh" in sys.argv[1:]:
+        print(f"Current data snapshot: {refresh_snapshot()}")
+    elif "--memory-report" in sys.argv[1:]:
+        # Memory of the premiums table as read from the CSV with default dtypes, and with PREMIUMS_SCHEMA
+        premiums_csv = read_snapshot().premiums.to_csv(index=False).encode()
+        print(memory_report(pd.read_csv(io.BytesIO(premiums_csv)), PREMIUMS_SCHEMA).to_string())
+    else:
+        print(f"Current data snapshot: {current_version()}")
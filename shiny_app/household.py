@@ -0,0 +1,111 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from cost_model import annual_costs_health_insurance, deductible_amounts_for_persons
+
+# Household mode: the cheapest insurance for several people living in the same municipality.
+# All offers of all members (every insurer x tariff x deductible level of their age class and accident insurance)
+# are evaluated in one pass: one index lookup per distinct member profile, one restriction check and one cost
+# calculation for all of them. Two kinds of configurations are compared:
+#   configuration 0     every member takes their own cheapest offer (insurers can differ)
+#   configuration 1..n  all members are insured with the same insurer, ranked by the costs of the household
+TOP_N_INSURERS = 5
+
+
+class HouseholdMember(NamedTuple):
+    age_class: str
+    accident_insurance: str
+    expected_treatment_costs: float
+
+
+def age_class_for_birth_year(birth_year):
+    if birth_year >= 2008:
+        return 'AKL-KIN'
+    elif birth_year >= 2001:
+        return 'AKL-JUG'
+    else:
+        return 'AKL-ERW'
+
+
+class HouseholdOptimizer:
+    """Finds the cheapest combined configuration of offers for the members of a household."""
+
+    def __init__(self, offer_finder):
+        self.premiums_df = offer_finder.premiums_df
+        # All deductible levels of a profile are in one group, so every member needs one lookup.
+        self.index = offer_finder.profile_index
+        self.restrictions = offer_finder.restrictions
+        self.restricted_plan_ids = offer_finder.restricted_plan_ids
+        self._premiums = self.premiums_df['Prämie'].to_numpy(dtype=float)
+        self._deductible_amounts = deductible_amounts_for_persons(self.premiums_df['Franchisestufe'], self.premiums_df['Altersklasse'])
+        self._insurers = self.premiums_df['Versicherer'].to_numpy()
+
+    def member_offers(self, bfs_nr, canton, region, members):
+        """All offers available to the members in the municipality.
+
+        Returns three flat arrays: the member number, the row offset into premiums_df and the annual costs
+        for the member's expected treatment costs of every offer.
+        """
+        profile_offsets = {}
+        for member in members:
+            profile = (member.age_class, member.accident_insurance)
+            if profile not in profile_offsets:
+                profile_offsets[profile] = self.index.offsets((canton, f"PR-REG CH{region}", *profile))
+        member_offsets = [profile_offsets[(member.age_class, member.accident_insurance)] for member in members]
+        member_numbers = np.repeat(np.arange(len(members)), [len(offsets) for offsets in member_offsets])
+        offsets = np.concatenate(member_offsets) if member_offsets else np.empty(0, dtype=np.intp)
+
+        # Filter out offers with a restriction that excludes the municipality (BFS-Nr.)
+        available = self.restrictions.is_available(self.restricted_plan_ids[offsets], bfs_nr)
+        member_numbers, offsets = member_numbers[available], offsets[available]
+
+        expected_treatment_costs = np.array([member.expected_treatment_costs for member in members], dtype=float)
+        annual_costs = annual_costs_health_insurance(
+            treatment_costs_during_year=expected_treatment_costs[member_numbers],
+            premium_per_month=self._premiums[offsets],
+            deductible_amount=self._deductible_amounts[offsets],
+        )
+        return member_numbers, offsets, annual_costs
+
+    def cheapest_configurations(self, bfs_nr, canton, region, members, top_n=TOP_N_INSURERS):
+        """The cheapest configurations of the household, see the configurations at the top of this module.
+
+        Returns a DataFrame with one row per configuration and member and the columns 'Configuration', 'Member',
+        'offset' (row offset into premiums_df), 'Annual costs' (of the member) and 'Household costs'.
+        Only insurers with an offer for every member are included in the single insurer configurations.
+        """
+        member_numbers, offsets, annual_costs = self.member_offers(bfs_nr, canton, region, members)
+
+        # The cheapest offer of every member at every insurer: sort by member, insurer and costs, and keep the first row of each group.
+        insurer_codes, insurers = pd.factorize(self._insurers[offsets], sort=True)
+        order = np.lexsort((annual_costs, insurer_codes, member_numbers))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (np.diff(member_numbers[order]) != 0) | (np.diff(insurer_codes[order]) != 0)
+        cheapest = order[first]
+
+        # Members x insurers tables of the cheapest offers and their costs (inf where an insurer has no offer for the member)
+        best_offsets = np.full((len(members), len(insurers)), -1, dtype=np.int64)
+        best_costs = np.full((len(members), len(insurers)), np.inf)
+        best_offsets[member_numbers[cheapest], insurer_codes[cheapest]] = offsets[cheapest]
+        best_costs[member_numbers[cheapest], insurer_codes[cheapest]] = annual_costs[cheapest]
+
+        household_costs = best_costs.sum(axis=0)
+        ranked_insurers = np.argsort(household_costs, kind='stable')
+        ranked_insurers = ranked_insurers[np.isfinite(household_costs[ranked_insurers])][:top_n]
+        # If some member has no offer at all, there is no configuration (and no insurer with offers for every member).
+        has_offers = len(insurers) > 0 and np.isfinite(best_costs.min(axis=1)).all()
+        configurations = [np.argmin(best_costs, axis=1)] if has_offers else []
+        configurations.extend(np.full(len(members), insurer) for insurer in ranked_insurers)
+
+        member_range = np.arange(len(members))
+        member_offsets = [best_offsets[member_range, configuration] for configuration in configurations]
+        member_costs = [best_costs[member_range, configuration] for configuration in configurations]
+        return pd.DataFrame({
+            'Configuration': np.repeat(np.arange(len(configurations)), len(members)),
+            'Member': np.tile(member_range, len(configurations)),
+            'offset': np.concatenate(member_offsets) if configurations else np.empty(0, dtype=np.int64),
+            'Annual costs': np.concatenate(member_costs) if configurations else np.empty(0),
+            'Household costs': np.repeat([costs.sum() for costs in member_costs], len(members)),
+        })
@@ -0,0 +1,179 @@
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Timing of the stages on the request path (reactive calcs, renders, typeahead searches) and of the data loading.
+# Every stage has a latency histogram, all of them are exposed in the Prometheus text format by /metrics (see app.py)
+# together with the cache statistics and the loading status.
+#
+# With HEALTH_INSURANCE_PROFILE_DIR=<directory>, every session is also profiled with cProfile while it runs
+# instrumented stages, and the profile is written to <directory>/session-<id>.prof when the session ends
+# (view it with e.g. `python -m pstats` or snakeviz).
+METRIC_PREFIX = "health_insurance"
+# Upper bounds of the histogram buckets in seconds (the last bucket, +Inf, is implicit)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_DIR = os.environ.get("HEALTH_INSURANCE_PROFILE_DIR")
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, like a Prometheus histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        # The number of buckets is small, a linear scan is faster than bisect here
+        bucket = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        """Cumulative counts per upper bound (the last one is +Inf), sum and count."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class StageMetrics:
+    """The latency histograms of all stages of the process."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+
+    def snapshots(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {stage: histogram.snapshot() for stage, histogram in sorted(histograms.items())}
+
+
+stage_metrics = StageMetrics()
+
+# Profilers of the sessions, by session id (only used with HEALTH_INSURANCE_PROFILE_DIR)
+_session_profilers = {}
+_profiling = threading.local()
+
+
+def _current_profiler():
+    from shiny.session import get_current_session
+
+    session = get_current_session()
+    return _session_profilers.get(session.id) if session is not None else None
+
+
+@contextmanager
+def stage_timer(stage):
+    """Record the duration of the `with` block as one observation of the stage."""
+    profiler = _current_profiler() if PROFILE_DIR and not getattr(_profiling, "active", False) else None
+    if profiler is not None:
+        # Nested stages run within the outermost one, which enables the profiler.
+        _profiling.active = True
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_metrics.observe(stage, time.perf_counter() - start)
+        if profiler is not None:
+            profiler.disable()
+            _profiling.active = False
+
+
+def timed(stage):
+    """Decorator recording the duration of every call of a (synchronous) function as the stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_session_profile(session, profile_dir=None):
+    """Profile the instrumented stages of the session and write the profile when the session ends."""
+    profile_dir = Path(profile_dir or PROFILE_DIR)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    _session_profilers[session.id] = profiler
+
+    def dump_profile():
+        _session_profilers.pop(session.id, None)
+        profiler.dump_stats(profile_dir / f"session-{session.id}.prof")
+
+    session.on_ended(dump_profile)
+    return profiler
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def prometheus_text(caches=None, loader=None):
+    """The metrics in the Prometheus text exposition format.
+
+    `caches` maps a cache name to a LRUCache, `loader` is the BackgroundLoader of the data.
+    """
+    lines = [
+        f"# HELP {METRIC_PREFIX}_stage_duration_seconds Duration of the instrumented stages of the app.",
+        f"# TYPE {METRIC_PREFIX}_stage_duration_seconds histogram",
+    ]
+    for stage, (cumulative, total, count) in stage_metrics.snapshots().items():
+        for bound, bucket_count in cumulative:
+            lines.append(f"{METRIC_PREFIX}_stage_duration_seconds_bucket{{stage=\"{_escape(stage)}\",le=\"{_format_bound(bound)}\"}} {bucket_count}")
+        lines.append(f"{METRIC_PREFIX}_stage_duration_seconds_sum{{stage=\"{_escape(stage)}\"}} {total!r}")
+        lines.append(f"{METRIC_PREFIX}_stage_duration_seconds_count{{stage=\"{_escape(stage)}\"}} {count}")
+
+    if caches:
+        stats = {name: cache.stats() for name, cache in caches.items()}
+        for metric, key, metric_type, description in [
+            ("cache_hits_total", "hits", "counter", "Cache lookups served from the cache."),
+            ("cache_misses_total", "misses", "counter", "Cache lookups that had to be calculated."),
+            ("cache_evictions_total", "evictions", "counter", "Entries evicted from the cache."),
+            ("cache_entries", "entries", "gauge", "Entries in the cache."),
+            ("cache_bytes", "bytes", "gauge", "Estimated size of the entries in the cache."),
+            ("cache_hit_ratio", "hit_rate", "gauge", "Share of the cache lookups served from the cache."),
+        ]:
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {description}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} {metric_type}")
+            for name, cache_stats in stats.items():
+                lines.append(f"{METRIC_PREFIX}_{metric}{{cache=\"{_escape(name)}\"}} {cache_stats[key]!r}")
+
+    if loader is not None:
+        status = loader.status()
+        lines.append(f"# HELP {METRIC_PREFIX}_data_ready Whether the data is loaded (1) or not (0).")
+        lines.append(f"# TYPE {METRIC_PREFIX}_data_ready gauge")
+        lines.append(f"{METRIC_PREFIX}_data_ready {1 if status['status'] == 'ready' else 0}")
+        if "seconds" in status:
+            lines.append(f"# HELP {METRIC_PREFIX}_data_load_seconds Time the loading of the data took (so far).")
+            lines.append(f"# TYPE {METRIC_PREFIX}_data_load_seconds gauge")
+            lines.append(f"{METRIC_PREFIX}_data_load_seconds {status['seconds']!r}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+from shiny.session import require_active_session
+from starlette.responses import JSONResponse
+
+from data_loading import snapshot_path
+from instrumentation import timed
+
+# Choices of the location input and the search index behind it.
+# The choices (value "BFS-Nr.|Kanton|Region|PLZ|Ort|Gemeinde" -> label "PLZ Ort") only depend on the data snapshot,
+# so they are built once per snapshot and stored next to it.
+# The selectize input loads its options from the server while typing, every request is answered by
+# MunicipalitySearchIndex.search instead of filtering all choices.
+MUNICIPALITY_CHOICES_FILE = "municipality_choices.parquet"
+MAX_OPTIONS = 1000
+
+
+def build_municipality_choices(premium_regions_df):
+    """DataFrame with the 'value', 'label' and 'search_text' of every row of the premium regions."""
+    columns = {column: premium_regions_df[column].astype(str) for column in ['BFS-Nr.', 'Kanton', 'Region', 'PLZ', 'Ort', 'Gemeinde']}
+    value = columns['BFS-Nr.']
+    for column in ['Kanton', 'Region', 'PLZ', 'Ort', 'Gemeinde']:
+        value = value + '|' + columns[column]
+    label = columns['PLZ'] + ' ' + columns['Ort']
+    # Show the municipality if there are several with the same postal code
+    plz_count = premium_regions_df.groupby('PLZ')['PLZ'].transform('count')
+    label = label.where(plz_count <= 1, label + ' (Gemeinde ' + columns['Gemeinde'] + ')')
+    search_text = columns['PLZ'] + ' ' + columns['Ort'] + ' ' + columns['Gemeinde']
+    return pd.DataFrame({'value': value, 'label': label, 'search_text': search_text}).reset_index(drop=True)
+
+
+def load_municipality_choices(version, premium_regions_df, data_dir=None):
+    """The municipality choices of the snapshot, built and stored next to it on first use."""
+    path = snapshot_path(version, data_dir) / MUNICIPALITY_CHOICES_FILE
+    if path.exists():
+        return pd.read_parquet(path)
+    choices_df = build_municipality_choices(premium_regions_df)
+    try:
+        choices_df.to_parquet(path.with_name(path.name + f".{os.getpid()}.tmp"), index=False)
+        os.replace(path.with_name(path.name + f".{os.getpid()}.tmp"), path)
+    except OSError as e:
+        print(f"Could not store the municipality choices with the snapshot: {e}")
+    return choices_df
+
+
+def _normalize(text):
+    # Lower case without accents, so "zurich" finds "Zürich"
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def _tokens(text):
+    return re.findall(r'\w+', _normalize(text))
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class MunicipalitySearchIndex:
+    """Typeahead search over PLZ, Ort and Gemeinde of the municipality choices.
+
+    Every word of the query must match a word of the choice: words with less than 3 characters by prefix
+    (sorted word list), longer words anywhere in a word (trigram index). Choices where all words of the query
+    match at the start of a word come first, otherwise the order of the choices is kept.
+    """
+
+    def __init__(self, choices_df):
+        self.values = choices_df['value'].tolist()
+        self.labels = choices_df['label'].tolist()
+        self.choices = dict(zip(self.values, self.labels))
+        self._positions = {value: i for i, value in enumerate(self.values)}
+
+        words = {}
+        for i, search_text in enumerate(choices_df['search_text']):
+            for word in _tokens(search_text):
+                words.setdefault(word, set()).add(i)
+        # Sorted words, and the positions of the choices containing them in one flat array:
+        # the choices of word number w are _word_choices[_word_starts[w]:_word_starts[w + 1]].
+        self._words = sorted(words)
+        counts = np.array([len(words[word]) for word in self._words], dtype=np.int64)
+        self._word_starts = np.concatenate([[0], np.cumsum(counts)])
+        self._word_choices = np.array([i for word in self._words for i in sorted(words[word])], dtype=np.int32)
+
+        trigrams = {}
+        for word_number, word in enumerate(self._words):
+            for trigram in _trigrams(word):
+                trigrams.setdefault(trigram, []).append(word_number)
+        self._trigram_words = {trigram: np.array(word_numbers, dtype=np.int32) for trigram, word_numbers in trigrams.items()}
+
+    def _prefix_mask(self, prefix):
+        # Words starting with the prefix are next to each other in the sorted word list.
+        start = bisect_left(self._words, prefix)
+        end = bisect_left(self._words, prefix + '\uffff', lo=start)
+        mask = np.zeros(len(self.values), dtype=bool)
+        mask[self._word_choices[self._word_starts[start]:self._word_starts[end]]] = True
+        return mask
+
+    def _substring_mask(self, part):
+        mask = np.zeros(len(self.values), dtype=bool)
+        candidates = None
+        for trigram in sorted(_trigrams(part), key=lambda t: len(self._trigram_words.get(t, ()))):
+            word_numbers = self._trigram_words.get(trigram)
+            if word_numbers is None:
+                return mask
+            candidates = word_numbers if candidates is None else np.intersect1d(candidates, word_numbers, assume_unique=True)
+        word_numbers = np.array([w for w in candidates if part in self._words[w]], dtype=np.int64)
+        if len(word_numbers):
+            # Positions in _word_choices of all choices of the matching words
+            starts, counts = self._word_starts[word_numbers], np.diff(self._word_starts)[word_numbers]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            mask[self._word_choices[np.repeat(starts, counts) + offsets]] = True
+        return mask
+
+    def search(self, query, limit=MAX_OPTIONS):
+        """Positions of the (at most `limit`) choices matching the query."""
+        parts = _tokens(query)
+        if not parts:
+            return list(range(min(limit, len(self.values))))
+
+        matches = prefix_matches = np.ones(len(self.values), dtype=bool)
+        for part in parts:
+            prefix_mask = self._prefix_mask(part)
+            prefix_matches = prefix_matches & prefix_mask
+            matches = matches & (self._substring_mask(part) if len(part) >= 3 else prefix_mask)
+        ranked = np.concatenate([np.flatnonzero(prefix_matches), np.flatnonzero(matches & ~prefix_matches)])
+        return ranked[:limit].tolist()
+
+    def selectize_options(self, query, limit=MAX_OPTIONS, selected=None):
+        """Options in the format of the selectize.js load callback, the selected value is always included."""
+        options = [{"value": self.values[i], "label": self.labels[i]} for i in self.search(query, limit)]
+        if selected in self._positions and not any(option["value"] == selected for option in options):
+            options.append({"value": selected, "label": self.choices[selected]})
+        return options
+
+
+def update_municipality_selectize(input_id, search_index, selected=None, session=None):
+    """Like ui.update_selectize(server=True), but the options are looked up in the search index."""
+    session = require_active_session(session)
+
+    @timed("selectize_search")
+    def selectize_choices_json(request):
+        # Query parameters sent by shiny.js: the search text and the maximum number of options
+        query_params = request.query_params
+        return JSONResponse(search_index.selectize_options(query_params.get("query", ""), int(query_params.get("maxop", MAX_OPTIONS)), selected))
+
+    message = {"url": session.dynamic_route(f"update_selectize_{input_id}", selectize_choices_json)}
+    if selected:
+        message["value"] = [selected]
+    session.send_input_message(input_id, message)
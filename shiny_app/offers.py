@@ -0,0 +1,36 @@
+from premium_index import OFFER_KEYS, PROFILE_KEYS, PremiumIndex
+from restrictions import MunicipalityRestrictions
+
+
+class OfferFinder:
+    """Finds the insurance offers for a municipality and a personal profile, sorted by premium.
+
+    This is the filter logic of the app's calculate_data, shared with the batch precomputation.
+    """
+
+    def __init__(self, premiums_df, insurance_model_restrictions_df):
+        self.premiums_df = premiums_df
+        self.offers_index = PremiumIndex(premiums_df, OFFER_KEYS, sort_by='Prämie')
+        self.profile_index = PremiumIndex(premiums_df, PROFILE_KEYS)
+        # Restricted plans are only offered in some municipalities. For every row of premiums_df we keep the id of its
+        # restricted plan (-1 if there is no restriction), so the request path only needs to compare integers.
+        self.restrictions = MunicipalityRestrictions(insurance_model_restrictions_df)
+        self.restricted_plan_ids = self.restrictions.plan_ids(premiums_df)
+
+    def offer_offsets(self, bfs_nr, canton, region, age_class, deductible_level, accident_insurance):
+        """Row offsets into premiums_df of the offers available in the municipality, sorted by premium."""
+        # The offers of each group in the index are already sorted by premium.
+        offsets = self.offers_index.offsets((canton, f"PR-REG CH{region}", age_class, deductible_level, accident_insurance))
+        # Filter out offers with a restriction that excludes the municipality (BFS-Nr.)
+        available = self.restrictions.is_available(self.restricted_plan_ids[offsets], bfs_nr)
+        return offsets[available]
+
+    def profile_offsets(self, bfs_nr, canton, region, age_class, accident_insurance):
+        """Row offsets into premiums_df of the offers of all deductible levels available in the municipality."""
+        offsets = self.profile_index.offsets((canton, f"PR-REG CH{region}", age_class, accident_insurance))
+        available = self.restrictions.is_available(self.restricted_plan_ids[offsets], bfs_nr)
+        return offsets[available]
+
+    def offers(self, bfs_nr, canton, region, age_class, deductible_level, accident_insurance):
+        return self.premiums_df.take(self.offer_offsets(bfs_nr, canton, region, age_class, deductible_level, accident_insurance))
+
@@ -0,0 +1,51 @@
+import io
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from cost_model import annual_costs_health_insurance
+
+# The deductible comparison plot is drawn on a plain Agg canvas instead of through pyplot, so no figure is
+# registered in pyplot's global state and every figure is freed as soon as it is rendered.
+# The rendered PNGs are cached (see app.py), a repeated selection of the same plan doesn't draw anything.
+PLOT_DPI = 96
+
+
+def deductibles_comparison_figure(title, premium_amounts, deductible_amounts, crossover_points, width_px=800, height_px=500, pixelratio=1.0):
+    # Create treatment costs range (0 to 10,000 CHF, or further if the cheapest deductible changes later)
+    max_treatment_costs = max([10000] + [1.1 * point for point in crossover_points])
+    treatment_costs = np.linspace(0, max_treatment_costs, 1000)
+
+    fig = Figure(figsize=(width_px / PLOT_DPI, height_px / PLOT_DPI), dpi=PLOT_DPI * pixelratio, layout="tight")
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    # One row of annual costs per deductible level, calculated for all treatment costs at once.
+    annual_costs = annual_costs_health_insurance(
+        treatment_costs_during_year=treatment_costs[np.newaxis, :],
+        premium_per_month=np.asarray(premium_amounts)[:, np.newaxis],
+        deductible_amount=np.asarray(deductible_amounts)[:, np.newaxis],
+    )
+
+    for deductible_amount, annual_costs_for_deductible in zip(deductible_amounts, annual_costs):
+        ax.plot(treatment_costs, annual_costs_for_deductible, label=f'{deductible_amount} CHF Deductible')
+
+    # Mark the treatment costs where another deductible level becomes the cheapest one.
+    for point in crossover_points:
+        ax.axvline(point, color='gray', linestyle='--', linewidth=1)
+        ax.annotate(f'{point:.0f} CHF', xy=(point, 1), xycoords=('data', 'axes fraction'), xytext=(3, -12),
+                    textcoords='offset points', fontsize=8, color='gray')
+
+    ax.set_xlabel('Treatment Costs (CHF)')
+    ax.set_ylabel('Total Costs for You (CHF)')
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True)
+    return fig
+
+
+def render_png(fig):
+    with io.BytesIO() as buffer:
+        fig.savefig(buffer, format="png")
+        return buffer.getvalue()
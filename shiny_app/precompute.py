@@ -0,0 +1,152 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from cost_model import DEDUCTIBLE_ADULT_LVL_TO_AMOUNT, DEDUCTIBLE_CHILD_LVL_TO_AMOUNT, annual_costs_health_insurance
+from data_loading import read_snapshot, snapshot_path
+from offers import OfferFinder
+from premium_index import PremiumIndex
+
+# Batch precomputation of the optimal deductibles for every profile in the country:
+# every municipality (BFS-Nr.) x age class x accident insurance.
+# The results are stored next to the data snapshot they were computed from, so the app can answer
+# this question with a table lookup:
+#   optimal_deductibles.parquet  for every municipality, age class, accident insurance and treatment cost
+#                                scenario, the deductible level (with its cheapest offer) with the lowest annual costs
+#
+# Run from the shiny_app directory: python precompute.py [--workers 4]
+TREATMENT_COST_SCENARIOS = [0, 500, 1000, 2000, 5000, 10000]
+AGE_CLASS_DEDUCTIBLES = {'AKL-KIN': DEDUCTIBLE_CHILD_LVL_TO_AMOUNT, 'AKL-JUG': DEDUCTIBLE_ADULT_LVL_TO_AMOUNT, 'AKL-ERW': DEDUCTIBLE_ADULT_LVL_TO_AMOUNT}
+ACCIDENT_INSURANCE_OPTIONS = ['MIT-UNF', 'OHN-UNF']
+
+OPTIMAL_DEDUCTIBLES_FILE = "optimal_deductibles.parquet"
+MUNICIPALITY_PROFILE_KEYS = ['BFS-Nr.', 'Altersklasse', 'Unfalleinschluss']
+
+
+def _optimal_deductibles(offer_finder, premiums, bfs_nr, canton, region, age_class, accident_insurance, scenarios):
+    # Returns, for every scenario, the index of the cheapest deductible level, the offset of its cheapest offer and the annual costs.
+    deductibles = AGE_CLASS_DEDUCTIBLES[age_class]
+    cheapest_offsets = np.full(len(deductibles), -1)
+    for i, deductible_level in enumerate(deductibles):
+        offsets = offer_finder.offer_offsets(bfs_nr, canton, region, age_class, deductible_level, accident_insurance)
+        if len(offsets):
+            cheapest_offsets[i] = offsets[0]
+
+    # Annual costs of the cheapest offer of every deductible level (rows) for every scenario (columns)
+    cheapest_premiums = np.where(cheapest_offsets >= 0, premiums[cheapest_offsets], np.inf)
+    annual_costs = annual_costs_health_insurance(
+        treatment_costs_during_year=np.asarray(scenarios, dtype=float)[np.newaxis, :],
+        premium_per_month=cheapest_premiums[:, np.newaxis],
+        deductible_amount=np.array(list(deductibles.values()), dtype=float)[:, np.newaxis],
+    )
+    best_levels = np.argmin(annual_costs, axis=0)
+    return best_levels, cheapest_offsets[best_levels], annual_costs[best_levels, np.arange(len(scenarios))]
+
+
+def optimal_deductibles_for_profile(offer_finder, bfs_nr, canton, region, age_class, accident_insurance, scenarios=TREATMENT_COST_SCENARIOS):
+    """For every treatment cost scenario, the deductible level and offer with the lowest annual costs.
+
+    Returns a DataFrame with one row per scenario and the columns 'Treatment costs', 'Franchisestufe',
+    'offset' (row offset into premiums_df, -1 if there is no offer) and 'Annual costs'.
+    """
+    premiums = offer_finder.premiums_df['Prämie'].to_numpy(dtype=float)
+    best_levels, offsets, annual_costs = _optimal_deductibles(offer_finder, premiums, bfs_nr, canton, region, age_class, accident_insurance, scenarios)
+    return pd.DataFrame({
+        'Treatment costs': scenarios,
+        'Franchisestufe': np.array(list(AGE_CLASS_DEDUCTIBLES[age_class]))[best_levels],
+        'offset': offsets,
+        'Annual costs': annual_costs,
+    })
+
+
+def precompute_canton(premiums_df, premium_regions_df, insurance_model_restrictions_df, canton, scenarios=TREATMENT_COST_SCENARIOS):
+    """Optimal deductibles for all municipalities of a canton.
+
+    premiums_df must have a RangeIndex, the offsets in the results refer to its rows.
+    """
+    canton_premiums_df = premiums_df[premiums_df['Kanton'] == canton]
+    offer_finder = OfferFinder(canton_premiums_df, insurance_model_restrictions_df[insurance_model_restrictions_df['Kanton'] == canton])
+    global_offsets = canton_premiums_df.index.to_numpy()
+    canton_premiums = canton_premiums_df['Prämie'].to_numpy(dtype=float)
+    municipalities = premium_regions_df.loc[premium_regions_df['Kanton'] == canton, ['BFS-Nr.', 'Region']].drop_duplicates('BFS-Nr.')
+
+    optimal_deductibles = {key: [] for key in MUNICIPALITY_PROFILE_KEYS + ['Treatment costs', 'Franchisestufe', 'offset', 'Annual costs']}
+    for bfs_nr, region in municipalities.itertuples(index=False):
+        for age_class, deductibles in AGE_CLASS_DEDUCTIBLES.items():
+            for accident_insurance in ACCIDENT_INSURANCE_OPTIONS:
+                best_levels, offsets, annual_costs = _optimal_deductibles(offer_finder, canton_premiums, bfs_nr, canton, region, age_class, accident_insurance, scenarios)
+                optimal_deductibles['BFS-Nr.'].extend([bfs_nr] * len(scenarios))
+                optimal_deductibles['Altersklasse'].extend([age_class] * len(scenarios))
+                optimal_deductibles['Unfalleinschluss'].extend([accident_insurance] * len(scenarios))
+                optimal_deductibles['Treatment costs'].extend(scenarios)
+                optimal_deductibles['Franchisestufe'].extend(np.array(list(deductibles))[best_levels])
+                optimal_deductibles['offset'].extend(np.where(offsets >= 0, global_offsets[offsets], -1))
+                optimal_deductibles['Annual costs'].extend(annual_costs)
+
+    return _compact(pd.DataFrame(optimal_deductibles))
+
+
+def _compact(df):
+    # Small dtypes, so the tables stay small on disk and in memory.
+    for column in ['Altersklasse', 'Franchisestufe', 'Unfalleinschluss']:
+        if column in df:
+            df[column] = df[column].astype('category')
+    for column, dtype in [('BFS-Nr.', np.int32), ('offset', np.int32), ('Treatment costs', np.int32), ('Annual costs', np.float32)]:
+        if column in df:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def _precompute_canton_from_snapshot(canton, version, data_dir, scenarios):
+    # Runs in a worker process: every worker reads the (memory-mapped) snapshot itself instead of
+    # receiving the DataFrames through pickling.
+    datasets = read_snapshot(version, data_dir)
+    return precompute_canton(datasets.premiums, datasets.premium_regions, datasets.insurance_model_restrictions, canton, scenarios)
+
+
+def precompute(version=None, data_dir=None, scenarios=TREATMENT_COST_SCENARIOS, max_workers=None):
+    """Precompute the results for all cantons in a process pool and store them in the snapshot directory."""
+    datasets = read_snapshot(version, data_dir)
+    cantons = sorted(datasets.premium_regions['Kanton'].dropna().unique())
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_precompute_canton_from_snapshot, cantons, repeat(datasets.version), repeat(data_dir),
+                                    repeat(scenarios)))
+
+    optimal_deductibles_df = _compact(pd.concat(results, ignore_index=True))
+    directory = snapshot_path(datasets.version, data_dir)
+    optimal_deductibles_df.to_parquet(directory / (OPTIMAL_DEDUCTIBLES_FILE + ".tmp"), index=False)
+    os.replace(directory / (OPTIMAL_DEDUCTIBLES_FILE + ".tmp"), directory / OPTIMAL_DEDUCTIBLES_FILE)
+    return optimal_deductibles_df
+
+
+class PrecomputedResults:
+    """Table lookups into the precomputed results of one snapshot."""
+
+    def __init__(self, optimal_deductibles_df):
+        self.optimal_deductibles_index = PremiumIndex(optimal_deductibles_df, MUNICIPALITY_PROFILE_KEYS, sort_by='Treatment costs')
+
+    def optimal_deductibles(self, bfs_nr, age_class, accident_insurance):
+        return self.optimal_deductibles_index.lookup((int(bfs_nr), age_class, accident_insurance))
+
+
+def load_precomputed(version, data_dir=None):
+    """The precomputed results of the snapshot, or None if `python precompute.py` was not run for it."""
+    directory = snapshot_path(version, data_dir)
+    if not (directory / OPTIMAL_DEDUCTIBLES_FILE).exists():
+        return None
+    return PrecomputedResults(pd.read_parquet(directory / OPTIMAL_DEDUCTIBLES_FILE))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the optimal deductibles for every municipality and profile.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    optimal_deductibles_df = precompute(max_workers=args.workers)
+    print(f"Precomputed {len(optimal_deductibles_df)} optimal deductibles in {time.perf_counter() - start:.1f} s.")
@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_loading import DATA_DIR, PREMIUMS_SCHEMA, apply_schema, read_snapshot
+from premium_index import OFFER_KEYS, PremiumIndex
+
+# Premiums of several years in one store, so the app can compare them without reading the premium file of every year.
+# Every year is ingested once. Only the plans that are new or whose premium (or name) changed against the year before
+# are stored for it, together with the plans that are no longer offered (without premium). The premiums of a plan in
+# a year are then those of its last change up to that year. Years are only ever appended, the stored ones are not rewritten.
+#
+# Layout of the history directory (next to the snapshots of data_loading.py):
+#   history/segments/<year>/<column number>.npy  the changes of the year, text columns as codes of the categories
+#   history/manifest.json                        the ingested years with a hash of their premiums, and the categories
+#                                                of the text columns (new values are appended, so the codes stay valid)
+#
+# Ingest from the shiny_app directory: python premium_history.py [<premium file of the BAG>.csv ...]
+# Without files, the premiums of the current snapshot are ingested (nothing happens if their year is already stored).
+HISTORY_DIR = "history"
+# One plan of an insurer, in a premium region, for an age class, deductible level and accident insurance
+PLAN_KEYS = ['Versicherer', 'Kanton', 'Region', 'Altersklasse', 'Franchisestufe', 'Unfalleinschluss', 'Tarif']
+VALUE_COLUMNS = ['Prämie', 'Tarifbezeichnung', 'Tariftyp', 'Franchise']
+STORE_COLUMNS = PLAN_KEYS + VALUE_COLUMNS
+TEXT_COLUMNS = [column for column in STORE_COLUMNS if column not in ('Versicherer', 'Prämie')]
+YEAR_COLUMN = 'Geschäftsjahr'
+# Year until which the last change of a plan is valid if there is no later one
+NO_LATER_CHANGE = np.iinfo(np.int16).max
+
+
+def _history_dir(data_dir=None):
+    return Path(data_dir or DATA_DIR) / HISTORY_DIR
+
+
+def _read_manifest(data_dir=None):
+    manifest_file = _history_dir(data_dir) / "manifest.json"
+    if not manifest_file.exists():
+        return None
+    return json.loads(manifest_file.read_text())
+
+
+def _normalized(premiums_df):
+    # The stored columns with plain values, so tables read with different categories compare equal. The text columns
+    # are cast to the string dtype, which keeps missing values missing (str would turn them into "nan" with pandas 2).
+    table = premiums_df[STORE_COLUMNS].dropna(subset=['Prämie'])
+    table = table.astype({column: "string" for column in TEXT_COLUMNS} | {'Versicherer': 'int64', 'Prämie': 'float32'})
+    return table.sort_values(PLAN_KEYS, ignore_index=True)
+
+
+def _code_dtype(number_of_categories):
+    # Smallest integer type for the codes (and -1 for missing values), every segment can have its own
+    return next(dtype for dtype in (np.int8, np.int16, np.int32) if number_of_categories <= np.iinfo(dtype).max)
+
+
+def _content_hash(table):
+    return hashlib.sha256(pd.util.hash_pandas_object(table, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def _differs(values, previous):
+    # Missing values are equal to each other and differ from every value
+    return (values.ne(previous).fillna(True) & ~(values.isna() & previous.isna())).to_numpy(dtype=bool)
+
+
+def _changes(table, previous):
+    # Rows of `table` that are new or changed against `previous`, and the plans of `previous` missing in `table` (without premium)
+    merged = table.merge(previous, on=PLAN_KEYS, how='outer', suffixes=('', '_previous'), indicator=True)
+    changed = (merged['_merge'] == 'left_only').to_numpy()
+    both = (merged['_merge'] == 'both').to_numpy()
+    for column in VALUE_COLUMNS:
+        changed = changed | both & _differs(merged[column], merged[f'{column}_previous'])
+    removed = merged.loc[(merged['_merge'] == 'right_only').to_numpy(), PLAN_KEYS].assign(**{column: None for column in TEXT_COLUMNS if column not in PLAN_KEYS},
+                                                                                          Prämie=np.float32(np.nan))
+    return pd.concat([merged.loc[changed, STORE_COLUMNS], removed[STORE_COLUMNS]], ignore_index=True)
+
+
+def ingest_premiums(premiums_df, data_dir=None):
+    """Append the premiums of one year (a table like the premium file of the BAG) to the history.
+
+    Returns the number of stored rows, i.e. the plans that are new, changed or no longer offered, and 0 if the
+    year is already stored with the same premiums. Years have to be ingested in ascending order.
+    """
+    years = premiums_df[YEAR_COLUMN].unique()
+    if len(years) != 1:
+        raise ValueError(f"The premiums of exactly one year can be ingested at once, got the years {sorted(years)}.")
+    year = int(years[0])
+    table = _normalized(premiums_df)
+    if table.duplicated(PLAN_KEYS).any():
+        raise ValueError(f"The premiums of {year} have several rows for the same plan ({', '.join(PLAN_KEYS)}).")
+    content_hash = _content_hash(table)
+
+    manifest = _read_manifest(data_dir) or {"categories": {column: [] for column in TEXT_COLUMNS}, "years": []}
+    for stored in manifest["years"]:
+        if stored["year"] == year:
+            if stored["sha256"] == content_hash:
+                return 0
+            raise ValueError(f"The premiums of {year} are already stored with different values.")
+    if manifest["years"] and year < manifest["years"][-1]["year"]:
+        raise ValueError(f"The history already has later years than {year} and years can only be appended. "
+                         f"To add earlier years, delete {_history_dir(data_dir)} and ingest all years at once.")
+
+    history = load_premium_history(data_dir)
+    changes = table if history is None else _changes(table, _normalized(history.plans_in(history.years[-1])))
+
+    # Append the new values of the text columns to their categories, the codes of the stored years stay the same
+    columns = []
+    for column in STORE_COLUMNS:
+        values = changes[column]
+        if column in TEXT_COLUMNS:
+            categories = manifest["categories"][column]
+            known = set(categories)
+            categories.extend(sorted(value for value in values.dropna().unique() if value not in known))
+            values = pd.Categorical(values, categories=categories).codes.astype(_code_dtype(len(categories)))
+        else:
+            values = values.to_numpy(dtype=PREMIUMS_SCHEMA[column])
+        columns.append(values)
+
+    # Write the segment first and then the manifest, so an interrupted ingest leaves the history as it was
+    segment_dir = _history_dir(data_dir) / "segments" / str(year)
+    tmp_dir = segment_dir.with_name(f"{year}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for number, values in enumerate(columns):
+        np.save(tmp_dir / f"{number}.npy", values)
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    tmp_dir.rename(segment_dir)
+    manifest["years"].append({"year": year, "sha256": content_hash, "plans": len(table), "rows": len(changes)})
+    manifest_file = _history_dir(data_dir) / "manifest.json"
+    manifest_file.with_suffix(".tmp").write_text(json.dumps(manifest, ensure_ascii=False))
+    os.replace(manifest_file.with_suffix(".tmp"), manifest_file)
+    return len(changes)
+
+
+class PremiumHistory:
+    """Index lookups into the premiums of all years of the history.
+
+    Every stored row is valid from its year until the next change of its plan ('Valid until', exclusive).
+    The rows are sorted by plan and year, and indexed by plan and by profile (the keys of the offers in the app).
+    """
+
+    def __init__(self, changes_df, years):
+        self.years = list(years)
+        plans = changes_df.groupby(PLAN_KEYS, observed=True, sort=False).ngroup().to_numpy()
+        order = np.lexsort((changes_df[YEAR_COLUMN].to_numpy(), plans))
+        df = changes_df.take(order).reset_index(drop=True)
+        same_plan_next = plans[order][1:] == plans[order][:-1]
+        df['Valid until'] = np.where(np.append(same_plan_next, False), np.roll(df[YEAR_COLUMN].to_numpy(), -1), NO_LATER_CHANGE).astype(np.int16)
+        self.df = df
+        # Stable sorts, so the rows of every plan stay sorted by year
+        self.plan_index = PremiumIndex(df, PLAN_KEYS)
+        self.profile_index = PremiumIndex(df, OFFER_KEYS)
+
+    def _valid_in(self, offsets, years):
+        # For every row and year: whether the row holds the premium of its plan in that year
+        years = np.asarray(years)[np.newaxis, :]
+        from_year = self.df[YEAR_COLUMN].to_numpy()[offsets, np.newaxis]
+        valid_until = self.df['Valid until'].to_numpy()[offsets, np.newaxis]
+        offered = ~np.isnan(self.df['Prämie'].to_numpy()[offsets, np.newaxis])
+        return (from_year <= years) & (years < valid_until) & offered
+
+    def plans_in(self, year):
+        """All plans offered in the year with their premiums."""
+        valid = self._valid_in(np.arange(len(self.df)), [year])[:, 0]
+        return self.df.loc[valid, STORE_COLUMNS].assign(**{YEAR_COLUMN: year}).reset_index(drop=True)
+
+    def premium_trend(self, plan_key):
+        """Premium of a plan (values of PLAN_KEYS) in every year it was offered, with the change against the year before."""
+        offsets = self.plan_index.offsets(plan_key)
+        valid = self._valid_in(offsets, self.years)
+        # At most one valid row per year
+        year_numbers, row_numbers = np.nonzero(valid.T)
+        premiums = self.df['Prämie'].to_numpy(dtype=float)[offsets[row_numbers]]
+        trend = pd.DataFrame({YEAR_COLUMN: np.array(self.years, dtype=int)[year_numbers], 'Prämie': premiums})
+        trend['Change'] = trend['Prämie'].diff()
+        return trend
+
+    def cheapest_per_year(self, canton, region, age_class, deductible_level, accident_insurance, top_n=1):
+        """The `top_n` cheapest plans of the profile in every year, ranked by premium ('Rang' starting at 1).
+
+        `region` is the number of the premium region, as in the location of the app (see offers.py).
+        The history has no restrictions of the insurance models, so these are the plans of the premium region.
+        """
+        offsets = self.profile_index.offsets((canton, f"PR-REG CH{region}", age_class, deductible_level, accident_insurance))
+        valid = self._valid_in(offsets, self.years)
+        premiums = self.df['Prämie'].to_numpy()[offsets]
+        results = []
+        for year, valid_in_year in zip(self.years, valid.T):
+            candidates = np.flatnonzero(valid_in_year)
+            cheapest = candidates[np.argsort(premiums[candidates], kind='stable')[:top_n]]
+            results.append(self.df.take(offsets[cheapest])[STORE_COLUMNS].assign(**{YEAR_COLUMN: year, 'Rang': np.arange(1, len(cheapest) + 1)}))
+        return pd.concat(results, ignore_index=True)
+
+
+def load_premium_history(data_dir=None):
+    """The premium history, or None if no year was ingested yet."""
+    manifest = _read_manifest(data_dir)
+    if manifest is None or not manifest["years"]:
+        return None
+    segments = []
+    for stored in manifest["years"]:
+        segment_dir = _history_dir(data_dir) / "segments" / str(stored["year"])
+        arrays = {}
+        for number, column in enumerate(STORE_COLUMNS):
+            values = np.load(segment_dir / f"{number}.npy")
+            if column in TEXT_COLUMNS:
+                values = pd.Categorical.from_codes(values, categories=pd.Index(manifest["categories"][column]))
+            arrays[column] = values
+        segments.append(pd.DataFrame(arrays).assign(**{YEAR_COLUMN: np.int16(stored["year"])}))
+    # Same categories in all segments, so the concatenated text columns stay categorical
+    changes_df = pd.concat(segments, ignore_index=True)
+    return PremiumHistory(changes_df, [stored["year"] for stored in manifest["years"]])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append the premiums of a year to the premium history.")
+    parser.add_argument("files", nargs="*", help="premium files of the BAG (Prämien_CH.csv), default: the premiums of the current snapshot")
+    args = parser.parse_args()
+
+    tables = [apply_schema(pd.read_csv(file), PREMIUMS_SCHEMA) for file in args.files] or [read_snapshot().premiums]
+    for premiums_df in sorted(tables, key=lambda df: int(df[YEAR_COLUMN].min())):
+        year = int(premiums_df[YEAR_COLUMN].min())
+        rows = ingest_premiums(premiums_df)
+        print(f"{year}: {rows} new, changed or removed plans stored." if rows else f"{year}: already stored.")
+    manifest = _read_manifest()
+    print("Years in the history: " + ", ".join(f"{stored['year']} ({stored['rows']} of {stored['plans']} plans stored)" for stored in manifest["years"]))
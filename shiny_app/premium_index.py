@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+# Key columns of the two lookups the app needs on every request.
+OFFER_KEYS = ['Kanton', 'Region', 'Altersklasse', 'Franchisestufe', 'Unfalleinschluss']
+# All deductible levels of a profile in one group (simulation of all plans, household mode)
+PROFILE_KEYS = ['Kanton', 'Region', 'Altersklasse', 'Unfalleinschluss']
+# The plans are identified by their codes, the names (e.g. 'Versicherung') can be missing.
+DEDUCTIBLE_LEVEL_KEYS = ['Versicherer', 'Tarif', 'Unfalleinschluss', 'Kanton', 'Region', 'Altersklasse']
+
+
+class PremiumIndex:
+    """Maps a tuple of key column values to the row offsets in the DataFrame that match it.
+
+    The index is built once at startup, so a lookup is a binary search plus a `take` of the
+    matching rows instead of comparing every row of the DataFrame with the key.
+    It is stored in a few flat arrays instead of a dict of groups: every key is encoded as one integer
+    (the codes of its values combined), and the row offsets are sorted by this integer, so building the
+    index is vectorized and does not create Python objects per group.
+    """
+
+    def __init__(self, df, keys, sort_by=None):
+        self.df = df
+        self.keys = list(keys)
+        # Code of every value of the key columns (categoricals already have them), -1 for missing values
+        self._value_codes = []
+        codes = []
+        for key in self.keys:
+            if isinstance(df[key].dtype, pd.CategoricalDtype):
+                column_codes, uniques = df[key].cat.codes.to_numpy(), df[key].cat.categories
+            else:
+                column_codes, uniques = pd.factorize(df[key])
+            self._value_codes.append({self._normalize_value(value): code for code, value in enumerate(uniques)})
+            codes.append(np.asarray(column_codes, dtype=np.int64))
+        self._radixes = [len(value_codes) for value_codes in self._value_codes]
+        if np.prod(self._radixes, dtype=float) >= 2 ** 63:
+            raise ValueError(f"Too many combinations of the values of {self.keys} to encode a key as one integer.")
+
+        complete = np.ones(len(df), dtype=bool)
+        for column_codes in codes:
+            complete &= column_codes >= 0
+        key_codes = self._combine(np.where(complete, column_codes, 0) for column_codes in codes)
+        if sort_by is None:
+            order = np.argsort(key_codes, kind="stable")
+        else:
+            # Sort once here, so the rows of every group are already in the order the app shows them.
+            order = np.lexsort((df[sort_by].to_numpy(), key_codes))
+        # Rows with missing key values can not be looked up.
+        self._order = order[complete[order]]
+        self._keys, self._starts = np.unique(key_codes[self._order], return_index=True)
+        self._ends = np.append(self._starts[1:], len(self._order))
+        self._empty = df.iloc[0:0]
+
+    @staticmethod
+    def _normalize_value(value):
+        return value.item() if isinstance(value, np.generic) else value
+
+    def _combine(self, codes):
+        key_code = 0
+        for column_codes, radix in zip(codes, self._radixes):
+            key_code = key_code * radix + column_codes
+        return np.asarray(key_code, dtype=np.int64)
+
+    def _group(self, key):
+        codes = []
+        for value, value_codes in zip(key, self._value_codes):
+            code = value_codes.get(self._normalize_value(value))
+            if code is None:
+                return None
+            codes.append(code)
+        key_code = self._combine(codes)
+        group = np.searchsorted(self._keys, key_code)
+        if group == len(self._keys) or self._keys[group] != key_code:
+            return None
+        return group
+
+    def offsets(self, key):
+        group = self._group(key)
+        if group is None:
+            return np.empty(0, dtype=np.intp)
+        return self._order[self._starts[group]:self._ends[group]]
+
+    def lookup(self, key):
+        group = self._group(key)
+        if group is None:
+            return self._empty
+        return self.df.take(self._order[self._starts[group]:self._ends[group]])
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def filter_with_masks(df, key_columns, key, sort_by=None):
+    # The straightforward way to filter: one boolean mask per key column. Kept as reference for tests and benchmarks.
+    mask = np.ones(len(df), dtype=bool)
+    for column, value in zip(key_columns, key):
+        mask &= (df[column] == value).to_numpy()
+    filtered = df[mask]
+    return filtered.sort_values(by=sort_by, kind="stable") if sort_by else filtered
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# A plan (insurance model) is identified by these columns in both the premiums and the restrictions table.
+PLAN_KEYS = ['Kanton', 'Region', 'Versicherer', 'Tarif', 'Tariftyp']
+
+
+class MunicipalityRestrictions:
+    """Which restricted plans (e.g. HMO models) are offered in which municipality.
+
+    Every restricted plan gets a small integer id, and for every municipality (BFS-Nr.) we keep the sorted
+    array of restricted plan ids that are offered there. Checking offers against a municipality is then
+    one dict lookup plus an integer comparison instead of a Python-level scan over the municipality lists.
+    """
+
+    def __init__(self, insurance_model_restrictions_df):
+        restrictions = insurance_model_restrictions_df.dropna(subset=["Gemeinden-BFS"])
+        allowed_municipalities = {}
+        for *plan_key, municipalities in restrictions[PLAN_KEYS + ["Gemeinden-BFS"]].itertuples(index=False):
+            allowed_municipalities.setdefault(tuple(plan_key), set()).update(int(bfs_nr) for bfs_nr in str(municipalities).split(","))
+
+        self.plans = list(allowed_municipalities)
+        self._plan_index = pd.MultiIndex.from_tuples(self.plans, names=PLAN_KEYS) if self.plans else None
+        allowed_plan_ids = {}
+        for plan_id, municipalities in enumerate(allowed_municipalities.values()):
+            for bfs_nr in municipalities:
+                allowed_plan_ids.setdefault(bfs_nr, []).append(plan_id)
+        self._allowed_plan_ids = {bfs_nr: np.array(sorted(plan_ids), dtype=np.int32) for bfs_nr, plan_ids in allowed_plan_ids.items()}
+        self._no_plans = np.empty(0, dtype=np.int32)
+
+    def plan_ids(self, df):
+        """Restricted plan id for every row of `df`, -1 for rows of plans without restriction."""
+        if self._plan_index is None:
+            return np.full(len(df), -1, dtype=np.int32)
+        return self._plan_index.get_indexer(pd.MultiIndex.from_frame(df[PLAN_KEYS])).astype(np.int32)
+
+    def allowed_plan_ids(self, bfs_nr):
+        return self._allowed_plan_ids.get(int(bfs_nr), self._no_plans)
+
+    def available_plans(self, bfs_nr):
+        """The restricted plans that are offered in the given municipality."""
+        return frozenset(self.plans[plan_id] for plan_id in self.allowed_plan_ids(bfs_nr))
+
+    def is_available(self, plan_ids, bfs_nr):
+        """Boolean mask for the given plan ids: True if the plan is not restricted or offered in the municipality."""
+        plan_ids = np.asarray(plan_ids)
+        return (plan_ids < 0) | np.isin(plan_ids, self.allowed_plan_ids(bfs_nr))
@@ -0,0 +1,142 @@
+import fcntl
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_loading import DATA_DIR, SOURCES, Datasets, current_version, load_datasets, read_snapshot, snapshot_path
+
+# Datasets shared by all worker processes of a server (uvicorn --workers N).
+# The tables of a snapshot are exported once as fixed-width column arrays (.npy files; text columns as categorical
+# codes plus their categories), and every worker memory-maps these files read-only. The column arrays of the
+# DataFrames are the mapped pages themselves, so all workers share one copy in the page cache and attaching takes
+# milliseconds instead of decoding the Parquet files in every process.
+#
+# Layout, next to the snapshot:
+#   snapshots/<version>/columnar/<export>/<dataset>/<column number>.npy             values, or codes of a categorical column
+#   snapshots/<version>/columnar/<export>/<dataset>/<column number>.categories.npy  categories of a categorical column
+#   snapshots/<version>/columnar/<export>/metadata.json                             columns of every dataset
+#   snapshots/<version>/columnar/CURRENT                                            name of the last complete export
+#
+# Enable with HEALTH_INSURANCE_SHARED_DATA=1. The export is written by the first worker that needs it (the others
+# wait for it), or beforehand with `python shared_datasets.py`.
+COLUMNAR_DIR = "columnar"
+
+
+def _columnar_dir(version, data_dir=None):
+    return snapshot_path(version, data_dir) / COLUMNAR_DIR
+
+
+def current_export(version, data_dir=None):
+    """Directory of the last complete export of the snapshot, or None if it was not exported yet."""
+    current_file = _columnar_dir(version, data_dir) / "CURRENT"
+    if not current_file.exists():
+        return None
+    return _columnar_dir(version, data_dir) / current_file.read_text().strip()
+
+
+def _save_categories(path, categories):
+    # Fixed-width arrays, so they are loaded without pickle: numbers and dates keep their dtype, everything else
+    # (the text columns) is stored as str.
+    if categories.dtype.kind in "biufmM":
+        np.save(path, categories.to_numpy())
+    else:
+        np.save(path, categories.to_numpy(dtype=str))
+
+
+def _load_categories(path):
+    categories = np.load(path)
+    return pd.Index(categories.astype(object) if categories.dtype.kind == "U" else categories)
+
+
+def export_columnar(datasets, data_dir=None):
+    """Write the tables of the snapshot as column arrays next to it and make them the current export."""
+    export = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    columnar_dir = _columnar_dir(datasets.version, data_dir)
+    directory = columnar_dir / export
+    tmp_dir = columnar_dir / f"{export}.{os.getpid()}.tmp"
+    metadata = {}
+    for name in SOURCES:
+        df = getattr(datasets, name)
+        (tmp_dir / name).mkdir(parents=True)
+        columns = []
+        for number, column in enumerate(df.columns):
+            values = df[column]
+            if not isinstance(values.dtype, pd.CategoricalDtype) and values.dtype.kind not in "biuf":
+                # Text (and other variable-width) columns are stored as codes of a categorical
+                values = values.astype("category")
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                np.save(tmp_dir / name / f"{number}.npy", values.cat.codes.to_numpy())
+                _save_categories(tmp_dir / name / f"{number}.categories.npy", values.cat.categories)
+                columns.append({"name": column, "categorical": True})
+            else:
+                np.save(tmp_dir / name / f"{number}.npy", values.to_numpy())
+                columns.append({"name": column})
+        metadata[name] = columns
+    (tmp_dir / "metadata.json").write_text(json.dumps(metadata, ensure_ascii=False))
+
+    # Only switch CURRENT after the export is complete, so attaching never sees a partial one.
+    tmp_dir.rename(directory)
+    (columnar_dir / "CURRENT.tmp").write_text(export)
+    os.replace(columnar_dir / "CURRENT.tmp", columnar_dir / "CURRENT")
+    # Workers that already attached a previous export keep their mapping of the deleted files
+    for previous in columnar_dir.iterdir():
+        if previous.is_dir() and previous != directory and not previous.name.endswith(".tmp"):
+            shutil.rmtree(previous, ignore_errors=True)
+    return directory
+
+
+def attach_columnar(version, data_dir=None):
+    """Datasets backed by the memory-mapped column arrays of the snapshot (read-only, zero copy)."""
+    directory = current_export(version, data_dir)
+    metadata = json.loads((directory / "metadata.json").read_text())
+    tables = {}
+    for name, columns in metadata.items():
+        arrays = {}
+        for number, column in enumerate(columns):
+            # A plain ndarray view of the mapped file, so pandas does not pass the memmap subclass on to its results
+            values = np.load(directory / name / f"{number}.npy", mmap_mode="r").view(np.ndarray)
+            if column.get("categorical"):
+                values = pd.Categorical.from_codes(values, categories=_load_categories(directory / name / f"{number}.categories.npy"))
+            arrays[column["name"]] = values
+        # copy=False keeps every column in its own block, pointing to the mapped file
+        tables[name] = pd.DataFrame(arrays, copy=False)
+    # The premiums were exported with PREMIUMS_SCHEMA already applied (see read_snapshot)
+    return Datasets(
+        premiums=tables["premiums"],
+        premium_regions=tables["premium_regions"],
+        insurance_model_restrictions=tables["insurance_model_restrictions"],
+        version=version,
+    )
+
+
+def load_shared_datasets(refresh=False, data_dir=None):
+    """Like load_datasets, but the tables are attached to the shared column arrays of the snapshot."""
+    data_dir = Path(data_dir or DATA_DIR)
+    version = current_version(data_dir)
+    if refresh or version is None:
+        version = load_datasets(refresh, data_dir).version
+    if current_export(version, data_dir) is None:
+        # Only one process writes the export, the others wait for the lock and then attach to it.
+        with open(snapshot_path(version, data_dir) / (COLUMNAR_DIR + ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if current_export(version, data_dir) is None:
+                export_columnar(read_snapshot(version, data_dir), data_dir)
+    return attach_columnar(version, data_dir)
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    datasets = read_snapshot()
+    print(f"Exported snapshot {datasets.version} to {export_columnar(datasets)} in {time.perf_counter() - start:.1f} s.")
+    if "--check" in sys.argv[1:]:
+        attached = attach_columnar(datasets.version)
+        for name in SOURCES:
+            pd.testing.assert_frame_equal(getattr(attached, name), getattr(datasets, name), check_dtype=False, check_categorical=False)
+        print("The attached tables are equal to the snapshot.")
@@ -0,0 +1,176 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from cost_model import MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE, annual_costs_health_insurance
+
+# Monte Carlo simulation of the annual costs for uncertain treatment costs.
+# The treatment costs are sampled from a distribution in chunks, and the costs you pay yourself (deductible and
+# share of the costs, without the premium) are calculated for every deductible amount at once. They only depend on
+# the deductible amount, not on the plan, so the samples are evaluated once per distinct deductible amount, and the
+# statistics of every plan are the ones of its deductible amount shifted by its yearly premium.
+# The chunks run on a thread pool (or any other executor, e.g. a process pool), and only their summaries are kept:
+# count, mean, sum of squared deviations and a histogram of the costs (with a resolution of 5 Rappen, the costs
+# you pay yourself are at most deductible + 700 CHF), so the memory does not grow with the number of samples.
+DEFAULT_SAMPLES = 1_000_000
+CHUNK_SIZE = 65_536
+PERCENTILES = (50, 90, 95, 99)
+PERCENTILE_RESOLUTION = 0.05
+
+
+class ZeroInflatedLognormal(NamedTuple):
+    """No treatment costs with probability `zero_share`, otherwise lognormal costs around `median`."""
+    zero_share: float
+    median: float
+    sigma: float
+
+    def sample(self, rng, size):
+        treatment_costs = rng.lognormal(np.log(self.median), self.sigma, size)
+        treatment_costs[rng.random(size) < self.zero_share] = 0.0
+        return treatment_costs
+
+
+class EmpiricalHistogram(NamedTuple):
+    """Treatment costs distributed like a histogram, uniformly within every bin."""
+    bin_edges: tuple
+    counts: tuple
+
+    @classmethod
+    def from_costs(cls, treatment_costs, bins=50):
+        counts, bin_edges = np.histogram(treatment_costs, bins=bins)
+        return cls(tuple(bin_edges.tolist()), tuple(counts.tolist()))
+
+    def sample(self, rng, size):
+        bin_edges, counts = np.asarray(self.bin_edges, dtype=float), np.asarray(self.counts, dtype=float)
+        bins = rng.choice(len(counts), size=size, p=counts / counts.sum())
+        return bin_edges[bins] + rng.random(size) * (bin_edges[bins + 1] - bin_edges[bins])
+
+
+class OutOfPocketStatistics(NamedTuple):
+    """Statistics of the costs you pay yourself (without premium) for every deductible amount."""
+    deductible_amounts: np.ndarray
+    n_samples: int
+    mean: np.ndarray
+    variance: np.ndarray
+    # Percentile -> value for every deductible amount
+    percentiles: dict
+
+    def annual_costs(self, premiums_per_month, deductible_amounts):
+        """Statistics of the annual costs of plans with the given premiums and deductible amounts, one row per plan."""
+        positions = np.searchsorted(self.deductible_amounts, deductible_amounts)
+        if np.any(self.deductible_amounts[np.minimum(positions, len(self.deductible_amounts) - 1)] != deductible_amounts):
+            raise ValueError("Some deductible amounts were not simulated.")
+        premiums_per_year = 12 * np.asarray(premiums_per_month, dtype=float)
+        result = {
+            'Expected costs': premiums_per_year + self.mean[positions],
+            'Variance': self.variance[positions],
+            'Standard deviation': np.sqrt(self.variance[positions]),
+        }
+        # The annual costs grow with the treatment costs, so their percentiles are the premium plus the percentiles of the costs you pay yourself.
+        for percentile, values in self.percentiles.items():
+            result[f'P{percentile}'] = premiums_per_year + values[positions]
+        return pd.DataFrame(result)
+
+
+def chunk_seeds(n_samples, chunk_size=CHUNK_SIZE, seed=0):
+    """Size and random seed of every chunk. The chunks get independent streams, so the results don't depend on the executor."""
+    sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _n_bins(deductible_amounts):
+    return int(np.ceil((deductible_amounts.max() + MAX_AMOUNT_YOU_PAY_AFTER_DEDUCTIBLE) / PERCENTILE_RESOLUTION)) + 1
+
+
+def _chunk_statistics(distribution, deductible_amounts, size, seed):
+    treatment_costs = distribution.sample(np.random.default_rng(seed), size)
+    # Deductible amounts (rows) x samples (columns), without premium
+    costs = annual_costs_health_insurance(treatment_costs[np.newaxis, :], 0.0, deductible_amounts[:, np.newaxis])
+    mean = costs.mean(axis=1)
+    squared_deviations = ((costs - mean[:, np.newaxis]) ** 2).sum(axis=1)
+    # One histogram per deductible amount, counted with a single bincount
+    n_bins = _n_bins(deductible_amounts)
+    bins = np.minimum(np.rint(costs / PERCENTILE_RESOLUTION).astype(np.int64), n_bins - 1)
+    bins += np.arange(len(deductible_amounts))[:, np.newaxis] * n_bins
+    histogram = np.bincount(bins.ravel(), minlength=len(deductible_amounts) * n_bins).reshape(len(deductible_amounts), n_bins)
+    return size, mean, squared_deviations, histogram
+
+
+def simulate_out_of_pocket(distribution, deductible_amounts, n_samples=DEFAULT_SAMPLES, chunk_size=CHUNK_SIZE, percentiles=PERCENTILES,
+                           seed=0, executor=None, max_workers=None):
+    """Simulate the costs you pay yourself for the distinct deductible amounts, see the top of this module."""
+    deductible_amounts = np.unique(np.asarray(deductible_amounts, dtype=float))
+    count, mean, squared_deviations, histogram = 0, np.zeros(len(deductible_amounts)), np.zeros(len(deductible_amounts)), 0
+
+    def combine(chunk):
+        # Combine the mean and the squared deviations of two parts (Chan et al.)
+        nonlocal count, mean, squared_deviations, histogram
+        chunk_count, chunk_mean, chunk_squared_deviations, chunk_histogram = chunk
+        total = count + chunk_count
+        delta = chunk_mean - mean
+        mean = mean + delta * chunk_count / total
+        squared_deviations = squared_deviations + chunk_squared_deviations + delta ** 2 * count * chunk_count / total
+        histogram = histogram + chunk_histogram
+        count = total
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+    try:
+        # At most two chunks per worker are in flight, the results are combined in order.
+        window = 2 * (getattr(executor, '_max_workers', None) or os.cpu_count() or 1)
+        pending = deque()
+        for size, seed_sequence in chunk_seeds(n_samples, chunk_size, seed):
+            pending.append(executor.submit(_chunk_statistics, distribution, deductible_amounts, size, seed_sequence))
+            if len(pending) >= window:
+                combine(pending.popleft().result())
+        while pending:
+            combine(pending.popleft().result())
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    cumulative_counts = np.cumsum(histogram, axis=1)
+    percentile_values = {}
+    for percentile in percentiles:
+        rank = max(1, int(np.ceil(percentile / 100 * count)))
+        percentile_values[percentile] = np.array([np.searchsorted(row, rank) for row in cumulative_counts]) * PERCENTILE_RESOLUTION
+    return OutOfPocketStatistics(deductible_amounts, count, mean, squared_deviations / max(count - 1, 1), percentile_values)
+
+
+def simulate_annual_costs(distribution, premiums_per_month, deductible_amounts, **kwargs):
+    """Statistics of the annual costs of every plan (premium and deductible amount), see OutOfPocketStatistics.annual_costs."""
+    statistics = simulate_out_of_pocket(distribution, deductible_amounts, **kwargs)
+    return statistics.annual_costs(premiums_per_month, np.asarray(deductible_amounts, dtype=float))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the costs you pay yourself for zero-inflated lognormal treatment costs.")
+    parser.add_argument("--zero-share", type=float, default=0.15, help="probability of no treatment costs")
+    parser.add_argument("--median", type=float, default=800, help="median treatment costs if there are any (CHF)")
+    parser.add_argument("--sigma", type=float, default=1.2, help="spread of the lognormal distribution")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--processes", action="store_true", help="run the chunks on a process pool instead of a thread pool")
+    args = parser.parse_args()
+
+    from precompute import AGE_CLASS_DEDUCTIBLES
+
+    start = time.perf_counter()
+    distribution = ZeroInflatedLognormal(args.zero_share, args.median, args.sigma)
+    deductible_amounts = sorted({amount for deductibles in AGE_CLASS_DEDUCTIBLES.values() for amount in deductibles.values()})
+    if args.processes:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            statistics = simulate_out_of_pocket(distribution, deductible_amounts, args.samples, executor=executor)
+    else:
+        statistics = simulate_out_of_pocket(distribution, deductible_amounts, args.samples, max_workers=args.workers)
+    print(pd.DataFrame({'Deductible': statistics.deductible_amounts, 'Expected costs': statistics.mean,
+                        'Standard deviation': np.sqrt(statistics.variance)} |
+                       {f'P{percentile}': values for percentile, values in statistics.percentiles.items()}).round(2).to_string(index=False))
+    print(f"{statistics.n_samples} samples in {time.perf_counter() - start:.2f} s.")
@@ -0,0 +1,40 @@
+import asyncio
+import json
+import sys
+
+from starlette.requests import Request
+
+import app
+
+
+def test_health_and_readiness_endpoints(snapshot_dir):
+    assert asyncio.run(app.healthz(None)).status_code == 200
+    app.app_data.load_now()
+    response = asyncio.run(app.readyz(None))
+    assert response.status_code == 200
+    assert json.loads(response.body)["status"] == "ready"
+    assert len(app.app_data.get().municipality_choices) > 1
+
+
+def test_metrics_endpoint_needs_token(monkeypatch):
+    def request(authorization=None):
+        headers = [] if authorization is None else [(b"authorization", authorization.encode())]
+        return Request({"type": "http", "method": "GET", "path": "/metrics", "headers": headers, "client": ("127.0.0.1", 50000)})
+
+    # Disabled without a token, also for local clients (e.g. a reverse proxy on the same host)
+    monkeypatch.delenv("HEALTH_INSURANCE_METRICS_TOKEN", raising=False)
+    assert asyncio.run(app.metrics(request("Bearer secret"))).status_code == 404
+    monkeypatch.setenv("HEALTH_INSURANCE_METRICS_TOKEN", "secret")
+    assert asyncio.run(app.metrics(request())).status_code == 401
+    assert asyncio.run(app.metrics(request("Bearer wrong"))).status_code == 401
+    response = asyncio.run(app.metrics(request("Bearer secret")))
+    assert response.status_code == 200
+    assert b'health_insurance_cache_hits_total{cache="offers"}' in response.body
+
+
+def test_gunicorn_preload_is_detected(monkeypatch):
+    assert not app.preloaded_by_gunicorn(["gunicorn", "app:app", "--preload"], {})
+    monkeypatch.setitem(sys.modules, "gunicorn", object())
+    assert app.preloaded_by_gunicorn(["gunicorn", "app:app", "--preload", "-w", "4"], {})
+    assert app.preloaded_by_gunicorn(["gunicorn", "app:app"], {"GUNICORN_CMD_ARGS": "--preload -w 4"})
+    assert not app.preloaded_by_gunicorn(["gunicorn", "app:app", "-w", "4"], {})
@@ -0,0 +1,32 @@
+import threading
+
+import pytest
+
+from background_loading import BackgroundLoader
+
+
+def test_loads_once_in_background():
+    release = threading.Event()
+    calls = []
+    loader = BackgroundLoader(lambda: calls.append(1) or release.wait() and "data")
+    assert loader.status() == {"status": "not started"}
+    loader.start()
+    loader.start()
+    assert loader.status()["status"] == "loading"
+    assert not loader.is_ready()
+    with pytest.raises(RuntimeError):
+        loader.get()
+    release.set()
+    assert loader.load_now() == "data"
+    assert loader.status()["status"] == "ready"
+    assert calls == [1]
+
+
+def test_failed_loading_is_reported():
+    loader = BackgroundLoader(lambda: 1 / 0)
+    loader.start()
+    assert loader.wait(5)
+    assert not loader.is_ready()
+    assert loader.status()["status"] == "failed"
+    with pytest.raises(RuntimeError, match="division by zero"):
+        loader.get()
@@ -0,0 +1,63 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from breakeven import PLAN_GROUP_KEYS, crossover_table, optimal_deductible_intervals, optimal_level_at
+from conftest import fixture_premiums_csv
+from cost_model import DEDUCTIBLE_ADULT_LVL_TO_AMOUNT, DEDUCTIBLE_CHILD_LVL_TO_AMOUNT, annual_costs_health_insurance
+
+
+def test_two_levels_crossover_point():
+    # 300 CHF deductible for 400 CHF/month, 2500 CHF deductible for 250 CHF/month:
+    # 12 * 250 + x = 12 * 400 + 300 + 0.1 * (x - 300)  =>  x = 2300
+    intervals = optimal_deductible_intervals([400, 250], [300, 2500])
+    assert [interval.level for interval in intervals] == [1, 0]
+    assert intervals[0].start == 0
+    assert intervals[1].start == pytest.approx(2300)
+    assert intervals[1].end == np.inf
+
+
+@pytest.mark.parametrize("deductibles", [list(DEDUCTIBLE_ADULT_LVL_TO_AMOUNT.values()), list(DEDUCTIBLE_CHILD_LVL_TO_AMOUNT.values())])
+def test_intervals_match_dense_sampling(deductibles):
+    rng = np.random.default_rng(42)
+    deductibles = np.array(deductibles, dtype=float)
+    treatment_costs = np.linspace(0, 15000, 150001) + 0.05
+    for _ in range(50):
+        premiums = rng.uniform(80, 450) - deductibles * rng.uniform(0, 0.12) / 12 * 10 + rng.normal(0, 4, len(deductibles))
+        intervals = optimal_deductible_intervals(premiums, deductibles)
+
+        assert intervals[0].start == 0 and intervals[-1].end == np.inf
+        assert all(previous.end == following.start for previous, following in zip(intervals, intervals[1:]))
+
+        costs = annual_costs_health_insurance(treatment_costs[np.newaxis, :], premiums[:, np.newaxis], deductibles[:, np.newaxis])
+        solver_costs = costs[optimal_level_at(intervals, treatment_costs), np.arange(len(treatment_costs))]
+        np.testing.assert_allclose(solver_costs, costs.min(axis=0))
+
+
+def test_equal_cost_levels_prefer_first():
+    intervals = optimal_deductible_intervals([300, 300], [1000, 1000])
+    assert [(interval.start, interval.level) for interval in intervals] == [(0, 0)]
+
+
+def test_no_levels_have_no_intervals():
+    assert optimal_deductible_intervals([], []) == []
+
+
+def test_crossover_table_matches_single_plan_solver():
+    premiums_df = pd.read_csv(io.BytesIO(fixture_premiums_csv()))
+    table = crossover_table(premiums_df)
+    assert len(table) == len(premiums_df.drop_duplicates(PLAN_GROUP_KEYS))
+
+    for _, row in table.iterrows():
+        plan = premiums_df[(premiums_df[PLAN_GROUP_KEYS] == row[PLAN_GROUP_KEYS]).all(axis=1)]
+        deductibles = plan['Franchisestufe'].map(DEDUCTIBLE_CHILD_LVL_TO_AMOUNT if row['Altersklasse'] == 'AKL-KIN' else DEDUCTIBLE_ADULT_LVL_TO_AMOUNT).to_numpy()
+        intervals = optimal_deductible_intervals(plan['Prämie'].to_numpy(), deductibles)
+
+        assert row['Optimal deductibles'] == " > ".join(str(deductibles[interval.level]) for interval in intervals)
+        lowest = [interval.start for interval in intervals if deductibles[interval.level] == deductibles.min()]
+        if lowest:
+            assert row['Lowest deductible optimal from'] == pytest.approx(lowest[0])
+        else:
+            assert np.isnan(row['Lowest deductible optimal from'])
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loading
+from conftest import fixture_sources
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    # Serve the fixture files instead of downloading them. Every dataset has a fixed ETag,
+    # and a request with a matching If-None-Match header is answered with "304 Not Modified".
+    sources = fixture_sources()
+    urls = {url: name for name, (url, _) in data_loading.SOURCES.items()}
+    state = {"etag_suffix": "v1", "requests": [], "fail": False}
+
+    def fetch(url, etag=None, last_modified=None):
+        if state["fail"]:
+            raise OSError("Name or service not known")
+        name = urls[url]
+        state["requests"].append(name)
+        current_etag = f'"{name}-{state["etag_suffix"]}"'
+        if etag == current_etag:
+            return None, etag, last_modified
+        return sources[name], current_etag, "Wed, 01 Oct 2025 00:00:00 GMT"
+
+    monkeypatch.setattr(data_loading, "_fetch", fetch)
+    return state
+
+
+def test_first_load_downloads_and_writes_snapshot(tmp_path, fake_upstream):
+    datasets = data_loading.load_datasets(data_dir=tmp_path)
+    assert datasets.version == data_loading.current_version(tmp_path)
+    assert sorted(fake_upstream["requests"]) == sorted(data_loading.SOURCES)
+    assert list(datasets.premium_regions.columns[:6]) == ["Kanton", "Region", "Gemeinde", "BFS-Nr.", "PLZ", "Ort"]
+    assert (datasets.insurance_model_restrictions["Eingeschränkt"] == "Y").all()
+    assert len(datasets.premiums) > 0
+
+
+def test_load_uses_snapshot_without_downloading(tmp_path, fake_upstream):
+    version = data_loading.load_datasets(data_dir=tmp_path).version
+    fake_upstream["requests"].clear()
+    assert data_loading.load_datasets(data_dir=tmp_path).version == version
+    assert fake_upstream["requests"] == []
+
+
+def test_refresh_keeps_version_if_upstream_not_modified(tmp_path, fake_upstream):
+    version = data_loading.load_datasets(data_dir=tmp_path).version
+    assert data_loading.load_datasets(refresh=True, data_dir=tmp_path).version == version
+
+    fake_upstream["etag_suffix"] = "v2"
+    assert data_loading.load_datasets(refresh=True, data_dir=tmp_path).version != version
+
+
+def test_failed_refresh_falls_back_to_last_good_snapshot(tmp_path, fake_upstream):
+    version = data_loading.load_datasets(data_dir=tmp_path).version
+    fake_upstream["fail"] = True
+    assert data_loading.load_datasets(refresh=True, data_dir=tmp_path).version == version
+
+
+def test_failed_download_without_snapshot_raises(tmp_path, fake_upstream):
+    fake_upstream["fail"] = True
+    with pytest.raises(data_loading.DataUnavailableError):
+        data_loading.load_datasets(data_dir=tmp_path)
+
+
+def test_premiums_are_loaded_with_compact_schema(tmp_path, fake_upstream):
+    premiums_df = data_loading.load_datasets(data_dir=tmp_path).premiums
+    assert isinstance(premiums_df['Franchisestufe'].dtype, pd.CategoricalDtype)
+    assert premiums_df['Prämie'].dtype == np.float32
+    assert (premiums_df['Kanton'] == "ZH").all()
+
+    report = data_loading.memory_report(premiums_df.astype({'Franchisestufe': object, 'Prämie': float}), data_loading.PREMIUMS_SCHEMA)
+    assert report.loc['Prämie', 'before'] == 2 * report.loc['Prämie', 'after']
+    assert report.loc['total', 'after'] < report.loc['total', 'before']
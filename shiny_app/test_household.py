@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from cost_model import calculate_annual_cost_health_insurance, deductible_amount_for_person
+from household import HouseholdMember, HouseholdOptimizer, age_class_for_birth_year
+from offers import OfferFinder
+from precompute import AGE_CLASS_DEDUCTIBLES
+
+HOUSEHOLD = [
+    HouseholdMember('AKL-ERW', 'OHN-UNF', 500),
+    HouseholdMember('AKL-ERW', 'OHN-UNF', 5000),
+    HouseholdMember('AKL-JUG', 'MIT-UNF', 1000),
+    HouseholdMember('AKL-KIN', 'MIT-UNF', 200),
+]
+
+
+@pytest.fixture(scope="module")
+def offer_finder(fixture_datasets):
+    datasets, _ = fixture_datasets
+    return OfferFinder(datasets.premiums, datasets.insurance_model_restrictions)
+
+
+def cheapest_offers_per_insurer(offer_finder, bfs_nr, region, member):
+    # Reference: every deductible level looked up and calculated on its own
+    cheapest = {}
+    for deductible_level in AGE_CLASS_DEDUCTIBLES[member.age_class]:
+        offers = offer_finder.offers(bfs_nr, "ZH", region, member.age_class, deductible_level, member.accident_insurance)
+        for insurer, premium in zip(offers['Versicherer'], offers['Prämie']):
+            costs = calculate_annual_cost_health_insurance(member.expected_treatment_costs, float(premium),
+                                                           deductible_amount_for_person(deductible_level, member.age_class))
+            cheapest[insurer] = min(cheapest.get(insurer, np.inf), costs)
+    return cheapest
+
+
+@pytest.mark.parametrize("bfs_nr, region", [(261, 1), (293, 2)])
+def test_configurations_match_reference(offer_finder, bfs_nr, region):
+    optimizer = HouseholdOptimizer(offer_finder)
+    configurations = optimizer.cheapest_configurations(bfs_nr, "ZH", region, HOUSEHOLD, top_n=10)
+
+    reference = [cheapest_offers_per_insurer(offer_finder, bfs_nr, region, member) for member in HOUSEHOLD]
+    free_choice = configurations[configurations['Configuration'] == 0]
+    assert free_choice['Annual costs'].to_numpy() == pytest.approx([min(costs.values()) for costs in reference], rel=1e-6)
+
+    household_costs = sorted(sum(costs[insurer] for costs in reference) for insurer in reference[0])
+    single_insurer = configurations[configurations['Configuration'] > 0].drop_duplicates('Configuration')
+    assert single_insurer['Household costs'].to_numpy() == pytest.approx(household_costs, rel=1e-6)
+
+    # Every member gets an offer of their age class, and each single insurer configuration only offers of one insurer
+    offers = offer_finder.premiums_df.take(configurations['offset'].to_numpy())
+    assert offers['Altersklasse'].tolist() == [member.age_class for member in HOUSEHOLD] * (1 + len(household_costs))
+    single = (configurations['Configuration'] > 0).to_numpy()
+    assert (offers[single].groupby(configurations['Configuration'].to_numpy()[single])['Versicherer'].nunique() == 1).all()
+
+
+def test_restricted_plans_are_excluded(offer_finder):
+    optimizer = HouseholdOptimizer(offer_finder)
+    member_numbers, offsets, _ = optimizer.member_offers(293, "ZH", 2, HOUSEHOLD)
+    offers = offer_finder.premiums_df.take(offsets)
+    # SWICA (1384) does not offer its HMO in Wädenswil (293)
+    assert not ((offers['Versicherer'] == 1384) & (offers['Tarif'] == 'HMO1')).any()
+    # Both adults have the same profile, so they get the same offers
+    assert offsets[member_numbers == 0].tolist() == offsets[member_numbers == 1].tolist()
+
+
+def test_profile_offsets_are_the_offers_of_all_deductible_levels(offer_finder):
+    offsets = offer_finder.profile_offsets(293, "ZH", 2, 'AKL-KIN', 'MIT-UNF')
+    expected = np.concatenate([offer_finder.offer_offsets(293, "ZH", 2, 'AKL-KIN', deductible_level, 'MIT-UNF')
+                               for deductible_level in AGE_CLASS_DEDUCTIBLES['AKL-KIN']])
+    assert sorted(offsets.tolist()) == sorted(expected.tolist())
+
+
+def test_no_configuration_without_offers(offer_finder):
+    optimizer = HouseholdOptimizer(offer_finder)
+    assert optimizer.cheapest_configurations(5586, "VD", 1, HOUSEHOLD).empty
+    assert optimizer.cheapest_configurations(261, "ZH", 1, []).empty
+
+
+def test_age_class_for_birth_year():
+    assert [age_class_for_birth_year(year) for year in [2000, 2001, 2007, 2008, 2020]] == ['AKL-ERW', 'AKL-JUG', 'AKL-JUG', 'AKL-KIN', 'AKL-KIN']
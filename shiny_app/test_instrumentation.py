@@ -0,0 +1,80 @@
+import pstats
+import time
+
+from shiny.session import session_context
+
+import instrumentation
+from background_loading import BackgroundLoader
+from instrumentation import Histogram, StageMetrics, prometheus_text, stage_timer, start_session_profile, timed
+from result_cache import LRUCache
+
+
+class FakeSession:
+    # The parts of a shiny session the profiling uses
+    ns = None
+
+    def __init__(self, id):
+        self.id = id
+        self.on_ended_callbacks = []
+
+    def on_ended(self, callback):
+        self.on_ended_callbacks.append(callback)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.01, 0.1))
+    for seconds in [0.005, 0.05, 0.05, 2.0]:
+        histogram.observe(seconds)
+    cumulative, total, count = histogram.snapshot()
+    assert cumulative == [(0.01, 1), (0.1, 3), (float("inf"), 4)]
+    assert count == 4 and abs(total - 2.105) < 1e-9
+
+
+def test_timed_records_every_call(monkeypatch):
+    monkeypatch.setattr(instrumentation, "stage_metrics", StageMetrics())
+
+    @timed("test_stage")
+    def stage(value):
+        return value * 2
+
+    assert [stage(1), stage(2)] == [2, 4]
+    assert stage.__name__ == "stage"
+    _, _, count = instrumentation.stage_metrics.snapshots()["test_stage"]
+    assert count == 2
+
+
+def test_prometheus_text():
+    cache = LRUCache(max_bytes=1024)
+    cache.get_or_compute("key", lambda: "value")
+    cache.get_or_compute("key", lambda: "value")
+    loader = BackgroundLoader(lambda: None)
+    loader.load_now()
+    with stage_timer("test_prometheus"):
+        pass
+
+    lines = prometheus_text(caches={"offers": cache}, loader=loader).splitlines()
+    assert 'health_insurance_stage_duration_seconds_bucket{stage="test_prometheus",le="+Inf"} 1' in lines
+    assert 'health_insurance_stage_duration_seconds_count{stage="test_prometheus"} 1' in lines
+    assert 'health_insurance_cache_hits_total{cache="offers"} 1' in lines
+    assert 'health_insurance_cache_hit_ratio{cache="offers"} 0.5' in lines
+    assert "health_insurance_data_ready 1" in lines
+    # Every sample line has a metric name and a value
+    assert all(line.startswith("#") or len(line.rsplit(" ", 1)) == 2 for line in lines)
+
+
+def test_session_profile_is_written_when_the_session_ends(monkeypatch, tmp_path):
+    monkeypatch.setattr(instrumentation, "PROFILE_DIR", str(tmp_path))
+    session = FakeSession("abc")
+    start_session_profile(session)
+
+    @timed("profiled_stage")
+    def profiled_stage():
+        time.sleep(0.01)
+
+    with session_context(session):
+        profiled_stage()
+    for callback in session.on_ended_callbacks:
+        callback()
+
+    stats = pstats.Stats(str(tmp_path / "session-abc.prof"))
+    assert any(function_name == "profiled_stage" for (_, _, function_name) in stats.stats)
@@ -1,6 +1,8 @@
-from app import calculate_annual_cost_health_insurance, calculate_annual_cost_insurance
+import numpy as np
 import pytest
 
+from cost_model import annual_costs_health_insurance, calculate_annual_cost_health_insurance, calculate_annual_cost_insurance, cost_tensor
+
 def test_health_insurance_cost_calculation():
     assert calculate_annual_cost_health_insurance(treatment_costs_during_year=0, premium_per_month=10, deductible_amount=300) == 12 * 10, (
             "No treatment costs should result in just the premium cost."
@@ -30,4 +32,23 @@ def test_insurance_cost_calculation():
             )
     assert calculate_annual_cost_insurance(treatment_costs_during_year=2000, premium_per_month=10.0, deductible_amount=500, percentage_covered=50, max_amount_insurance_pays=749) == pytest.approx(12 * 10.0 + 500 + 751), (
             "Treatment costs (with deductible) that are way too high will only be reduced by max_amount_insurance_pays"
-            )
\ No newline at end of file
+            )
+
+def test_vectorized_health_insurance_cost_matches_scalar():
+    treatment_costs = np.array([0, 150, 300, 1000, 2499.5, 2500, 7000, 7300, 20000])
+    premiums = np.array([310.5, 250.0, 190.25])
+    deductibles = np.array([300, 1500, 2500])
+    annual_costs = annual_costs_health_insurance(treatment_costs[np.newaxis, :], premiums[:, np.newaxis], deductibles[:, np.newaxis])
+    assert annual_costs.shape == (3, len(treatment_costs))
+    for i, (premium, deductible) in enumerate(zip(premiums, deductibles)):
+        for j, treatment_cost in enumerate(treatment_costs):
+            assert annual_costs[i, j] == pytest.approx(calculate_annual_cost_health_insurance(treatment_cost, premium, deductible))
+
+
+def test_cost_tensor_shape_and_values():
+    treatment_costs = np.linspace(0, 10000, 11)
+    premiums = np.array([[400.0, 350.0], [380.0, 330.0], [420.0, 345.0]])
+    tensor = cost_tensor(treatment_costs, premiums, [300, 2500])
+    assert tensor.shape == (3, 2, 11)
+    assert tensor[1, 1, 3] == pytest.approx(calculate_annual_cost_health_insurance(3000, 330.0, 2500))
+    assert tensor[2, 0, 0] == pytest.approx(12 * 420.0)
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from data_loading import snapshot_path
+from municipality_search import MUNICIPALITY_CHOICES_FILE, MunicipalitySearchIndex, build_municipality_choices, load_municipality_choices
+
+PREMIUM_REGIONS = pd.DataFrame({
+    "Kanton": ["ZH", "ZH", "ZH", "SG", "SG"],
+    "Region": [1, 2, 2, 1, 1],
+    "Gemeinde": ["Zürich", "Wädenswil", "Richterswil", "St. Gallen", "Wittenbach"],
+    "BFS-Nr.": [261, 293, 138, 3203, 3204],
+    "PLZ": [8001, 8820, 8805, 9000, 9000],
+    "Ort": ["Zürich", "Wädenswil", "Richterswil", "St. Gallen", "St. Gallen"],
+})
+
+
+def test_choices_match_values_and_labels():
+    choices_df = build_municipality_choices(PREMIUM_REGIONS)
+    assert choices_df['value'].tolist()[:2] == ["261|ZH|1|8001|Zürich|Zürich", "293|ZH|2|8820|Wädenswil|Wädenswil"]
+    # The municipality is only shown if several municipalities have the same postal code
+    assert choices_df['label'].tolist() == ["8001 Zürich", "8820 Wädenswil", "8805 Richterswil",
+                                            "9000 St. Gallen (Gemeinde St. Gallen)", "9000 St. Gallen (Gemeinde Wittenbach)"]
+
+
+def test_search_by_postal_code_place_and_municipality():
+    index = MunicipalitySearchIndex(build_municipality_choices(PREMIUM_REGIONS))
+    labels = lambda query: [index.labels[i] for i in index.search(query)]  # noqa: E731
+    assert labels("88") == ["8820 Wädenswil", "8805 Richterswil"]
+    assert labels("zurich") == ["8001 Zürich"]
+    assert labels("st. gal") == ["9000 St. Gallen (Gemeinde St. Gallen)", "9000 St. Gallen (Gemeinde Wittenbach)"]
+    assert labels("wittenbach 9000") == ["9000 St. Gallen (Gemeinde Wittenbach)"]
+    # Longer parts are also found inside a word
+    assert labels("swil") == ["8820 Wädenswil", "8805 Richterswil"]
+    assert labels("ric wil") == ["8805 Richterswil"]
+    assert labels("bern") == []
+    assert len(index.search("", limit=3)) == 3
+
+
+def test_selected_choice_is_always_included():
+    index = MunicipalitySearchIndex(build_municipality_choices(PREMIUM_REGIONS))
+    options = index.selectize_options("zürich", selected="138|ZH|2|8805|Richterswil|Richterswil")
+    assert [option["label"] for option in options] == ["8001 Zürich", "8805 Richterswil"]
+
+
+def test_choices_are_stored_with_the_snapshot(fixture_datasets):
+    datasets, data_dir = fixture_datasets
+    choices_df = load_municipality_choices(datasets.version, datasets.premium_regions, data_dir)
+    assert (snapshot_path(datasets.version, data_dir) / MUNICIPALITY_CHOICES_FILE).exists()
+    # Read from the snapshot the second time
+    assert load_municipality_choices(datasets.version, None, data_dir).equals(choices_df)
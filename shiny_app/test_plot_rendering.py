@@ -0,0 +1,16 @@
+import matplotlib.pyplot as plt
+import numpy as np
+
+from plot_rendering import deductibles_comparison_figure, render_png
+
+
+def test_renders_png_without_pyplot_figures():
+    figures_before = plt.get_fignums()
+    fig = deductibles_comparison_figure("Annual Total Costs for You", np.array([400.0, 330.0]), np.array([300, 2500]), [2300.0],
+                                        width_px=400, height_px=250, pixelratio=2)
+    png = render_png(fig)
+    assert png.startswith(b"\x89PNG")
+    # Width and height of the PNG header, scaled by the pixel ratio
+    assert int.from_bytes(png[16:20], "big") == 800
+    assert int.from_bytes(png[20:24], "big") == 500
+    assert plt.get_fignums() == figures_before
@@ -0,0 +1,51 @@
+import pytest
+
+from conftest import write_fixture_snapshot
+from data_loading import read_snapshot
+from offers import OfferFinder
+from precompute import TREATMENT_COST_SCENARIOS, load_precomputed, optimal_deductibles_for_profile, precompute, precompute_canton
+
+
+def test_precompute_canton_matches_offer_finder(fixture_datasets):
+    datasets, _ = fixture_datasets
+    optimal_deductibles_df = precompute_canton(datasets.premiums, datasets.premium_regions, datasets.insurance_model_restrictions, "ZH")
+    offer_finder = OfferFinder(datasets.premiums, datasets.insurance_model_restrictions)
+
+    for bfs_nr, region in [(261, 1), (293, 2), (138, 2)]:
+        profile = optimal_deductibles_df[(optimal_deductibles_df['BFS-Nr.'] == bfs_nr) & (optimal_deductibles_df['Altersklasse'] == 'AKL-ERW') &
+                                         (optimal_deductibles_df['Unfalleinschluss'] == 'OHN-UNF')]
+        expected = optimal_deductibles_for_profile(offer_finder, bfs_nr, "ZH", region, 'AKL-ERW', 'OHN-UNF')
+        assert profile['Franchisestufe'].tolist() == expected['Franchisestufe'].tolist()
+        assert profile['offset'].tolist() == expected['offset'].tolist()
+
+    # SWICA (1384) does not offer its HMO in Wädenswil (293)
+    wadenswil = optimal_deductibles_df[optimal_deductibles_df['BFS-Nr.'] == 293]
+    offers = datasets.premiums.take(wadenswil['offset'].to_numpy())
+    assert not ((offers['Versicherer'] == 1384) & (offers['Tarif'] == 'HMO1')).any()
+
+
+def test_optimal_deductible_is_cheapest_over_all_levels(fixture_datasets):
+    datasets, _ = fixture_datasets
+    offer_finder = OfferFinder(datasets.premiums, datasets.insurance_model_restrictions)
+    optimal = optimal_deductibles_for_profile(offer_finder, 261, "ZH", 1, 'AKL-ERW', 'MIT-UNF', scenarios=[0, 10000])
+    # Without treatment costs the highest deductible is the cheapest, with high costs the lowest one.
+    assert optimal['Franchisestufe'].tolist() == ['FRAST6', 'FRAST1']
+    cheapest = offer_finder.offers(261, "ZH", 1, 'AKL-ERW', 'FRAST6', 'MIT-UNF').iloc[0]
+    assert optimal['Annual costs'].iloc[0] == pytest.approx(12 * cheapest['Prämie'])
+
+
+def test_precompute_writes_tables_for_lookup(tmp_path):
+    # A snapshot of its own, the precomputed tables would change what the other tests of the shared snapshot run
+    write_fixture_snapshot(tmp_path)
+    datasets, data_dir = read_snapshot(data_dir=tmp_path), tmp_path
+    assert load_precomputed(datasets.version, data_dir) is None
+
+    optimal_deductibles_df = precompute(data_dir=data_dir, max_workers=2)
+    # 3 municipalities x 3 age classes x 2 accident options, one row per treatment cost scenario
+    assert len(optimal_deductibles_df) == 3 * 3 * 2 * len(TREATMENT_COST_SCENARIOS)
+
+    results = load_precomputed(datasets.version, data_dir)
+    optimal = results.optimal_deductibles("261", 'AKL-ERW', 'OHN-UNF')
+    assert optimal['Treatment costs'].is_monotonic_increasing
+    assert len(optimal) == len(optimal_deductibles_df[(optimal_deductibles_df['BFS-Nr.'] == 261) & (optimal_deductibles_df['Altersklasse'] == 'AKL-ERW') &
+                                                      (optimal_deductibles_df['Unfalleinschluss'] == 'OHN-UNF')])
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from premium_history import PLAN_KEYS, STORE_COLUMNS, ingest_premiums, load_premium_history
+
+SANITAS_HMO = (1509, 'ZH', 'PR-REG CH1', 'AKL-ERW', 'FRAST6', 'OHN-UNF', 'HMO1')
+
+
+@pytest.fixture(scope="module")
+def premiums(fixture_datasets):
+    datasets, _ = fixture_datasets
+    return datasets.premiums
+
+
+def _plan(premiums_df, plan_key):
+    return np.logical_and.reduce([(premiums_df[key] == value).to_numpy() for key, value in zip(PLAN_KEYS, plan_key)])
+
+
+def _year(premiums_df, year, premium_factor=1.0):
+    premiums_df = premiums_df.copy()
+    premiums_df['Geschäftsjahr'] = np.int16(year)
+    premiums_df['Prämie'] = (premiums_df['Prämie'] * premium_factor).astype(np.float32)
+    return premiums_df
+
+
+def test_only_changes_are_stored(premiums, tmp_path):
+    assert ingest_premiums(_year(premiums, 2026), tmp_path) == len(premiums)
+    premiums_2027 = _year(premiums, 2027)
+    premiums_2027.loc[_plan(premiums_2027, SANITAS_HMO), 'Prämie'] = np.float32(130.0)
+    assert ingest_premiums(premiums_2027, tmp_path) == 1
+    # The same year again is not stored twice, different premiums for it or an earlier year are rejected
+    assert ingest_premiums(premiums_2027, tmp_path) == 0
+    with pytest.raises(ValueError):
+        ingest_premiums(_year(premiums, 2027, premium_factor=1.1), tmp_path)
+    with pytest.raises(ValueError):
+        ingest_premiums(_year(premiums, 2025), tmp_path)
+    assert len(load_premium_history(tmp_path).df) == len(premiums) + 1
+
+
+def test_premiums_of_every_year(premiums, tmp_path):
+    premiums_2025 = _year(premiums, 2025, premium_factor=0.9)
+    premiums_2026 = _year(premiums, 2026)
+    # The Sanitas HMO is not offered in 2027, and all other premiums rise
+    premiums_2027 = _year(premiums, 2027, premium_factor=1.05)[~_plan(premiums, SANITAS_HMO)]
+    for premiums_df in [premiums_2025, premiums_2026, premiums_2027]:
+        ingest_premiums(premiums_df, tmp_path)
+    history = load_premium_history(tmp_path)
+    assert history.years == [2025, 2026, 2027]
+
+    for year, premiums_df in [(2025, premiums_2025), (2026, premiums_2026), (2027, premiums_2027)]:
+        expected = premiums_df[STORE_COLUMNS].astype(str).sort_values(PLAN_KEYS, ignore_index=True)
+        stored = history.plans_in(year)[STORE_COLUMNS].astype(str).sort_values(PLAN_KEYS, ignore_index=True)
+        pd.testing.assert_frame_equal(stored, expected)
+
+    trend = history.premium_trend(SANITAS_HMO)
+    assert trend['Geschäftsjahr'].tolist() == [2025, 2026]
+    assert trend['Prämie'].to_numpy() == pytest.approx([122.25 * 0.9, 122.25], abs=0.01)
+    assert trend['Change'].iloc[1] == pytest.approx(122.25 * 0.1, abs=0.01)
+    assert history.premium_trend((1, 'ZH', 'PR-REG CH1', 'AKL-ERW', 'FRAST6', 'OHN-UNF', 'BASE')).empty
+
+    cheapest = history.cheapest_per_year('ZH', 1, 'AKL-ERW', 'FRAST6', 'OHN-UNF', top_n=2)
+    assert cheapest['Geschäftsjahr'].tolist() == [2025, 2025, 2026, 2026, 2027, 2027]
+    assert cheapest['Rang'].tolist() == [1, 2] * 3
+    assert list(zip(cheapest['Versicherer'], cheapest['Tarif'])) == [(1509, 'HMO1'), (8, 'HMO1')] * 2 + [(8, 'HMO1'), (1509, 'BASE')]
+
+
+def test_missing_names_stay_missing(premiums, tmp_path):
+    premiums_2026 = _year(premiums, 2026)
+    premiums_2026.loc[_plan(premiums_2026, SANITAS_HMO), 'Tarifbezeichnung'] = np.nan
+    ingest_premiums(premiums_2026, tmp_path)
+    # Still without name in 2027 is no change, the name in 2028 is one
+    assert ingest_premiums(_year(premiums_2026, 2027), tmp_path) == 0
+    assert ingest_premiums(_year(premiums, 2028), tmp_path) == 1
+
+    history = load_premium_history(tmp_path)
+    names = history.plans_in(2026)['Tarifbezeichnung']
+    assert names.isna().sum() == 1
+    assert "nan" not in names.cat.categories
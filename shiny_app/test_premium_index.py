@@ -0,0 +1,23 @@
+import io
+
+import pandas as pd
+
+from conftest import fixture_premiums_csv
+from premium_index import OFFER_KEYS, PremiumIndex, filter_with_masks
+
+
+def test_lookup_matches_mask_filtering():
+    premiums_df = pd.read_csv(io.BytesIO(fixture_premiums_csv()))
+    index = PremiumIndex(premiums_df, OFFER_KEYS, sort_by='Prämie')
+    for key in premiums_df[OFFER_KEYS].drop_duplicates().itertuples(index=False):
+        expected = filter_with_masks(premiums_df, OFFER_KEYS, key, sort_by='Prämie')
+        pd.testing.assert_frame_equal(index.lookup(key), expected)
+
+
+def test_lookup_of_unknown_key_is_empty():
+    premiums_df = pd.read_csv(io.BytesIO(fixture_premiums_csv()))
+    index = PremiumIndex(premiums_df, OFFER_KEYS)
+    result = index.lookup(("GE", "PR-REG CH1", "AKL-ERW", "FRAST1", "MIT-UNF"))
+    assert result.empty
+    assert list(result.columns) == list(premiums_df.columns)
+    assert len(index.offsets(("GE", "PR-REG CH1", "AKL-ERW", "FRAST1", "MIT-UNF"))) == 0
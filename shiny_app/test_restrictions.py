@@ -0,0 +1,43 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from conftest import fixture_insurance_model_restrictions_csv, fixture_premiums_csv
+from data_loading import SOURCES
+from restrictions import MunicipalityRestrictions
+
+
+def fixture_restrictions():
+    _, reader = SOURCES["insurance_model_restrictions"]
+    return MunicipalityRestrictions(reader(fixture_insurance_model_restrictions_csv()))
+
+
+def test_available_plans_of_municipality():
+    restrictions = fixture_restrictions()
+    assert restrictions.available_plans(261) == {("ZH", "PR-REG CH1", insurer, "HMO1", "TAR-HMO") for insurer in (8, 1509, 1384)}
+    # SWICA (1384) does not offer its HMO in Wädenswil (293)
+    assert restrictions.available_plans(293) == {("ZH", "PR-REG CH2", insurer, "HMO1", "TAR-HMO") for insurer in (8, 1509)}
+    assert restrictions.available_plans(9999) == frozenset()
+
+
+def test_is_available_keeps_unrestricted_plans():
+    restrictions = fixture_restrictions()
+    premiums_df = pd.read_csv(io.BytesIO(fixture_premiums_csv()))
+    plan_ids = restrictions.plan_ids(premiums_df)
+    assert (plan_ids[premiums_df["Tarif"].to_numpy() == "BASE"] == -1).all()
+    assert (plan_ids[premiums_df["Tarif"].to_numpy() == "HMO1"] >= 0).all()
+
+    region_2 = premiums_df["Region"].to_numpy() == "PR-REG CH2"
+    available = restrictions.is_available(plan_ids[region_2], "293")
+    unavailable = premiums_df[region_2][~available]
+    assert set(unavailable["Versicherer"]) == {1384}
+    assert set(unavailable["Tarif"]) == {"HMO1"}
+    assert restrictions.is_available(plan_ids[region_2], 138).all()
+
+
+def test_no_restrictions():
+    restrictions = MunicipalityRestrictions(pd.DataFrame(columns=["Kanton", "Region", "Versicherer", "Tarif", "Tariftyp", "Gemeinden-BFS"]))
+    premiums_df = pd.read_csv(io.BytesIO(fixture_premiums_csv()))
+    assert restrictions.is_available(restrictions.plan_ids(premiums_df), 261).all()
+    assert np.array_equal(restrictions.allowed_plan_ids(261), [])
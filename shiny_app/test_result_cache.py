@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from result_cache import LRUCache, estimate_size
+from simulation import OutOfPocketStatistics
+
+
+def test_hits_and_misses():
+    cache = LRUCache(max_bytes=10_000)
+    calls = []
+    compute = lambda: calls.append(1) or "offers"  # noqa: E731
+    assert cache.get_or_compute(("261", "AKL-ERW"), compute) == "offers"
+    assert cache.get_or_compute(("261", "AKL-ERW"), compute) == "offers"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_within_memory_budget():
+    df = pd.DataFrame({"Prämie": range(100)})
+    cache = LRUCache(max_bytes=2 * estimate_size(df))
+    cache.get_or_compute("a", lambda: df.copy())
+    cache.get_or_compute("b", lambda: df.copy())
+    cache.get_or_compute("a", lambda: df.copy())  # "a" is now the most recently used entry
+    cache.get_or_compute("c", lambda: df.copy())
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.stats()["evictions"] == 1
+    cache.get_or_compute("a", lambda: df.copy())
+    assert cache.stats()["hits"] == 2
+
+
+def test_size_of_arrays_in_containers():
+    values = np.zeros((3, 10_000))
+    statistics = OutOfPocketStatistics(values[0], 1000, values[1], values[2], {50: np.zeros(10_000), 99: np.zeros(10_000)})
+    # The arrays in the NamedTuple and in the dict are counted, also views of other arrays
+    assert estimate_size(statistics) >= 5 * values[0].nbytes
+
+
+def test_values_larger_than_budget_are_not_cached():
+    cache = LRUCache(max_bytes=10)
+    cache.get_or_compute("big", lambda: "x" * 1000)
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_concurrent_access():
+    cache = LRUCache(max_bytes=1_000_000)
+
+    def worker():
+        for i in range(500):
+            cache.get_or_compute(i % 50, lambda: [i] * 10)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8 * 500
+    assert stats["entries"] == 50
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from data_loading import SOURCES
+from offers import OfferFinder
+from shared_datasets import attach_columnar, current_export, export_columnar, load_shared_datasets
+
+
+def test_attached_tables_equal_snapshot_and_are_read_only(fixture_datasets):
+    datasets, data_dir = fixture_datasets
+    shared = load_shared_datasets(data_dir=data_dir)
+    assert shared.version == datasets.version
+    for name in SOURCES:
+        pd.testing.assert_frame_equal(getattr(shared, name), getattr(datasets, name), check_dtype=False, check_categorical=False)
+
+    # The columns point to the mapped files instead of copies
+    assert not shared.premiums['Prämie'].to_numpy().flags.writeable
+    assert not shared.premiums['Kanton'].array.codes.flags.writeable
+    assert shared.premiums['Prämie'].dtype == np.float32
+
+    # Attaching again uses the existing export
+    pd.testing.assert_frame_equal(attach_columnar(datasets.version, data_dir).premiums, shared.premiums)
+
+
+def test_offers_from_attached_tables(fixture_datasets):
+    datasets, data_dir = fixture_datasets
+    shared = load_shared_datasets(data_dir=data_dir)
+    profile = (293, "ZH", "2", 'AKL-ERW', 'FRAST1', 'MIT-UNF')
+    expected = OfferFinder(datasets.premiums, datasets.insurance_model_restrictions).offer_offsets(*profile)
+    assert OfferFinder(shared.premiums, shared.insurance_model_restrictions).offer_offsets(*profile).tolist() == expected.tolist()
+
+
+def test_export_replaces_previous_and_keeps_category_types(fixture_datasets, tmp_path):
+    datasets, _ = fixture_datasets
+    # Categories that JSON has no type for: numpy integers in an object column and timestamps
+    regions = datasets.premium_regions.assign(Code=np.array([np.int64(i % 2) for i in range(len(datasets.premium_regions))], dtype=object),
+                                              Gültig=pd.Timestamp("2026-01-01"))
+    datasets = datasets._replace(premium_regions=regions)
+    first = export_columnar(datasets, tmp_path)
+    second = export_columnar(datasets, tmp_path)
+    assert current_export(datasets.version, tmp_path) == second
+    assert not first.exists()
+
+    attached = attach_columnar(datasets.version, tmp_path).premium_regions
+    assert attached['Code'].cat.categories.tolist() == [0, 1]
+    assert attached['Gültig'].tolist() == [pd.Timestamp("2026-01-01")] * len(regions)
@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from cost_model import annual_costs_health_insurance, calculate_annual_cost_health_insurance
+from simulation import (
+    PERCENTILE_RESOLUTION,
+    EmpiricalHistogram,
+    ZeroInflatedLognormal,
+    chunk_seeds,
+    simulate_annual_costs,
+    simulate_out_of_pocket,
+)
+
+DISTRIBUTION = ZeroInflatedLognormal(zero_share=0.2, median=900, sigma=1.1)
+
+
+def test_statistics_match_all_samples_at_once():
+    deductible_amounts = np.array([300, 1000, 2500], dtype=float)
+    statistics = simulate_out_of_pocket(DISTRIBUTION, deductible_amounts, n_samples=50_000, chunk_size=4096, seed=3)
+
+    treatment_costs = np.concatenate([DISTRIBUTION.sample(np.random.default_rng(seed), size) for size, seed in chunk_seeds(50_000, 4096, seed=3)])
+    costs = annual_costs_health_insurance(treatment_costs[np.newaxis, :], 0.0, deductible_amounts[:, np.newaxis])
+    assert statistics.n_samples == 50_000
+    assert statistics.mean == pytest.approx(costs.mean(axis=1))
+    assert statistics.variance == pytest.approx(costs.var(axis=1, ddof=1))
+    for percentile, values in statistics.percentiles.items():
+        expected = np.percentile(costs, percentile, axis=1, method='inverted_cdf')
+        assert np.abs(values - expected).max() <= PERCENTILE_RESOLUTION / 2 + 1e-9
+
+
+def test_results_do_not_depend_on_the_executor():
+    threads = simulate_out_of_pocket(DISTRIBUTION, [0, 600], n_samples=20_000, chunk_size=3000, max_workers=3)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        processes = simulate_out_of_pocket(DISTRIBUTION, [0, 600], n_samples=20_000, chunk_size=3000, executor=executor)
+    assert np.array_equal(threads.mean, processes.mean)
+    assert all(np.array_equal(threads.percentiles[p], processes.percentiles[p]) for p in threads.percentiles)
+
+
+def test_annual_costs_of_plans():
+    premiums, deductible_amounts = np.array([300.0, 280.5, 250.0]), np.array([300, 500, 2500])
+    # Without treatment costs, the annual costs are always the premiums
+    no_costs = simulate_annual_costs(ZeroInflatedLognormal(1.0, 1000, 1.0), premiums, deductible_amounts, n_samples=1000)
+    assert no_costs['Expected costs'].to_numpy() == pytest.approx(12 * premiums)
+    assert no_costs['Variance'].to_numpy() == pytest.approx(0)
+    # With high treatment costs, the deductible and the maximum share of the costs are always paid
+    high_costs = simulate_annual_costs(ZeroInflatedLognormal(0.0, 1e6, 0.1), premiums, deductible_amounts, n_samples=1000)
+    expected = [calculate_annual_cost_health_insurance(1e6, premium, amount) for premium, amount in zip(premiums, deductible_amounts)]
+    assert high_costs['P99'].to_numpy() == pytest.approx(expected)
+
+    statistics = simulate_out_of_pocket(DISTRIBUTION, [300, 500], n_samples=1000)
+    with pytest.raises(ValueError):
+        statistics.annual_costs(premiums, deductible_amounts)
+
+
+def test_empirical_histogram():
+    costs = np.concatenate([np.zeros(300), np.full(600, 1000.0), np.full(100, 10000.0)])
+    histogram = EmpiricalHistogram.from_costs(costs, bins=[0, 1, 2000, 20000])
+    samples = histogram.sample(np.random.default_rng(0), 100_000)
+    assert samples.min() >= 0 and samples.max() <= 20000
+    assert np.mean(samples < 1) == pytest.approx(0.3, abs=0.01)
+    assert np.mean(samples >= 2000) == pytest.approx(0.1, abs=0.01)